@@ -0,0 +1,336 @@
+"""
+Headless batch analysis of whole videos, for unattended runs without a display.
+
+Writes the same CSV/PNG outputs as the GUI, one log directory per video:
+
+    python -m CrystalAnalysisSystem.batch videos/ --mode yolo --start 0 --end 500
+    python -m CrystalAnalysisSystem.batch run1.avi run2.avi --mode opencv-crop --roi 100 80 260 220
+"""
+
+import argparse
+import os
+import sys
+
+import matplotlib
+
+matplotlib.use('Agg')  # growth rate plots are only saved, never shown
+
+import cv2
+
+from CrystalAnalysisSystem.detection_pipeline import DetectionPipeline
+from CrystalAnalysisSystem.detection_store import DetectionStore
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+from CrystalAnalysisSystem.frame_store import FrameStore
+from CrystalAnalysisSystem.growth_rate_calculator import GrowthRateCalculator
+from CrystalAnalysisSystem.parallel import ParallelFrameProcessor
+from CrystalAnalysisSystem.shape_analyser import ShapeAnalyser
+from CrystalAnalysisSystem.tracker import KeyframeTracker
+from CrystalAnalysisSystem.utils import (frame_pipeline, draw_lines, draw_contours, detection_records,
+                                         shape_record, hash_file)
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'best.pt')
+
+
+class FrameRange:
+    """
+    List-like view of frames [start, end] of a frame source, so whole-video helpers can run on a range.
+    """
+    def __init__(self, frames, start, end):
+        self.frames = frames
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start + 1
+
+    def __getitem__(self, index):
+        return self.frames[self.start + index]
+
+    @property
+    def indices(self):
+        return range(self.start, self.end + 1)
+
+
+class BatchAnalyser:
+    """
+    Runs one analysis mode over the frame range of each video with no user interaction. PS 2024
+    """
+    def __init__(self, mode, start=0, end=None, roi=None, model_path=DEFAULT_MODEL_PATH, log_dir="log",
+                 cache_dir="cache", workers=1, use_frame_store=False, store_dir="store", batch_size=8,
+                 backend='torch', int8=False, keyframe_interval=1, motion_threshold=10.0, imgsz=None, conf=0.25,
+                 instances=1, threads=None):
+        self.mode = mode
+        self.start = start
+        self.end = end
+        self.roi = roi
+        self.model_path = model_path
+        self.log_dir = log_dir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.use_frame_store = use_frame_store
+        self.store_dir = store_dir
+        self.batch_size = batch_size
+        self.backend = backend
+        self.int8 = int8
+        self.keyframe_interval = keyframe_interval
+        self.motion_threshold = motion_threshold
+        self.imgsz = imgsz
+        self.conf = conf
+        self.instances = instances  # Model instances in worker processes for yolo mode, 1 runs in this process
+        self.threads = threads  # Intra-op threads per model instance, None for the default
+        self.detector = None
+        self.detector_pool = None
+        self.detection_store = None  # Opened in cache_dir on the first yolo run
+        self.parallel_processor = None
+
+    def open_frames(self, video_path):
+        """
+        Open a video as a frame source, through the frame store if enabled.
+        """
+        if self.use_frame_store:
+            store = FrameStore(video_path, self.store_dir)
+            if not store.is_built():
+                store.build()
+            return store.open()
+        return VideoFrameSource(video_path)
+
+    def analyse_video(self, video_path):
+        """
+        Analyse one video, writing outputs to a log and cache directory named after it.
+        """
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        log_dir = os.path.join(self.log_dir, name)
+        cache_dir = os.path.join(self.cache_dir, name)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        frames = self.open_frames(video_path)
+        try:
+            end = len(frames) - 1 if self.end is None else min(self.end, len(frames) - 1)
+            if self.start < 0 or self.start > end:
+                raise ValueError(f"Invalid frame range {self.start}-{end} for {len(frames)} frames")
+            frame_range = FrameRange(frames, self.start, end)
+            print(f"{video_path}: {self.mode} on frames {self.start}-{end}")
+
+            if self.mode in ('hough', 'contour'):
+                self.apply_to_frames(frame_range, cache_dir)
+            elif self.mode == 'opencv-crop':
+                self.analyse_crops(frame_range, log_dir, cache_dir)
+            elif self.mode == 'yolo':
+                video_hash = getattr(frames, 'video_hash', None) or hash_file(video_path)
+                self.detect_crystals(frame_range, log_dir, video_path, video_hash)
+        finally:
+            frames.release()
+
+    def apply_to_frames(self, frame_range, cache_dir):
+        """
+        Apply the hough transform or contouring to every frame and save the results to the cache directory.
+        """
+        output = 'lines' if self.mode == 'hough' else 'contours'
+        if self.workers > 1:
+            if self.parallel_processor is None:
+                self.parallel_processor = ParallelFrameProcessor(self.workers)
+            self.parallel_processor.map(frame_range, [output], cache_dir=cache_dir,
+                                        first_frame_index=frame_range.start)
+            return
+
+        for i in range(len(frame_range)):
+            frame = frame_range[i]
+            self.save_overlay(frame, frame_pipeline.process(frame)[output], frame_range.start + i, cache_dir)
+
+    def save_overlay(self, frame, result, frame_index, cache_dir):
+        """
+        Save a frame with its hough lines or contours drawn on it.
+        """
+        if self.mode == 'hough':
+            cv2.imwrite(os.path.join(cache_dir, f"hough_frame_{frame_index}.png"), draw_lines(frame.copy(), result))
+        else:
+            cv2.imwrite(os.path.join(cache_dir, f"contour_frame_{frame_index}.png"),
+                        draw_contours(frame.copy(), result))
+
+    def analyse_crops(self, frame_range, log_dir, cache_dir):
+        """
+        Measure the crystal inside the ROI of every frame and calculate its growth rate.
+        """
+        x1, y1, x2, y2 = self.roi
+        analysis_data = []
+        for i in range(len(frame_range)):
+            cropped_frame = frame_range[i][y1:y2, x1:x2]
+            cv2.imwrite(os.path.join(cache_dir, f"cropped_frame_{frame_range.start + i}.png"), cropped_frame)
+            width, height, angle = ShapeAnalyser(cropped_frame, capture_stages=False).process_image()
+            analysis_data.append(shape_record(i, width, height, angle))
+
+        # calculate growth rate for openCV - use_hypotenuse = False.
+        GrowthRateCalculator(log_dir, interactive=False).calculate_growth_rate(analysis_data, use_hypotenuse=False)
+
+    def detect_crystals(self, frame_range, log_dir, video_path, video_hash):
+        """
+        Detect crystals in every frame with YOLO, inside the ROI if given, and calculate their growth rate.
+        Detections are kept in the detection store, so frames detected by an earlier run are not detected again.
+        """
+        if self.detection_store is None:
+            self.detection_store = DetectionStore(os.path.join(self.cache_dir, "detections.sqlite"))
+        if self.instances > 1:
+            crystal_data = self.detect_with_pool(frame_range, video_path, video_hash)
+        else:
+            crystal_data = self.detect_in_process(frame_range, video_hash)
+
+        if not crystal_data:
+            print("No crystals detected")
+            return
+        # calculate growth rate for YOLO - use_hypotenuse = True.
+        GrowthRateCalculator(log_dir, interactive=False).calculate_growth_rate(crystal_data, use_hypotenuse=True)
+
+    def detect_in_process(self, frame_range, video_hash):
+        """
+        Detect crystals with one model in this process, while the next frames are decoded, and return the
+        detection records.
+        """
+        if self.detector is None:
+            from CrystalAnalysisSystem.crystal_detector import CrystalDetector
+            self.detector = CrystalDetector(model_path=self.model_path, backend=self.backend, int8=self.int8,
+                                            conf=self.conf, threads=self.threads)
+        detector_params = self.detector.cache_params(self.roi, self.imgsz)
+
+        def detect_missing(frames):
+            return self.detector.detect_batch(frames, self.batch_size, self.roi, self.imgsz)
+
+        def detect(frames, indices):
+            return self.detection_store.get_or_detect(video_hash, detector_params, frames,
+                                                      [frame_range.start + i for i in indices], detect_missing)
+
+        keyframe_tracker = None
+        if self.keyframe_interval > 1:
+            keyframe_tracker = KeyframeTracker(detect, self.keyframe_interval, self.motion_threshold)
+            detect = keyframe_tracker.detect
+
+        # Decoding the next frames overlaps detection of the current batch
+        crystal_data = []
+        for i, _, detections in DetectionPipeline(frame_range, range(len(frame_range)), detect, self.batch_size):
+            propagated = i in keyframe_tracker.propagated if keyframe_tracker is not None else None
+            crystal_data.extend(detection_records(detections, frame_range.start + i, self.detector.class_names,
+                                                  propagated))
+        return crystal_data
+
+    def detect_with_pool(self, frame_range, video_path, video_hash):
+        """
+        Detect crystals in the frames missing from the detection store with a pool of model instances, each
+        decoding its share of the range from the video, and return the detection records in frame order.
+        """
+        if self.detector_pool is None:
+            from CrystalAnalysisSystem.detector_pool import DetectorPool
+            self.detector_pool = DetectorPool(self.model_path, self.instances, self.threads, self.backend, self.int8,
+                                              self.conf, self.batch_size)
+        detector_params = self.detector_pool.cache_params(self.roi, self.imgsz)
+
+        indices = range(frame_range.start, frame_range.end + 1)
+        frame_detections = self.detection_store.get(video_hash, detector_params, indices)
+        missing = [i for i in indices if i not in frame_detections]
+        detected = []
+        for i, detections in self.detector_pool.imap(video_path, missing, self.roi, self.imgsz):
+            detected.append((i, detections))
+            if len(detected) >= self.detector_pool.chunk_size:
+                self.detection_store.put(video_hash, detector_params, detected)
+                frame_detections.update(detected)
+                detected = []
+        self.detection_store.put(video_hash, detector_params, detected)
+        frame_detections.update(detected)
+
+        class_names = self.detector_pool.get_class_names()
+        crystal_data = []
+        for i in indices:
+            crystal_data.extend(detection_records(frame_detections[i], i, class_names))
+        return crystal_data
+
+    def close(self):
+        if self.parallel_processor is not None:
+            self.parallel_processor.shutdown()
+        if self.detector_pool is not None:
+            self.detector_pool.shutdown()
+        if self.detection_store is not None:
+            self.detection_store.close()
+
+
+def find_videos(paths):
+    """
+    Expand the given files and directories into a sorted list of video files.
+    """
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.lower().endswith(VIDEO_EXTENSIONS)))
+        else:
+            videos.append(path)
+    return videos
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m CrystalAnalysisSystem.batch",
+                                     description="Headless crystal analysis of whole videos.")
+    parser.add_argument('paths', nargs='+', help="video files or directories of videos")
+    parser.add_argument('--mode', required=True, choices=['hough', 'contour', 'opencv-crop', 'yolo'])
+    parser.add_argument('--start', type=int, default=0, help="first frame to analyse (default: 0)")
+    parser.add_argument('--end', type=int, default=None, help="last frame to analyse (default: last frame)")
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                        help="crop rectangle in video pixels, required for opencv-crop; restricts yolo detection")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="YOLO model for yolo mode")
+    parser.add_argument('--log-dir', default="log")
+    parser.add_argument('--cache-dir', default="cache")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="worker processes for hough/contour (default: all cores)")
+    parser.add_argument('--frame-store', action='store_true', help="decode through the persistent frame store")
+    parser.add_argument('--batch-size', type=int, default=8, help="frames per YOLO call in yolo mode (default: 8)")
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch',
+                        help="run the YOLO model with PyTorch or export it and use ONNX Runtime (default: torch)")
+    parser.add_argument('--int8', action='store_true', help="with --backend onnx, run an INT8 quantized model")
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help="YOLO confidence threshold in yolo mode (default: 0.25)")
+    parser.add_argument('--instances', type=int, default=1,
+                        help="YOLO model instances in worker processes, each on its own cores (default: 1)")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="intra-op threads per YOLO model instance (default: one per core of its share)")
+    parser.add_argument('--imgsz', type=int, default=None,
+                        help="YOLO input size (longest side) in yolo mode (default: the model's own)")
+    parser.add_argument('--keyframe-interval', type=int, default=1,
+                        help="run YOLO every N frames and track boxes in between (default: 1, every frame)")
+    parser.add_argument('--motion-threshold', type=float, default=10.0,
+                        help="frame difference (0-255) since the last keyframe that forces a new one (default: 10)")
+    args = parser.parse_args(argv)
+
+    if args.mode == 'opencv-crop' and args.roi is None:
+        parser.error("--roi is required for opencv-crop mode")
+    if args.instances > 1 and args.keyframe_interval > 1:
+        parser.error("--instances can't be combined with --keyframe-interval, tracking needs frames in order")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    videos = find_videos(args.paths)
+    if not videos:
+        print("No videos found")
+        return 1
+
+    analyser = BatchAnalyser(args.mode, args.start, args.end, args.roi, args.model, args.log_dir, args.cache_dir,
+                             args.workers, args.frame_store, batch_size=args.batch_size,
+                             backend=args.backend, int8=args.int8, keyframe_interval=args.keyframe_interval,
+                             motion_threshold=args.motion_threshold, imgsz=args.imgsz, conf=args.conf,
+                             instances=args.instances, threads=args.threads)
+    failed = []
+    try:
+        for video_path in videos:
+            try:
+                analyser.analyse_video(video_path)
+            except Exception as error:  # keep going, one bad video shouldn't stop an overnight run
+                print(f"{video_path}: failed: {error}", file=sys.stderr)
+                failed.append(video_path)
+    finally:
+        analyser.close()
+
+    print(f"Analysed {len(videos) - len(failed)} of {len(videos)} videos")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 
@@ -10,7 +11,7 @@ class CrystalAnalysisController(tk.Tk):
     Main application class for the Crystal Analysis System.
     Initialises the GUI components and sets up event handlers. PS 2024
     """
-    def __init__(self):
+    def __init__(self, warm_up=True):
         super().__init__()
 
         # Set up all the UI Stuff here
@@ -35,10 +36,42 @@ class CrystalAnalysisController(tk.Tk):
         self.file_menu.add_command(label="Upload Video", command=self.upload_video)
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
 
+        self.options_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.use_frame_store_var = tk.BooleanVar(value=False)
+        self.options_menu.add_checkbutton(label="Use Frame Store", variable=self.use_frame_store_var,
+                                          command=self.toggle_frame_store)
+        self.use_proxy_var = tk.BooleanVar(value=True)
+        self.options_menu.add_checkbutton(label="Browse Proxy Frames", variable=self.use_proxy_var,
+                                          command=self.toggle_proxy_frames)
+        self.parallel_var = tk.BooleanVar(value=False)
+        self.options_menu.add_checkbutton(label="Parallel Processing", variable=self.parallel_var,
+                                          command=self.toggle_parallel_processing)
+        self.onnx_var = tk.BooleanVar(value=False)
+        self.options_menu.add_checkbutton(label="ONNX Runtime Detection (CPU)", variable=self.onnx_var,
+                                          command=self.toggle_detector_backend)
+        self.int8_var = tk.BooleanVar(value=False)
+        self.options_menu.add_checkbutton(label="INT8 Detection Model", variable=self.int8_var,
+                                          command=self.toggle_detector_backend)
+        self.detect_in_crop_var = tk.BooleanVar(value=False)
+        self.options_menu.add_checkbutton(label="Detect in Crop Area", variable=self.detect_in_crop_var)
+        self.options_menu.add_command(label="Detection Image Size...", command=self.set_detection_imgsz)
+        self.options_menu.add_command(label="Clear Result Cache", command=self.clear_result_cache)
+        self.options_menu.add_command(label="Prefetch Window...", command=self.set_prefetch_window)
+        self.options_menu.add_command(label="Keyframe Detection...", command=self.set_keyframe_detection)
+        self.options_menu.add_command(label="Prefetch Statistics", command=self.show_prefetch_statistics)
+        self.menu_bar.add_cascade(label="Options", menu=self.options_menu)
+
         self.view_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.view_menu.add_command(label="Show Original", command=self.show_original_frames)
         self.view_menu.add_command(label="Show Hough", command=self.show_hough_frames)
         self.view_menu.add_command(label="Show Contour", command=self.show_contour_frames)
+        self.view_menu.add_separator()
+        self.detection_boxes_var = tk.BooleanVar(value=True)
+        self.view_menu.add_checkbutton(label="Detection Boxes", variable=self.detection_boxes_var,
+                                       command=self.toggle_detection_layers)
+        self.detection_labels_var = tk.BooleanVar(value=True)
+        self.view_menu.add_checkbutton(label="Detection Labels", variable=self.detection_labels_var,
+                                       command=self.toggle_detection_layers)
         self.menu_bar.add_cascade(label="View", menu=self.view_menu)
 
         self.about_menu = tk.Menu(self.menu_bar, tearoff=0)
@@ -79,12 +112,114 @@ class CrystalAnalysisController(tk.Tk):
                                                   command=self.run_crystal_detection)
         self.crystal_detection_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        # Long operations run in the background and can be cancelled
+        self.cancel_button = tk.Button(self.status_bar_frame, text="Cancel", command=self.cancel_job)
+        self.cancel_button.pack(side=tk.LEFT, padx=5, pady=5)
+
+        # Load the detection model in the background once the window is up
+        if warm_up:
+            self.after(500, self.video_processor.warm_up)
+
+    def destroy(self):
+        """
+        Cancel running jobs before the window closes.
+        """
+        self.video_processor.jobs.shutdown()
+        super().destroy()
+
     def upload_video(self):
         """
         Open a file dialog to upload a video file for processing.
         """
         self.video_processor.upload_video()
 
+    def toggle_frame_store(self):
+        """
+        Toggle decoding videos into the persistent frame store on upload.
+        """
+        self.video_processor.use_frame_store = self.use_frame_store_var.get()
+
+    def toggle_proxy_frames(self):
+        """
+        Toggle browsing display-sized proxy frames of videos uploaded from now on.
+        """
+        self.video_processor.use_proxy = self.use_proxy_var.get()
+
+    def toggle_parallel_processing(self):
+        """
+        Toggle running whole-video hough transform and contouring on all CPU cores.
+        """
+        self.video_processor.workers = (os.cpu_count() or 1) if self.parallel_var.get() else 1
+
+    def toggle_detector_backend(self):
+        """
+        Toggle running crystal detection with ONNX Runtime, optionally with the INT8 quantized model.
+        """
+        onnx, int8 = self.onnx_var.get(), self.int8_var.get()
+        if int8 and not self.video_processor.detector_int8:
+            onnx = True  # INT8 was just turned on, only the ONNX model is quantized
+        elif not onnx:
+            int8 = False
+        self.onnx_var.set(onnx)
+        self.int8_var.set(int8)
+        self.video_processor.set_detector_backend('onnx' if onnx else 'torch', int8)
+
+    def set_detection_imgsz(self):
+        """
+        Set the input size (longest side) crystal detection runs the model at. Smaller sizes are faster.
+        """
+        imgsz = simpledialog.askinteger("Input", "Detection image size in pixels (0 = model default):", minvalue=0,
+                                        initialvalue=self.video_processor.detection_imgsz or 0)
+        if imgsz is not None:
+            self.video_processor.detection_imgsz = imgsz or None
+
+    def clear_result_cache(self):
+        """
+        Remove all cached analysis results and stored detections, forcing them to be recomputed.
+        """
+        self.video_processor.get_result_cache().clear()
+        self.video_processor.get_detection_store().clear()
+        self.status_var.set("Result cache cleared")
+
+    def set_prefetch_window(self):
+        """
+        Set how many frames are decoded ahead of and behind the current frame while navigating.
+        """
+        ahead = simpledialog.askinteger("Input", "Frames to prefetch ahead:", minvalue=0,
+                                        initialvalue=self.video_processor.prefetch_ahead)
+        behind = simpledialog.askinteger("Input", "Frames to prefetch behind:", minvalue=0,
+                                         initialvalue=self.video_processor.prefetch_behind)
+        if ahead is not None and behind is not None:
+            self.video_processor.set_prefetch_window(ahead, behind)
+
+    def set_keyframe_detection(self):
+        """
+        Set how often crystal detection runs the model, with boxes tracked between keyframes. 1 detects every frame.
+        """
+        interval = simpledialog.askinteger("Input", "Run detection every N frames (1 = every frame):", minvalue=1,
+                                           initialvalue=self.video_processor.keyframe_interval)
+        if interval is None:
+            return
+        threshold = simpledialog.askfloat("Input", "Motion score (0-255) that forces a keyframe:", minvalue=0,
+                                          initialvalue=self.video_processor.keyframe_motion_threshold)
+        if threshold is not None:
+            self.video_processor.keyframe_interval = interval
+            self.video_processor.keyframe_motion_threshold = threshold
+
+    def show_prefetch_statistics(self):
+        """
+        Display how often navigated frames were already decoded by the prefetcher.
+        """
+        prefetcher = self.video_processor.prefetcher
+        if prefetcher is None:
+            messagebox.showinfo("Prefetch Statistics", "No prefetcher running for the current video")
+            return
+        messagebox.showinfo("Prefetch Statistics",
+                            f"Window: {prefetcher.ahead} ahead, {prefetcher.behind} behind\n"
+                            f"Hits: {prefetcher.hits}\nMisses: {prefetcher.misses}\n"
+                            f"Hit Rate: {prefetcher.hit_rate() * 100:.1f}%")
+        prefetcher.reset_stats()
+
     def apply_hough_transform(self):
         """
         Apply Hough Transform to the uploaded video frames.
@@ -116,14 +251,28 @@ class CrystalAnalysisController(tk.Tk):
 
     def run_crystal_detection(self):
         """
-        Run the crystal detection model on a specified range of frames.
+        Run the crystal detection model on a specified range of frames, inside the last crop area if
+        Detect in Crop Area is on.
         """
+        roi = None
+        if self.detect_in_crop_var.get():
+            roi = self.frame_display.crop_box
+            if roi is None:
+                messagebox.showerror("Error", "Draw a crop area first to detect crystals inside it")
+                return
+
         # move this out of controller.
         start_frame = simpledialog.askinteger("Input", "Enter start frame:")
         end_frame = simpledialog.askinteger("Input", "Enter end frame:")
 
         if start_frame is not None and end_frame is not None:
-            self.video_processor.detect_crystals_in_range(start_frame, end_frame)
+            self.video_processor.detect_crystals_in_range(start_frame, end_frame, roi=roi)
+
+    def cancel_job(self):
+        """
+        Cancel the running operation (opening a video, hough/contouring, cropping or crystal detection).
+        """
+        self.video_processor.cancel_job()
 
     def show_original_frames(self):
         """
@@ -145,6 +294,13 @@ class CrystalAnalysisController(tk.Tk):
         # self.frame_display.show_contour_frames()
         self.frame_display.show_frames('contour')
 
+    def toggle_detection_layers(self):
+        """
+        Show or hide the detection boxes and labels drawn over the frames.
+        """
+        self.frame_display.set_layer('boxes', self.detection_boxes_var.get())
+        self.frame_display.set_layer('labels', self.detection_labels_var.get())
+
     def show_about(self):
         """
         Display the "about" information for the application.
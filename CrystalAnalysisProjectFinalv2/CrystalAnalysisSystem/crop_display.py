@@ -1,10 +1,18 @@
+import multiprocessing
+import os
 import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from tkinter import ttk
 import cv2
 import numpy as np
 from PIL import Image, ImageTk
 
-from CrystalAnalysisSystem.shape_analyser import ShapeAnalyser
+from CrystalAnalysisSystem.shape_analyser import ShapeAnalyser, SHAPE_PARAMS, measure_shape
 from CrystalAnalysisSystem.growth_rate_calculator import GrowthRateCalculator
+from CrystalAnalysisSystem.parallel import init_worker
+from CrystalAnalysisSystem.utils import shape_record, hash_array
 
 
 class CropDisplay(tk.Toplevel):
@@ -16,7 +24,9 @@ class CropDisplay(tk.Toplevel):
         self.cropped_frames = cropped_frames  # List of cropped frames
         self.current_frame_index = 0
         self.video_processor = video_processor
-        self.analyser = ShapeAnalyser(self.cropped_frames[self.current_frame_index])
+        self.result_cache = video_processor.get_result_cache()
+        self.analysis_cache = OrderedDict()  # Frame index -> (measurement, stages), least recently used first
+        self.analysis_cache_size = 16  # Frames whose stage images are kept, about 1.5 MB each at 400x300
         self.stages = []
         self.current_stage_index = 0
         self.layer_names = [
@@ -26,6 +36,12 @@ class CropDisplay(tk.Toplevel):
         ]
         self.analysis_data = []
         self.log_dir = "log"
+        self.executor = None  # Worker processes for the analysis, started on first use
+        self.measurements = []  # Measurement of each cropped frame, None until it arrives
+        self.failed = {}  # Frame index -> error of analyses that raised, those frames stay unmeasured
+        self.pending = {}  # Future -> (frame index, frame hash) of analyses still running
+        self.poll_interval = 50  # ms between checks for finished analyses
+        self.poll_id = None  # Scheduled poll_analysis call
 
         self.calculator = GrowthRateCalculator(self.log_dir)  # Initialize GrowthRateCalculator
 
@@ -41,6 +57,10 @@ class CropDisplay(tk.Toplevel):
         self.analyze_button = tk.Button(self.controls_frame, text="Start Analysis", command=self.start_analysis)
         self.analyze_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.cancel_button = tk.Button(self.controls_frame, text="Cancel", command=self.cancel_analysis,
+                                       state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5, pady=5)
+
         # Previous layer button (change this to layer)
         self.prev_stage_button = tk.Button(self.controls_frame, text="Previous Stage", command=self.show_previous_stage,
                                            state=tk.DISABLED)
@@ -67,6 +87,11 @@ class CropDisplay(tk.Toplevel):
         self.layer_label = tk.Label(self.info_frame, text="Layer: Original")
         self.layer_label.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.progress_bar = ttk.Progressbar(self.info_frame, orient="horizontal", length=200, mode="determinate")
+        self.progress_bar.pack(side=tk.RIGHT, padx=5, pady=5)
+        self.progress_label = tk.Label(self.info_frame, text="")
+        self.progress_label.pack(side=tk.RIGHT, padx=5, pady=5)
+
         self.display_frame(self.cropped_frames[self.current_frame_index])
 
     def display_frame(self, frame):
@@ -82,22 +107,112 @@ class CropDisplay(tk.Toplevel):
 
     def start_analysis(self):
         """
-        Start the analysis for all cropped frames and save the results to a CSV file.
+        Start the analysis for all cropped frames in worker processes. Results are collected by poll_analysis
+        and saved to a CSV file once every frame is measured.
         """
+        if self.pending:
+            return
+
+        self.measurements = [None] * len(self.cropped_frames)
+        self.failed = {}
+        to_analyse = []
         for i, frame in enumerate(self.cropped_frames):
-            self.analyser = ShapeAnalyser(frame)
-            width, height, angle = self.analyser.process_image()
+            # Crops have no source of their own, so measurements are cached by the crop's content
+            frame_hash = hash_array(frame)
+            self.measurements[i] = self.result_cache.get(frame_hash, 0, 'shape', SHAPE_PARAMS)
+            if self.measurements[i] is None:
+                to_analyse.append((i, frame_hash))
+
+        if to_analyse:
+            if self.executor is None:
+                workers = min(os.cpu_count(), len(to_analyse))
+                self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=init_worker)
+            for i, frame_hash in to_analyse:
+                future = self.executor.submit(measure_shape, self.cropped_frames[i])
+                self.pending[future] = (i, frame_hash)
+
+        self.analyze_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress_bar["maximum"] = len(self.cropped_frames)
+        self.poll_analysis()
+
+    def poll_analysis(self):
+        """
+        Collect finished analyses and update the progress, rescheduling itself until every frame is measured.
+        """
+        for future in [future for future in self.pending if future.done()]:
+            i, frame_hash = self.pending.pop(future)
+            if future.cancelled():
+                continue
+            try:
+                self.measurements[i] = future.result()
+            except Exception as error:
+                self.failed[i] = error
+                if isinstance(error, BrokenProcessPool):
+                    self.shutdown_executor()  # every pending frame fails too, a new pool is started next time
+                continue
+            self.result_cache.put(frame_hash, 0, 'shape', SHAPE_PARAMS, self.measurements[i])
+
+        frames_done = len(self.cropped_frames) - len(self.pending)
+        self.progress_bar["value"] = frames_done
+        self.progress_label.config(text=f"Analysed {frames_done}/{len(self.cropped_frames)}")
+        if self.pending:
+            self.poll_id = self.after(self.poll_interval, self.poll_analysis)
+        else:
+            self.poll_id = None
+            self.finish_analysis()
+
+    def finish_analysis(self):
+        """
+        Collect the measurements in frame order and calculate the growth rate. Frames whose analysis failed
+        are left out.
+        """
+        self.analyze_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        if self.failed:
+            error = next(iter(self.failed.values()))
+            self.progress_label.config(text=f"Analysis failed for {len(self.failed)}/{len(self.cropped_frames)} "
+                                            f"frames: {error}")
 
-            # Collect analysis data
-            self.analysis_data.append({
-                'frame': i,
-                'width': width if width is not None else "N/A",
-                'height': height if height is not None else "N/A",
-                'angle': angle if angle is not None else "N/A",
-            })
+        # Collect analysis data
+        self.analysis_data = [shape_record(i, *measurement)
+                              for i, measurement in enumerate(self.measurements) if measurement is not None]
 
         # calculate growth rate for openCV - use_hypotenuse = False.
-        self.calculator.calculate_growth_rate(self.analysis_data, use_hypotenuse=False)
+        if self.analysis_data:
+            self.calculator.calculate_growth_rate(self.analysis_data, use_hypotenuse=False)
+
+    def cancel_analysis(self):
+        """
+        Stop the analysis. Frames not yet started are dropped and running ones are left to finish unused.
+        """
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+            self.poll_id = None
+        for future in self.pending:
+            future.cancel()
+        self.pending = {}
+        self.shutdown_executor()
+
+        self.analyze_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_bar["value"] = 0
+        self.progress_label.config(text="Analysis cancelled")
+
+    def shutdown_executor(self):
+        """
+        Stop the worker processes without waiting for running analyses.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def destroy(self):
+        if self.pending:
+            self.cancel_analysis()
+        self.shutdown_executor()
+        super().destroy()
 
     def next_frame(self):
         """
@@ -119,7 +234,6 @@ class CropDisplay(tk.Toplevel):
         """
         Update the display and analysis for the new frame.
         """
-        self.analyser = ShapeAnalyser(self.cropped_frames[self.current_frame_index])
         self.stages = []
         self.current_stage_index = 0
         self.display_frame(self.cropped_frames[self.current_frame_index])
@@ -148,8 +262,7 @@ class CropDisplay(tk.Toplevel):
         """
         Update the information displayed about the current frame.
         """
-        width, height, angle = self.analyser.process_image()
-        self.stages = self.analyser.stages
+        (width, height, angle), self.stages = self.analyse_frame(self.current_frame_index)
 
         if width is not None and height is not None:
             self.dimensions_label.config(text=f"Dimensions: Width={width}, Height={height}")
@@ -163,6 +276,19 @@ class CropDisplay(tk.Toplevel):
 
         self.layer_label.config(text=f"Layer: {layer_name}")
 
+    def analyse_frame(self, index):
+        """
+        Measurement and stage images of a cropped frame, computed once and kept in a bounded cache.
+        """
+        if index in self.analysis_cache:
+            self.analysis_cache.move_to_end(index)
+        else:
+            analyser = ShapeAnalyser(self.cropped_frames[index])
+            self.analysis_cache[index] = (analyser.process_image(), analyser.stages)
+            if len(self.analysis_cache) > self.analysis_cache_size:
+                self.analysis_cache.popitem(last=False)
+        return self.analysis_cache[index]
+
     def update_stage_controls(self):
         """
         Enable or disable stage navigation buttons based on the current analysis stage.
@@ -1,17 +1,118 @@
-from ultralytics import YOLO
+from CrystalAnalysisSystem.onnx_model import OnnxModel, export_onnx
+from CrystalAnalysisSystem.utils import hash_file
+
+MODEL_STRIDE = 32  # YOLO input sizes are multiples of this
+
+
+def load_model(model_path, threads=None):
+    """
+    Load a YOLO model, run with ONNX Runtime if it is an .onnx export. ultralytics imports torch, which
+    takes seconds, so it is only imported here. threads sets the model's intra-op thread count, for
+    torch process wide.
+    """
+    if model_path.endswith('.onnx'):
+        return OnnxModel(model_path, threads)
+    from ultralytics import YOLO
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return YOLO(model_path)
+
+
+def make_cache_params(model_hash, conf, roi=None, imgsz=None):
+    """
+    Parameters identifying detections made by a model with the given settings in the detection store.
+    """
+    params = {'model': model_hash, 'conf': conf}
+    if roi is not None:
+        params['roi'] = [int(round(value)) for value in roi]
+    if imgsz:
+        params['imgsz'] = imgsz
+    return params
+
+
+def clip_roi(roi, shape):
+    """
+    Clamp an x1, y1, x2, y2 region of interest to a frame of the given shape, in whole pixels.
+    """
+    height, width = shape[:2]
+    x1, x2 = sorted(min(max(int(round(x)), 0), width) for x in (roi[0], roi[2]))
+    y1, y2 = sorted(min(max(int(round(y)), 0), height) for y in (roi[1], roi[3]))
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError(f"Region of interest {tuple(roi)} is outside the {width}x{height} frame")
+    return x1, y1, x2, y2
 
 
 class CrystalDetector:
     """
-    Class for detecting crystals using a YOLO model. PS 2024
+    Class for detecting crystals using a YOLO model. With backend='onnx' a .pt model is exported to ONNX
+    and run with ONNX Runtime, which is much faster on CPUs; int8=True runs a quantized copy. Detection
+    can be restricted to a region of interest (roi) and run at a smaller input size (imgsz). PS 2024
     """
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)  # Gets custom YOLO model
+    def __init__(self, model_path, batch_size=8, backend='torch', int8=False, conf=0.25, threads=None):
+        if backend == 'onnx' or model_path.endswith('.onnx'):
+            model_path = export_onnx(model_path, int8)
+        self.model_path = model_path  # The model file actually run, so cached results are per backend
+        self.backend = 'onnx' if model_path.endswith('.onnx') else 'torch'
+        self.batch_size = batch_size  # Frames per model call in detect_batch
+        self.conf = conf  # Detections below this confidence are dropped
+        self.model_hash = None
+        self.model = load_model(model_path, threads)  # Gets custom YOLO model
         self.class_names = self.model.names
+        # Input size (longest side) the model runs at by default, ultralytics models are trained at 640
+        self.imgsz = max(self.model.input_size) if self.backend == 'onnx' else 640
+
+    def cache_params(self, roi=None, imgsz=None):
+        """
+        Parameters identifying this detector's results in the result cache.
+        """
+        if self.model_hash is None:
+            self.model_hash = hash_file(self.model_path)
+        return make_cache_params(self.model_hash, self.conf, roi, imgsz)
 
-    def detect(self, image):
+    def detect(self, image, roi=None, imgsz=None):
         """
         Detect crystals in the given image using the YOLO model.
         """
-        results = self.model(image)[0]  # Applies custom model to image
-        return results.boxes.data.tolist()
+        return self.predict([image], roi, imgsz)[0]  # Applies custom model to image
+
+    def detect_batch(self, frames, batch_size=None, roi=None, imgsz=None):
+        """
+        Detect crystals in a list or stacked array of frames, passing the model batch_size frames per call.
+        Returns the detections of each frame in order, in the same format as detect.
+        """
+        batch_size = batch_size or self.batch_size
+        detections = []
+        for start in range(0, len(frames), batch_size):
+            batch = [frames[i] for i in range(start, min(start + batch_size, len(frames)))]
+            detections.extend(self.predict(batch, roi, imgsz))
+        return detections
+
+    def predict(self, frames, roi=None, imgsz=None):
+        """
+        Run the model on a list of frames and return the x1, y1, x2, y2, conf, class_id rows of each. With a
+        roi only that part of each frame is passed to the model and the boxes are moved back into frame
+        coordinates. imgsz is the model input size (longest side), by default the model's own, or for a roi
+        its own size if smaller so the model runs on fewer pixels rather than enlarging the roi.
+        """
+        if roi is not None:
+            x1, y1, x2, y2 = clip_roi(roi, frames[0].shape)
+            frames = [frame[y1:y2, x1:x2] for frame in frames]
+            if not imgsz:
+                imgsz = min(self.imgsz, -(-max(x2 - x1, y2 - y1) // MODEL_STRIDE) * MODEL_STRIDE)
+
+        if self.backend == 'onnx':
+            detections = [frame_detections.tolist()
+                          for frame_detections in self.model.predict(frames, imgsz, self.conf)]
+        else:
+            options = {'conf': self.conf, 'imgsz': imgsz} if imgsz else {'conf': self.conf}
+            detections = [results.boxes.data.tolist() for results in self.model(frames, **options)]
+
+        if roi is not None:
+            for frame_detections in detections:
+                for row in frame_detections:
+                    row[0] += x1
+                    row[1] += y1
+                    row[2] += x1
+                    row[3] += y1
+        return detections
@@ -0,0 +1,139 @@
+import queue
+import threading
+
+DONE = object()  # Queued after a stage's last item
+
+
+class DetectionPipeline:
+    """
+    Runs crystal detection over a range of frames as three stages joined by bounded queues: a thread
+    decoding frames, a thread running the detector on batches of them, and the caller consuming the
+    results. Decoding overlaps inference, and a slow consumer (e.g. Tk redraws) only holds up the
+    pipeline once the result queue is full. PS 2024
+    """
+    def __init__(self, frames, indices, detect, batch_size=8, queue_size=None):
+        self.frames = frames
+        self.indices = indices
+        self.detect = detect  # detect(frames, indices) returns the detections of each frame
+        self.batch_size = batch_size
+        queue_size = queue_size or 2 * batch_size
+        self.decoded = queue.Queue(queue_size)  # (frame index, frame) from the decode thread
+        self.results = queue.Queue(queue_size)  # (frame index, frame, detections) from the inference thread
+        self.stop_event = threading.Event()
+        self.error = None  # Exception raised by a stage, re-raised to the consumer
+        self.finished = False
+        self.threads = [threading.Thread(target=self.decode_frames, daemon=True),
+                        threading.Thread(target=self.infer, daemon=True)]
+
+    def start(self):
+        """
+        Start the decode and inference threads.
+        """
+        for thread in self.threads:
+            if not thread.is_alive():
+                thread.start()
+
+    def put(self, stage_queue, item):
+        """
+        Put an item on a queue, giving up if the pipeline is stopped while the queue is full.
+        """
+        while not self.stop_event.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, stage_queue):
+        """
+        Take an item from a queue, or None if the pipeline is stopped while it is empty.
+        """
+        while not self.stop_event.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def decode_frames(self):
+        """
+        Decode thread: read each frame of the range in order.
+        """
+        try:
+            for i in self.indices:
+                if not self.put(self.decoded, (i, self.frames[i])):
+                    return
+        except Exception as error:
+            self.error = error
+        self.put(self.decoded, DONE)
+
+    def infer(self):
+        """
+        Inference thread: detect crystals in batches of decoded frames.
+        """
+        try:
+            done = False
+            while not done:
+                batch = []
+                while len(batch) < self.batch_size:
+                    item = self.get(self.decoded)
+                    if item is None:
+                        return
+                    if item is DONE:
+                        done = True
+                        break
+                    batch.append(item)
+
+                if batch:
+                    detections = self.detect([frame for _, frame in batch], [i for i, _ in batch])
+                    for (i, frame), frame_detections in zip(batch, detections):
+                        if not self.put(self.results, (i, frame, frame_detections)):
+                            return
+        except Exception as error:
+            self.error = error
+        self.put(self.results, DONE)
+
+    def get_results(self, timeout=None):
+        """
+        Return the results that are ready, in frame order, waiting up to timeout seconds for the first
+        (forever if None). Sets finished after the last one and re-raises any error of the stages.
+        """
+        results = []
+        try:
+            item = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return results
+
+        while True:
+            if item is DONE:
+                self.finished = True
+                if self.error is not None:
+                    raise self.error
+                break
+            results.append(item)
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                break
+        return results
+
+    def __iter__(self):
+        """
+        Run the pipeline and yield (frame index, frame, detections) for each frame in order.
+        """
+        self.start()
+        try:
+            while not self.finished:
+                yield from self.get_results()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Stop the stages, dropping frames still in flight.
+        """
+        self.stop_event.set()
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join()
@@ -0,0 +1,107 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+class DetectionStore:
+    """
+    Local SQLite store of YOLO detections, indexed by (video hash, model hash, confidence threshold,
+    other detection parameters, frame index). Detecting an overlapping frame range again reads the
+    frames already stored and only runs the model on the missing ones. PS 2024
+    """
+    def __init__(self, path="cache/detections.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()  # Detection runs in a background thread, clearing in the GUI thread
+        self.hits = 0
+        self.misses = 0
+
+        # Create the store's directory if it doesn't exist
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS detections (
+                    video_hash TEXT NOT NULL,
+                    model_hash TEXT NOT NULL,
+                    conf REAL NOT NULL,
+                    params TEXT NOT NULL,
+                    frame INTEGER NOT NULL,
+                    detections TEXT NOT NULL,
+                    PRIMARY KEY (video_hash, model_hash, conf, params, frame)
+                ) WITHOUT ROWID""")
+
+    def make_key(self, video_hash, params):
+        """
+        Key columns for detections made with the given CrystalDetector.cache_params.
+        """
+        params = dict(params)
+        model_hash = params.pop('model')
+        conf = params.pop('conf', 0.0)
+        return video_hash, model_hash, conf, json.dumps(params, sort_keys=True)
+
+    def get(self, video_hash, params, indices):
+        """
+        Return a dict of frame index -> detections for the given frames that are in the store.
+        """
+        indices = list(indices)
+        if not indices:
+            return {}
+        wanted = set(indices)
+        # One range query over the primary key index, filtered to the frames asked for
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT frame, detections FROM detections WHERE video_hash = ? AND model_hash = ? AND conf = ? "
+                "AND params = ? AND frame BETWEEN ? AND ?",
+                self.make_key(video_hash, params) + (min(indices), max(indices))).fetchall()
+        stored = {frame: json.loads(detections) for frame, detections in rows if frame in wanted}
+        self.hits += len(stored)
+        self.misses += len(wanted) - len(stored)
+        return stored
+
+    def put(self, video_hash, params, frame_detections):
+        """
+        Store the detections of each (frame index, detections) pair, replacing any already stored.
+        """
+        key = self.make_key(video_hash, params)
+        rows = [key + (int(i), json.dumps(detections)) for i, detections in frame_detections]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def count(self, video_hash, params, start, end):
+        """
+        Number of frames from start to end (inclusive) with stored detections.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM detections WHERE video_hash = ? AND model_hash = ? AND conf = ? "
+                "AND params = ? AND frame BETWEEN ? AND ?",
+                self.make_key(video_hash, params) + (start, end)).fetchone()[0]
+
+    def get_or_detect(self, video_hash, params, frames, indices, detect):
+        """
+        Detections of each frame, read from the store where possible. The missing frames are passed to
+        detect(frames) in one call and their detections stored.
+        """
+        indices = list(indices)
+        stored = self.get(video_hash, params, indices)
+        missing = [n for n, i in enumerate(indices) if i not in stored]
+        if missing:
+            detected = detect([frames[n] for n in missing])
+            new_detections = [(indices[n], detections) for n, detections in zip(missing, detected)]
+            self.put(video_hash, params, new_detections)
+            stored.update(new_detections)
+        return [stored[i] for i in indices]
+
+    def clear(self):
+        """
+        Remove every stored detection.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM detections")
+
+    def close(self):
+        self.connection.close()
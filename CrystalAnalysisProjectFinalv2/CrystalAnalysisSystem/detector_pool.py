@@ -0,0 +1,165 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import cv2
+
+from CrystalAnalysisSystem.crystal_detector import CrystalDetector, make_cache_params
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+from CrystalAnalysisSystem.onnx_model import export_onnx
+from CrystalAnalysisSystem.utils import hash_file
+
+# Thread pools sized from the environment when torch or ONNX Runtime start
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+detector = None  # This worker process's CrystalDetector
+video = None  # This worker process's open video, (video path, VideoFrameSource)
+
+
+def available_cores():
+    """
+    CPU cores this process may run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(cores, instances):
+    """
+    Split a list of CPU cores into one contiguous slice per model instance. With more instances than
+    cores, each instance gets one core in turn.
+    """
+    if instances >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(instances)]
+    size, extra = divmod(len(cores), instances)
+    slices = []
+    start = 0
+    for i in range(instances):
+        stop = start + size + (1 if i < extra else 0)
+        slices.append(cores[start:stop])
+        start = stop
+    return slices
+
+
+def init_detector_worker(core_slices, threads, model_path, batch_size, conf):
+    """
+    Worker process setup: pin the process to the next slice of cores, limit the model to threads intra-op
+    threads (by default one per core of the slice) and load it.
+    """
+    global detector
+    cores = core_slices.get(timeout=10)
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    threads = threads or len(cores)
+    for name in THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+    cv2.setNumThreads(1)  # Decoding runs alongside the model, which has the cores
+    detector = CrystalDetector(model_path, batch_size, conf=conf, threads=threads)
+
+
+def detect_chunk(video_path, indices, roi=None, imgsz=None):
+    """
+    Decode frames of a video and detect crystals in them. Runs in a worker process, which opens the video
+    itself so frames are never copied between processes.
+    """
+    global video
+    if video is None or video[0] != video_path:
+        if video is not None:
+            video[1].release()
+        video = (video_path, VideoFrameSource(video_path, cache_size=1))
+    frames = [video[1][i] for i in indices]
+    return detector.detect_batch(frames, None, roi, imgsz)
+
+
+def get_class_names():
+    """
+    Class names of the worker's model.
+    """
+    return detector.class_names
+
+
+class DetectorPool:
+    """
+    Runs several instances of the crystal detection model in worker processes, each pinned to its own
+    slice of CPU cores with an explicit intra-op thread count, so a many-core machine is kept busy
+    without one model oversubscribing it. A frame range is split into chunks that the workers decode
+    from the video and detect independently, and the results are returned in frame order. PS 2024
+    """
+    def __init__(self, model_path, instances=2, threads=None, backend='torch', int8=False, conf=0.25,
+                 batch_size=8, chunk_size=32, cores=None):
+        if backend == 'onnx' or model_path.endswith('.onnx'):
+            model_path = export_onnx(model_path, int8)  # Export once here rather than in every worker
+        self.model_path = model_path
+        self.instances = instances
+        self.threads = threads  # Intra-op threads per instance, None for one per core of its slice
+        self.conf = conf
+        self.chunk_size = chunk_size  # Frames per task
+        self.max_in_flight = instances * 2  # Keeps every instance busy while bounding reordering
+        self.core_slices = split_cores(cores or available_cores(), instances)
+        self.model_hash = None
+        self.class_names = None
+
+        # Each worker takes its slice of cores from the queue as it starts
+        context = multiprocessing.get_context('spawn')
+        core_queue = context.Queue()
+        for core_slice in self.core_slices:
+            core_queue.put(core_slice)
+        self.executor = ProcessPoolExecutor(instances, mp_context=context, initializer=init_detector_worker,
+                                            initargs=(core_queue, threads, model_path, batch_size, conf))
+
+    def cache_params(self, roi=None, imgsz=None):
+        """
+        Parameters identifying this pool's results in the detection store, the same as CrystalDetector's.
+        """
+        if self.model_hash is None:
+            self.model_hash = hash_file(self.model_path)
+        return make_cache_params(self.model_hash, self.conf, roi, imgsz)
+
+    def get_class_names(self):
+        """
+        Class names of the model, asked of a worker the first time.
+        """
+        if self.class_names is None:
+            self.class_names = self.executor.submit(get_class_names).result()
+        return self.class_names
+
+    def imap(self, video_path, indices, roi=None, imgsz=None):
+        """
+        Detect crystals in the given frames of a video, yielding (frame index, detections) in the order of
+        indices as chunks complete.
+        """
+        indices = list(indices)
+        chunks = [indices[start:start + self.chunk_size] for start in range(0, len(indices), self.chunk_size)]
+        pending = {}  # future -> chunk number
+        finished = {}  # chunk number -> detections, waiting for earlier chunks
+        next_chunk = 0
+        next_result = 0
+        try:
+            while next_result < len(chunks):
+                while next_chunk < len(chunks) and len(pending) < self.max_in_flight:
+                    future = self.executor.submit(detect_chunk, video_path, chunks[next_chunk], roi, imgsz)
+                    pending[future] = next_chunk
+                    next_chunk += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future.result()
+                while next_result in finished:
+                    yield from zip(chunks[next_result], finished.pop(next_result))
+                    next_result += 1
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def detect(self, video_path, indices, roi=None, imgsz=None):
+        """
+        Detections of each of the given frames of a video, in order.
+        """
+        return [detections for _, detections in self.imap(video_path, indices, roi, imgsz)]
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        self.executor.shutdown(cancel_futures=True)
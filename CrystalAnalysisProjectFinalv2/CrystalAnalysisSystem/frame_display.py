@@ -1,8 +1,34 @@
+import time
+
 import cv2
+import numpy as np
 import tkinter as tk
 from PIL import Image, ImageTk
 from tkinter import simpledialog, messagebox
 
+from CrystalAnalysisSystem.playback import PlaybackClock, PLAYBACK_SPEEDS
+from CrystalAnalysisSystem.utils import draw_lines, draw_contours, unpack_contours
+
+
+def fit_size(image_width, image_height, canvas_width, canvas_height):
+    """
+    Size (width, height) of an image scaled to fit the canvas, keeping its aspect ratio.
+    """
+    if canvas_width / image_width < canvas_height / image_height:
+        return canvas_width, max(1, int(image_height * canvas_width / image_width))
+    return max(1, int(image_width * canvas_height / image_height)), canvas_height
+
+
+def display_image(frame, width, height):
+    """
+    RGB PIL image of a BGR frame at the given display size. The frame is resized first, so the colour
+    conversion only touches the displayed pixels; INTER_AREA averages source pixels when shrinking.
+    """
+    if (frame.shape[1], frame.shape[0]) != (width, height):
+        interpolation = cv2.INTER_AREA if width < frame.shape[1] else cv2.INTER_LINEAR
+        frame = cv2.resize(frame, (width, height), interpolation=interpolation)
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))  # converts to BGR to RGB
+
 
 class FrameDisplay(tk.Frame):
     """
@@ -20,11 +46,20 @@ class FrameDisplay(tk.Frame):
         self.hold_prev = False
         self.frame_source = 'original'  # To track which frames to display
         self.crop_rect = None
+        self.crop_box = None  # Last crop area drawn, x1, y1, x2, y2 in frame pixels
         self.crop_start_x = 0
         self.crop_start_y = 0
         self.scale_x = 1
         self.scale_y = 1
         self.is_cropping = False
+        self.image_item = None  # The one canvas item frames are shown in
+        self.photo = None  # PhotoImage of image_item, frames of the same display size are pasted into it
+        self.layout = None  # (canvas size, frame size) the display size and scale factors were worked out for
+        self.display_size = None
+        self.playback = None  # PlaybackClock while playing
+        self.play_after = None  # Pending after() call of play_tick
+        self.play_speed = 1  # Multiple of the video's frame rate to play at
+        self.layers = {'boxes': True, 'labels': True}  # Detection layers drawn over the frame, and if they are shown
 
         # Canvas setup
         self.canvas = tk.Canvas(self, width=640, height=480)
@@ -46,56 +81,125 @@ class FrameDisplay(tk.Frame):
         self.next_button.bind("<ButtonPress-1>", self.start_next_frame)
         self.next_button.bind("<ButtonRelease-1>", self.stop_next_frame)
 
+        # Play/Pause Button and playback speed
+        self.play_button = tk.Button(self.controls_frame, text="Play", command=self.toggle_playback)
+        self.play_button.pack(side=tk.LEFT, padx=5, pady=5)
+        self.speed_var = tk.StringVar(value="1x")
+        speed_labels = [f"{speed:g}x" for speed in PLAYBACK_SPEEDS]
+        self.speed_menu = tk.OptionMenu(self.controls_frame, self.speed_var, *speed_labels, command=self.set_play_speed)
+        self.speed_menu.pack(side=tk.LEFT, padx=5, pady=5)
+
         # Bind canvas events for cropping
         self.canvas.bind("<ButtonPress-1>", self.on_crop_start)
         self.canvas.bind("<B1-Motion>", self.on_crop_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_crop_end)
 
-    def update_canvas(self, frame):
+    def update_canvas(self, frame, source_size=None):
         """
         Update the canvas with the given frame. See if this can be reused in crop display?
+        source_size is the (width, height) of the full-resolution frame when frame is a smaller proxy of it,
+        so scale_x/scale_y map canvas pixels to full-resolution pixels either way.
         """
         if frame is not None:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # converts to BGR to RGB
-            img = Image.fromarray(frame_rgb)  # Creates image object
-
-            # Get canvas and image dimensions
-            canvas_width = self.canvas.winfo_width()
-            canvas_height = self.canvas.winfo_height()
-            img_width, img_height = img.size
-            self.scale_x = img_width / canvas_width  # Scaling X
-            self.scale_y = img_height / canvas_height  # Scaling Y
-
-            # Resize the image to fit the canvas
-            if canvas_width / img_width < canvas_height / img_height:
-                new_width = canvas_width
-                new_height = int(img_height * canvas_width / img_width)
-            else:
-                new_height = canvas_height
-                new_width = int(img_width * canvas_height / img_height)
-
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # Get canvas and image dimensions, the fitted size and scaling only change with them
+            canvas_width = max(1, self.canvas.winfo_width())
+            canvas_height = max(1, self.canvas.winfo_height())
+            img_width, img_height = source_size or (frame.shape[1], frame.shape[0])
+            layout = (canvas_width, canvas_height, img_width, img_height)
+            if layout != self.layout:
+                self.layout = layout
+                self.display_size = fit_size(img_width, img_height, canvas_width, canvas_height)
+                self.scale_x = img_width / self.display_size[0]  # Scaling X
+                self.scale_y = img_height / self.display_size[1]  # Scaling Y
 
-            # Update scaling factors
-            self.scale_x = img_width / new_width
-            self.scale_y = img_height / new_height
+            img = display_image(frame, *self.display_size)
 
-            # Display image on canvas
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=imgtk)
-            self.canvas.image = imgtk
+            # Display image on canvas, reusing the image item and, while the size is unchanged, its PhotoImage
+            if self.photo is not None and (self.photo.width(), self.photo.height()) == img.size:
+                self.photo.paste(img)
+            else:
+                self.photo = ImageTk.PhotoImage(image=img)
+                if self.image_item is None:
+                    self.image_item = self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
+                    self.canvas.tag_lower(self.image_item)  # Under the crop rectangle
+                else:
+                    self.canvas.itemconfigure(self.image_item, image=self.photo)
+                self.canvas.image = self.photo
             self.current_frame_var.set(f"Frame: {self.current_frame_index}")
 
     def get_current_frame_list(self):
         """
-        Return the list of frames based on the current frame source.
+        Return the list of frames based on the current frame source. Processed views are drawn over the
+        original frames, see draw_overlay.
+        """
+        return self.video_processor.frames
+
+    def show_frame(self, frame):
+        """
+        Show a frame from get_frame with the overlay of the current frame source and the detections of the
+        current frame.
+        """
+        if frame is not None:
+            source_size = self.video_processor.get_frame_size()
+            self.update_canvas(self.draw_overlay(frame, source_size), source_size)
+            detections, tracked = self.video_processor.detections.get(self.current_frame_index, ((), False))
+            self.draw_detections(detections, self.video_processor.detection_class_names, tracked)
+
+    def draw_detections(self, detections, class_names, tracked=False):
+        """
+        Draw detection boxes, rows of x1, y1, x2, y2, conf, class_id in full-resolution pixels, as canvas items
+        over the frame in place of the previous frame's. Tracked boxes are dashed. The frame is not drawn on.
+        """
+        self.clear_detections()
+        for x1, y1, x2, y2, _, class_id in detections:
+            x1, y1, x2, y2 = x1 / self.scale_x, y1 / self.scale_y, x2 / self.scale_x, y2 / self.scale_y
+            self.canvas.create_rectangle(x1, y1, x2, y2, outline='#00ff00', width=2, dash=(4, 2) if tracked else '',
+                                         state=self.layer_state('boxes'), tags=('detection', 'boxes'))
+            self.canvas.create_text(x1, y1 - 2, anchor=tk.SW, text=class_names[int(class_id)], fill='#00ff00',
+                                    state=self.layer_state('labels'), tags=('detection', 'labels'))
+
+    def clear_detections(self):
+        """
+        Remove the detections drawn over the frame.
+        """
+        self.canvas.delete('detection')
+
+    def layer_state(self, layer):
+        """
+        Canvas item state of a detection layer.
         """
-        if self.frame_source == 'original':
-            return self.video_processor.frames
-        elif self.frame_source == 'hough':
-            return self.video_processor.hough_frames
-        elif self.frame_source == 'contour':
-            return self.video_processor.contour_frames
+        return tk.NORMAL if self.layers[layer] else tk.HIDDEN
+
+    def set_layer(self, layer, visible):
+        """
+        Show or hide a detection layer, 'boxes' or 'labels'.
+        """
+        self.layers[layer] = visible
+        self.canvas.itemconfigure(layer, state=self.layer_state(layer))
+
+    def draw_overlay(self, frame, source_size=None):
+        """
+        Draw the hough lines or contours of the current frame over a copy of it, depending on the frame source.
+        The geometry is in full-resolution pixels, it is scaled to the frame if source_size is given.
+        """
+        if frame is None or self.frame_source == 'original':
+            return frame
+        if self.frame_source == 'hough':
+            geometry = self.video_processor.hough_frames
+        else:
+            geometry = self.video_processor.contour_frames
+        if self.current_frame_index >= len(geometry):
+            return frame  # not processed yet
+
+        scale = np.ones(2)
+        if source_size is not None:
+            scale = np.array([frame.shape[1] / source_size[0], frame.shape[0] / source_size[1]])
+        if self.frame_source == 'hough':
+            lines = np.reshape(geometry[self.current_frame_index], (-1, 2, 2)) * scale
+            return draw_lines(frame.copy(), np.round(lines).astype(np.int32))
+        points, counts = geometry[self.current_frame_index]
+        points = np.round(points * scale).astype(np.int32)
+        return draw_contours(frame.copy(), unpack_contours((points, counts)))
 
     def show_previous_frame(self):
         """
@@ -105,7 +209,7 @@ class FrameDisplay(tk.Frame):
         if self.current_frame_index > 0:
             self.current_frame_index -= 1
             frame = self.video_processor.get_frame(self.current_frame_index, frame_list)
-            self.update_canvas(frame)
+            self.show_frame(frame)
         if self.hold_prev:
             self.after(100, self.show_previous_frame)
 
@@ -117,14 +221,83 @@ class FrameDisplay(tk.Frame):
         if self.current_frame_index < len(frame_list) - 1:
             self.current_frame_index += 1
             frame = self.video_processor.get_frame(self.current_frame_index, frame_list)
-            self.update_canvas(frame)
+            self.show_frame(frame)
         if self.hold_next:
             self.after(100, self.show_next_frame)
 
+    def toggle_playback(self):
+        """
+        Play or pause the video.
+        """
+        if self.playback is not None:
+            self.pause()
+        else:
+            self.play()
+
+    def play(self):
+        """
+        Play from the current frame at play_speed times the video's frame rate, from the start if at the end.
+        """
+        frame_list = self.get_current_frame_list()
+        if len(frame_list) < 2:
+            return
+        if self.current_frame_index >= len(frame_list) - 1:
+            self.current_frame_index = 0
+            self.show_frame(self.video_processor.get_frame(0, frame_list))
+        self.playback = PlaybackClock(self.video_processor.get_fps(), self.play_speed, self.current_frame_index)
+        self.play_button.config(text="Pause")
+        self.play_tick()
+
+    def pause(self):
+        """
+        Stop playback on the current frame.
+        """
+        if self.play_after is not None:
+            self.after_cancel(self.play_after)
+            self.play_after = None
+        if self.playback is not None:
+            self.playback = None
+            self.play_button.config(text="Play")
+
+    def set_play_speed(self, label):
+        """
+        Set the playback speed from its menu label, e.g. "10x". Playback continues at the new speed.
+        """
+        self.play_speed = float(label.rstrip('x'))
+        if self.playback is not None:
+            self.pause()
+            self.play()
+
+    def play_tick(self):
+        """
+        Draw the frame due now and schedule the next draw, skipping frames if drawing falls behind.
+        """
+        self.play_after = None
+        playback = self.playback
+        if playback is None:
+            return
+        frame_list = self.get_current_frame_list()
+        index = min(playback.next_index(), len(frame_list) - 1)
+        if index > self.current_frame_index:
+            started = time.perf_counter()
+            self.current_frame_index = index
+            self.show_frame(self.video_processor.get_frame(index, frame_list))
+            self.update_idletasks()  # Redraw now, so the measured cost includes it
+            playback.frame_drawn(index, started)
+            self.video_processor.status_var.set(
+                f"Playing at {self.play_speed:g}x: {playback.achieved_fps():.1f} of {playback.target_fps:.1f} fps "
+                f"drawn, {playback.skipped} frames skipped")
+
+        if self.current_frame_index >= len(frame_list) - 1:
+            self.pause()
+        else:
+            self.play_after = self.after(max(1, round(playback.delay() * 1000)), self.play_tick)
+
     def start_previous_frame(self, event):
         """
         Start showing previous frames continuously when button is held.
         """
+        self.pause()
         self.hold_prev = True
         self.show_previous_frame()
 
@@ -138,6 +311,7 @@ class FrameDisplay(tk.Frame):
         """
         Start showing next frames continuously when button is held.
         """
+        self.pause()
         self.hold_next = True
         self.show_next_frame()
 
@@ -152,18 +326,20 @@ class FrameDisplay(tk.Frame):
         Display frames based on the specified source.
         :param frame_source: A string specifying the type of frames to display ('original', 'hough', 'contour')
         """
-        frame_list = getattr(self.video_processor, f"{frame_source}_frames", [])
+        self.pause()
+        self.frame_source = frame_source
         self.current_frame_index = 0
-        if frame_list:
-            self.update_canvas(self.video_processor.get_frame(self.current_frame_index, frame_list))
+        frame = self.video_processor.get_frame(self.current_frame_index, self.get_current_frame_list())
+        self.show_frame(frame)
 
     def show_original_frames(self):
         """
         Show the original frames.
         """
+        self.pause()
         self.frame_source = 'original'
         self.current_frame_index = 0
-        self.update_canvas(self.video_processor.get_frame(self.current_frame_index, self.video_processor.frames))
+        self.show_frame(self.video_processor.get_frame(self.current_frame_index, self.video_processor.frames))
 
     # def show_hough_frames(self):
     #     """
@@ -230,6 +406,8 @@ class FrameDisplay(tk.Frame):
         y1 = min(self.crop_start_y, event.y)
         x2 = max(self.crop_start_x, event.x)
         y2 = max(self.crop_start_y, event.y)
+        self.crop_box = (int(x1 * self.scale_x), int(y1 * self.scale_y), int(x2 * self.scale_x),
+                         int(y2 * self.scale_y))
 
         frames_before = simpledialog.askinteger("Input", "Enter frames before to crop:")
         frames_after = simpledialog.askinteger("Input", "Enter frames after to crop:")
@@ -241,4 +419,5 @@ class FrameDisplay(tk.Frame):
             if confirm:
                 self.video_processor.crop_frames(x1, y1, x2, y2, frames_before, frames_after, self.scale_x,
                                                  self.scale_y)
-                self.update_canvas(self.video_processor.get_frame(0, self.video_processor.frames))
+                self.update_canvas(self.video_processor.get_frame(0, self.video_processor.frames),
+                                   self.video_processor.get_frame_size())
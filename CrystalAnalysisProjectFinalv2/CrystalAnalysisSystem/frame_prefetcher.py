@@ -0,0 +1,117 @@
+import threading
+
+
+class FramePrefetcher:
+    """
+    Background thread that decodes a window of frames around the current frame of a
+    VideoFrameSource, so stepping through frames is served from the cache instead of stalling
+    on decode. Frames in the direction of navigation are decoded first. Indexing the prefetcher
+    reads frames through it, so it can stand in for the frame source. PS 2024
+    """
+    def __init__(self, frame_source, ahead=16, behind=4):
+        self.frame_source = frame_source
+        self.ahead = ahead
+        self.behind = behind
+        self.current_index = 0
+        self.direction = 1  # 1 when stepping forwards, -1 when stepping backwards
+        self.generation = 0  # bumped on every navigation so a stale window is abandoned
+        self.running = True
+        self.hits = 0
+        self.misses = 0
+        self.condition = threading.Condition()
+
+        # The cache must be able to hold the whole window or prefetched frames evict each other
+        self.frame_source.cache_size = max(self.frame_source.cache_size, ahead + behind + 1)
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.frame_source)
+
+    def __getitem__(self, index):
+        return self.get_frame(index)
+
+    def get_frame(self, index):
+        """
+        Return the frame at the given index, counting whether it had already been decoded.
+        """
+        if self.frame_source.is_cached(index):
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.update_position(index)
+        return self.frame_source[index]
+
+    def update_position(self, index):
+        """
+        Move the prefetch window to a new current frame.
+        """
+        with self.condition:
+            if index != self.current_index:
+                self.direction = 1 if index > self.current_index else -1
+            self.current_index = index
+            self.generation += 1
+            self.condition.notify()
+
+    def set_window(self, ahead, behind):
+        """
+        Change how many frames are decoded ahead of and behind the current frame.
+        """
+        with self.condition:
+            self.ahead = ahead
+            self.behind = behind
+            self.frame_source.cache_size = max(self.frame_source.cache_size, ahead + behind + 1)
+            self.generation += 1
+            self.condition.notify()
+
+    def window(self):
+        """
+        Frame indices to prefetch, in the order they should be decoded.
+        """
+        forward = [self.current_index + self.direction * i for i in range(1, self.ahead + 1)]
+        backward = [self.current_index - self.direction * i for i in range(1, self.behind + 1)]
+        return [i for i in forward + backward if 0 <= i < len(self.frame_source)]
+
+    def run(self):
+        """
+        Prefetch loop, restarts from the new window whenever the current frame changes.
+        """
+        seen_generation = -1
+        while True:
+            with self.condition:
+                while self.running and self.generation == seen_generation:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                seen_generation = self.generation
+                window = self.window()
+
+            for index in window:
+                if not self.running or self.generation != seen_generation:
+                    break
+                if not self.frame_source.is_cached(index):
+                    try:
+                        self.frame_source.read_frame(index)
+                    except IndexError:
+                        break  # header overestimated the frame count, nothing further to decode
+
+    def hit_rate(self):
+        """
+        Fraction of frame requests that were already decoded.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stop(self):
+        """
+        Stop the prefetch thread.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
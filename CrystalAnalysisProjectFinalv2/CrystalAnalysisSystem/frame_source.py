@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+
+
+class VideoFrameSource:
+    """
+    List-like access to the frames of a video file. Frames are decoded on demand by seeking
+    cv2.VideoCapture and the most recently used frames are kept in a bounded LRU cache,
+    so memory stays flat regardless of the length of the video. PS 2024
+
+    Random access seeks with CAP_PROP_POS_FRAMES. The FFmpeg backend decodes forward from the previous
+    keyframe, so this is frame-accurate, but with other backends seeking in inter-frame codecs (H.264,
+    MPEG-4) can land on a neighbouring frame. Reading frames in order never seeks and is always exact.
+    Where that matters, use the FrameStore, which decodes the video once in order.
+    """
+    def __init__(self, video_path, cache_size=64):
+        self.video_path = video_path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # frame index -> decoded frame
+        self.lock = threading.Lock()
+
+        # Only the header is read here, frames are decoded when they are indexed
+        self.capture = cv2.VideoCapture(video_path)
+        self.frame_count = max(0, int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.next_position = 0  # index of the frame the next capture.read() returns
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        return self.read_frame(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def is_cached(self, index):
+        """
+        Check whether the frame at the given index is already decoded.
+        """
+        return index in self.cache
+
+    def read_frame(self, index):
+        """
+        Return the frame at the given index, decoding it if it is not already cached.
+        """
+        with self.lock:
+            frame = self.cache.get(index)
+            if frame is not None:
+                self.cache.move_to_end(index)
+                return frame
+
+            # Seeking is expensive, only do it when the capture is not already positioned on the frame
+            if index != self.next_position:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = self.capture.read()
+            if not ret:
+                self.next_position = -1  # position unknown, seek on the next read
+                raise IndexError(f"could not decode frame {index}")
+            self.next_position = index + 1
+
+            self.cache[index] = frame
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)  # evict least recently used frame
+            return frame
+
+    def release(self):
+        """
+        Release the underlying video capture and drop all cached frames.
+        """
+        with self.lock:
+            self.cache.clear()
+            self.capture.release()
+
+
+class FrameSubset:
+    """
+    List-like view of selected frames of a frame source, e.g. only the frames missing from the result cache.
+    """
+    def __init__(self, frames, indices):
+        self.frames = frames
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        return self.frames[self.indices[index]]
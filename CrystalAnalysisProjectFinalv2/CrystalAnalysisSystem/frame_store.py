@@ -0,0 +1,126 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.utils import hash_file
+
+
+class FrameStore:
+    """
+    Persistent on-disk copy of a video's frames. The video is decoded once into a memory-mapped
+    array with a small JSON header (shape, dtype, fps, source hash); later opens of the same video
+    map the file instantly and the OS page cache decides which frames stay resident. PS 2024
+    """
+    HEADER_VERSION = 1
+
+    def __init__(self, video_path, store_dir="store"):
+        self.video_path = video_path
+        self.store_dir = store_dir
+        self.video_hash = hash_file(video_path)
+        self.header_path = os.path.join(store_dir, f"{self.video_hash}.json")
+        self.data_path = os.path.join(store_dir, f"{self.video_hash}.frames")
+        self.array = None
+        self.fps = 0
+
+        # Create store directory if it doesn't exist
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir)
+
+    def __len__(self):
+        return 0 if self.array is None else len(self.array)
+
+    def __getitem__(self, index):
+        # Plain ndarray views of the map, slicing them (e.g. for cropping) copies nothing
+        if isinstance(index, slice):
+            return [np.asarray(frame) for frame in self.array[index]]
+        return np.asarray(self.array[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def read_header(self):
+        """
+        Return the header of the stored frames, or None if the video has not been stored yet.
+        """
+        if not (os.path.exists(self.header_path) and os.path.exists(self.data_path)):
+            return None
+        with open(self.header_path) as f:
+            header = json.load(f)
+        if header.get('version') != self.HEADER_VERSION or header.get('source_hash') != self.video_hash:
+            return None
+        return header
+
+    def is_built(self):
+        """
+        Check whether the frames of this video are already in the store.
+        """
+        return self.read_header() is not None
+
+    def build(self, progress_callback=None):
+        """
+        Decode the whole video once into the memory-mapped frame file.
+        progress_callback(frame_index, total_frames) is called after each decoded frame, and may raise to
+        cancel the build. A failed or cancelled build leaves no partial file behind.
+        """
+        cap = cv2.VideoCapture(self.video_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+
+        ret, frame = cap.read()
+        if not ret or total_frames <= 0:
+            cap.release()
+            raise ValueError(f"Could not decode {self.video_path}")
+
+        # Write to a temporary file first so an interrupted build never looks complete
+        frame_shape, frame_dtype = frame.shape, frame.dtype
+        temp_path = self.data_path + ".partial"
+        array = np.memmap(temp_path, dtype=frame_dtype, mode='w+', shape=(total_frames,) + frame_shape)
+        frame_index = 0
+        try:
+            while ret and frame_index < total_frames:
+                array[frame_index] = frame
+                frame_index += 1
+                if progress_callback is not None:
+                    progress_callback(frame_index, total_frames)
+                ret, frame = cap.read()
+            array.flush()
+        except BaseException:
+            del array
+            os.remove(temp_path)
+            raise
+        finally:
+            cap.release()
+        del array
+
+        # The header count can overestimate, only the decoded frames are recorded
+        os.replace(temp_path, self.data_path)
+        header = {
+            'version': self.HEADER_VERSION,
+            'shape': [frame_index] + list(frame_shape),
+            'dtype': str(frame_dtype),
+            'fps': fps,
+            'source_hash': self.video_hash,
+        }
+        with open(self.header_path, 'w') as f:
+            json.dump(header, f)
+
+    def open(self):
+        """
+        Map the stored frames. Copy-on-write mode, so drawing on a frame never modifies the store.
+        """
+        header = self.read_header()
+        if header is None:
+            raise FileNotFoundError(f"{self.video_path} has not been stored in {self.store_dir}")
+        self.array = np.memmap(self.data_path, dtype=np.dtype(header['dtype']), mode='c',
+                               shape=tuple(header['shape']))
+        self.fps = header['fps']
+        return self
+
+    def release(self):
+        """
+        Unmap the stored frames.
+        """
+        self.array = None
@@ -1,6 +1,4 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import cv2
 from tkinter import messagebox
@@ -10,8 +8,9 @@ class GrowthRateCalculator:
     """
     Class for calculating the growth rate based on given analysis data. PS 2024
     """
-    def __init__(self, log_dir):
+    def __init__(self, log_dir, interactive=True):
         self.log_dir = log_dir
+        self.interactive = interactive  # False for headless runs: print results instead of showing dialogs
 
     def calculate_growth_rate(self, crystal_data, use_hypotenuse=False):
         """
@@ -20,6 +19,10 @@ class GrowthRateCalculator:
         If use_hypotenuse = True, it calculates growth rate based on the hypotenuse (width and height).
         If use_hypotenuse = False, it calculates growth rate based on width only.
         """
+        # pandas and matplotlib are slow to import, so they are loaded on first use rather than at startup
+        import pandas as pd
+        import matplotlib.pyplot as plt
+
         df = pd.DataFrame(crystal_data)  # Convert crystal data to a pandas DataFrame
 
         if use_hypotenuse:
@@ -58,18 +61,18 @@ class GrowthRateCalculator:
         med_micron_per_second = df_grouped['micron_per_second'].median()
 
         # Display the growth rate and actual pixel change
-        messagebox.showinfo("Growth Rate",
-                            f"Average Growth Rate: {avg_growth_rate:.2f}% or {avg_pixel_change:.2f} pixels/frame\n"
-                            f"Median Growth Rate: {med_growth_rate:.2f}% or {med_pixel_change:.2f} pixels/frame\n"
-                            f"Average Micron Change: {avg_micron_per_second:.2f} µm/s\n"
-                            f"Median Micron Change: {med_micron_per_second:.2f} µm/s\n")
-
-        # Generate a unique filename for log and graph files
-        # Generate a unique filename for log and graph files
+        self.show_info("Growth Rate",
+                       f"Average Growth Rate: {avg_growth_rate:.2f}% or {avg_pixel_change:.2f} pixels/frame\n"
+                       f"Median Growth Rate: {med_growth_rate:.2f}% or {med_pixel_change:.2f} pixels/frame\n"
+                       f"Average Micron Change: {avg_micron_per_second:.2f} µm/s\n"
+                       f"Median Micron Change: {med_micron_per_second:.2f} µm/s\n")
+
+        # Generate a unique filename for log and graph files, in a log directory created when first written to
+        os.makedirs(self.log_dir, exist_ok=True)
         log_file = self.generate_filename(self.log_dir, base_filename, extension=".csv")
         graph_file = self.generate_filename(self.log_dir, base_filename, extension=".png")
 
-        messagebox.showinfo("Save Successful", f"Analysis data saved to" f" {log_file} and {graph_file}")
+        self.show_info("Save Successful", f"Analysis data saved to" f" {log_file} and {graph_file}")
 
         # Save log to file
         df.to_csv(log_file, index=False)
@@ -85,11 +88,24 @@ class GrowthRateCalculator:
         # Save the plot as an image file BEFORE show.
         plt.savefig(graph_file)
 
-        plt.show()
+        if self.interactive:
+            plt.show()
 
         plt.clf()  # Clear figure
 
-        cv2.destroyAllWindows()
+        if self.interactive:
+            cv2.destroyAllWindows()
+
+        return log_file, graph_file
+
+    def show_info(self, title, message):
+        """
+        Show a message in a dialog, or print it when running headless.
+        """
+        if self.interactive:
+            messagebox.showinfo(title, message)
+        else:
+            print(f"{title}: {message}")
 
     def generate_filename(self, directory, base_name, extension):
         """
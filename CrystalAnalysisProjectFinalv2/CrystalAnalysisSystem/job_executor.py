@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job by Job.check_cancelled once the job has been cancelled.
+    """
+
+
+class Job:
+    """
+    Handle on a job run by JobExecutor. The job's function uses it to report progress and partial results
+    and to check whether it has been cancelled; the GUI uses it to cancel the job. PS 2024
+    """
+    def __init__(self, executor, name, callbacks):
+        self.executor = executor
+        self.name = name
+        self.callbacks = callbacks  # on_progress, on_partial, on_done, on_error and on_cancel, run on the Tk thread
+        self.cancel_event = threading.Event()
+        self.last_progress = 0  # Time progress was last posted
+        self.done = False  # Set on the Tk thread once the final event has been delivered
+
+    def progress(self, value, maximum, message=None):
+        """
+        Report progress, with a status message if given. Reports without a message closer together than the
+        executor's progress_interval are dropped, except the last one.
+        """
+        now = time.perf_counter()
+        if message is None and value < maximum and now - self.last_progress < self.executor.progress_interval:
+            return
+        self.last_progress = now
+        self.executor.post(self, 'progress', (value, maximum, message))
+
+    def partial(self, result):
+        """
+        Post a partial result, e.g. the newest processed frame. Only the newest since the last poll is delivered.
+        """
+        self.executor.post(self, 'partial', result)
+
+    def cancel(self):
+        """
+        Ask the job to stop. It stops the next time it checks, then on_cancel is called instead of on_done.
+        """
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """
+        Raise JobCancelled if the job has been cancelled, ending it.
+        """
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+
+class JobExecutor:
+    """
+    Runs long operations on worker threads instead of the Tk mainloop. Jobs post progress, partial results
+    and completion through a thread-safe queue that the Tk thread polls with after(), so every callback
+    runs on the Tk thread. Progress and partial results are coalesced, keeping UI updates to a few per
+    second however fast the job reports. PS 2024
+    """
+    def __init__(self, widget, workers=2, poll_interval=50, progress_interval=0.2):
+        self.widget = widget  # Tk widget whose after() polls the event queue
+        self.poll_interval = poll_interval  # Milliseconds between polls while jobs are running
+        self.progress_interval = progress_interval  # Seconds between progress reports of a job
+        self.events = queue.Queue()  # (job, kind, value) posted by the worker threads
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="job")
+        self.jobs = []  # Jobs whose final event hasn't been delivered
+        self.poll_id = None
+
+    def submit(self, name, function, *args, on_progress=None, on_partial=None, on_done=None, on_error=None,
+               on_cancel=None):
+        """
+        Run function(job, *args) on a worker thread and return its Job. on_done(result) is called with what
+        it returns, on_error(error) if it raises (by default an error dialog) and on_cancel() if it is
+        cancelled. on_progress(value, maximum, message) and on_partial(result) follow Job.progress/partial.
+        """
+        callbacks = {'progress': on_progress, 'partial': on_partial, 'done': on_done, 'error': on_error,
+                     'cancelled': on_cancel}
+        job = Job(self, name, callbacks)
+        self.jobs.append(job)
+        self.pool.submit(self.run, job, function, args)
+        self.schedule_poll()
+        return job
+
+    def run(self, job, function, args):
+        """
+        Worker thread: run a job's function and post how it ended.
+        """
+        try:
+            result = function(job, *args)
+        except JobCancelled:
+            self.post(job, 'cancelled', None)
+        except Exception as error:
+            self.post(job, 'error', error)
+        else:
+            self.post(job, 'cancelled' if job.cancelled else 'done', result)
+
+    def post(self, job, kind, value):
+        self.events.put((job, kind, value))
+
+    def schedule_poll(self):
+        if self.poll_id is None:
+            self.poll_id = self.widget.after(self.poll_interval, self.poll)
+
+    def poll(self):
+        """
+        Deliver the queued events, then poll again while jobs are running.
+        """
+        self.poll_id = None
+        try:
+            self.deliver()
+        finally:
+            if self.jobs:
+                self.schedule_poll()
+
+    def deliver(self):
+        """
+        Call the callbacks of the queued events on this thread. Of each job's progress and partial
+        results only the newest is delivered.
+        """
+        latest = {}  # (job, kind) -> newest progress or partial result
+        finished = []
+        while True:
+            try:
+                job, kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind in ('progress', 'partial'):
+                latest[(job, kind)] = value
+            else:
+                finished.append((job, kind, value))
+
+        for (job, kind), value in latest.items():
+            if not job.done:
+                self.call(job, kind, value)
+        for job, kind, value in finished:
+            job.done = True
+            self.jobs.remove(job)
+            self.call(job, kind, value)
+
+    def call(self, job, kind, value):
+        """
+        Call a job's callback for an event. An error raised by the callback is shown rather than raised, so
+        the events queued after it are still delivered.
+        """
+        callback = job.callbacks[kind]
+        try:
+            if kind == 'progress':
+                if callback is not None:
+                    callback(*value)
+            elif kind == 'cancelled':
+                if callback is not None:
+                    callback()
+            elif callback is not None:
+                callback(value)
+            elif kind == 'error':
+                messagebox.showerror("Error", f"{job.name} failed: {value}")
+        except Exception as error:
+            messagebox.showerror("Error", f"{job.name} failed: {error}")
+
+    def drain(self, timeout=None):
+        """
+        Wait for every job to finish, delivering their events on the calling thread. For shutdown and tests.
+        Returns False if jobs are still running after timeout seconds.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.jobs:
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            time.sleep(0.01)
+            self.deliver()
+        return True
+
+    def cancel_all(self):
+        """
+        Cancel every running job.
+        """
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self):
+        """
+        Cancel running jobs and stop polling. Worker threads finish once their jobs notice the cancellation.
+        """
+        self.cancel_all()
+        if self.poll_id is not None:
+            self.widget.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.pool.shutdown(wait=False, cancel_futures=True)
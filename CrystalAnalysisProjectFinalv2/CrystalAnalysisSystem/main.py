@@ -13,12 +13,41 @@ Purpose: This application is intended to be developed in combination with a proj
 to demonstrate "the use of artificial intelligence techniques for the analysis of crystal growth"
 """
 
+import time
+
+start_time = time.perf_counter()
+
+import argparse
+
 from CrystalAnalysisSystem.controller import CrystalAnalysisController
 
 """
     Please Run From Here!
 """
 
+
+def measure_startup():
+    """
+    Print how long the imports and first window took, then exit. Run with --measure-startup to track regressions.
+    """
+    import_time = time.perf_counter() - start_time
+    app = CrystalAnalysisController(warm_up=False)
+    app.update()  # map and draw the window
+    window_time = time.perf_counter() - start_time
+    app.destroy()
+    print(f"Imports: {import_time:.3f} s")
+    print(f"Time to first window: {window_time:.3f} s")
+
+
 if __name__ == "__main__":
-    app = CrystalAnalysisController()
-    app.mainloop()
+    parser = argparse.ArgumentParser(description="Phil's Crystal Analysis System")
+    parser.add_argument('--measure-startup', action='store_true', help="print the startup time and exit")
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help="load the detection model on first use instead of in the background at startup")
+    args = parser.parse_args()
+
+    if args.measure_startup:
+        measure_startup()
+    else:
+        app = CrystalAnalysisController(warm_up=not args.no_warm_up)
+        app.mainloop()
@@ -0,0 +1,160 @@
+import ast
+import os
+
+import cv2
+import numpy as np
+
+# ultralytics predict defaults, so ONNX Runtime detections match the PyTorch model's
+ONNX_PARAMS = {
+    'conf': 0.25,
+    'iou': 0.7,
+    'max_det': 300,
+    'pad_value': 114,
+}
+
+
+def is_up_to_date(path, source_path):
+    """
+    True if path exists and is newer than the file it was made from.
+    """
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+def export_onnx(model_path, int8=False, imgsz=640):
+    """
+    Export a YOLO .pt model to ONNX next to it, optionally with INT8 quantized weights, and return the
+    path of the exported model. An .onnx model is only quantized. Exports newer than the model are reused.
+    """
+    onnx_path = os.path.splitext(model_path)[0] + '.onnx'
+    if not model_path.endswith('.onnx') and not is_up_to_date(onnx_path, model_path):
+        from ultralytics import YOLO
+        # Dynamic input shapes let detect_batch pass several frames per call
+        exported_path = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        if os.path.abspath(exported_path) != os.path.abspath(onnx_path):
+            os.replace(exported_path, onnx_path)
+    if not int8 or onnx_path.endswith('.int8.onnx'):
+        return onnx_path
+
+    int8_path = os.path.splitext(onnx_path)[0] + '.int8.onnx'
+    if not is_up_to_date(int8_path, onnx_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def letterbox(image, size):
+    """
+    Resize an image to fit size (height, width) keeping its aspect ratio and pad the rest, as ultralytics
+    does before inference. Returns the padded image.
+    """
+    height, width = image.shape[:2]
+    ratio = min(size[0] / height, size[1] / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    pad_x, pad_y = (size[1] - new_width) / 2, (size[0] - new_height) / 2
+
+    if (width, height) != (new_width, new_height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    value = (ONNX_PARAMS['pad_value'],) * 3
+    return cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=value)
+
+
+def inference_size(shape, imgsz, stride=32):
+    """
+    Smallest input size (height, width) holding an image of the given shape scaled to fit imgsz, padded to
+    a multiple of stride, as ultralytics letterboxes frames for PyTorch models.
+    """
+    height, width = shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_height, new_width = int(round(height * ratio)), int(round(width * ratio))
+    return new_height + (imgsz - new_height) % stride, new_width + (imgsz - new_width) % stride
+
+
+def postprocess(prediction, input_size, image_shape, conf=None):
+    """
+    Convert the raw predictions of one image, shaped (4 + classes, candidates) with boxes as centre x/y,
+    width and height in model input pixels, into an N x 6 array of x1, y1, x2, y2, conf, class_id rows in
+    image pixels. Candidates are filtered by confidence, conf or ONNX_PARAMS['conf'], and class-wise
+    non-maximum suppression.
+    """
+    conf = ONNX_PARAMS['conf'] if conf is None else conf
+    prediction = prediction.T
+    class_scores = prediction[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    confidences = class_scores[np.arange(len(class_scores)), class_ids]
+    keep = confidences > conf
+    boxes, confidences, class_ids = prediction[keep, :4], confidences[keep], class_ids[keep]
+    if not len(boxes):
+        return np.zeros((0, 6), np.float32)
+
+    # NMSBoxesBatched takes top left x/y, width and height and keeps classes apart
+    corner_boxes = np.column_stack((boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2,
+                                    boxes[:, 2], boxes[:, 3]))
+    kept = cv2.dnn.NMSBoxesBatched(corner_boxes.tolist(), confidences.tolist(), class_ids.tolist(),
+                                   conf, ONNX_PARAMS['iou'], top_k=ONNX_PARAMS['max_det'])
+    kept = np.asarray(kept, dtype=int).reshape(-1)
+
+    # Undo the letterbox, as ultralytics scale_boxes does
+    height, width = image_shape[:2]
+    gain = min(input_size[0] / height, input_size[1] / width)
+    pad_x = round((input_size[1] - width * gain) / 2 - 0.1)
+    pad_y = round((input_size[0] - height * gain) / 2 - 0.1)
+    x1 = (corner_boxes[kept, 0] - pad_x) / gain
+    y1 = (corner_boxes[kept, 1] - pad_y) / gain
+    x2 = x1 + corner_boxes[kept, 2] / gain
+    y2 = y1 + corner_boxes[kept, 3] / gain
+    detections = np.column_stack((x1.clip(0, width), y1.clip(0, height), x2.clip(0, width), y2.clip(0, height),
+                                  confidences[kept], class_ids[kept]))
+    return detections.astype(np.float32)
+
+
+class OnnxModel:
+    """
+    A YOLO detection model exported to ONNX, run on the CPU with ONNX Runtime instead of PyTorch.
+    Frames are letterboxed and predictions filtered the way ultralytics does, so detections come out
+    in the same x1, y1, x2, y2, conf, class_id format. PS 2024
+    """
+    def __init__(self, model_path, threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exports with a fixed batch size take that many frames per run, dynamic ones take any number
+        self.max_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        # Dynamic exports also take any input size, so frames are padded no more than needed
+        self.dynamic_size = not all(isinstance(size, int) for size in model_input.shape[2:4])
+
+        # ultralytics stores class names and input size in the model metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+        if 'imgsz' in metadata:
+            self.input_size = tuple(ast.literal_eval(metadata['imgsz']))
+        else:
+            self.input_size = tuple(model_input.shape[2:4])
+
+    def predict(self, frames, imgsz=None, conf=None):
+        """
+        Detect crystals in a list of equally sized BGR frames, returning an N x 6 detection array for each
+        frame. imgsz sets the longest side of the model input if the export has a dynamic input size.
+        conf is the confidence threshold, by default ONNX_PARAMS['conf'].
+        """
+        input_size = self.input_size
+        if self.dynamic_size and frames:
+            input_size = inference_size(frames[0].shape, imgsz or max(self.input_size))
+
+        detections = []
+        step = self.max_batch or len(frames)
+        for start in range(0, len(frames), step):
+            batch = frames[start:start + step]
+            blob = np.stack([letterbox(frame, input_size) for frame in batch])
+            blob = np.ascontiguousarray(blob[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255  # BGR to RGB
+            predictions = self.session.run(None, {self.input_name: blob})[0]
+            detections.extend(postprocess(prediction, input_size, frame.shape, conf)
+                              for prediction, frame in zip(predictions, batch))
+        return detections
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.frame_store import FrameStore
+from CrystalAnalysisSystem.utils import frame_pipeline, draw_lines, draw_contours
+
+
+def init_worker():
+    """
+    Worker process setup. Each worker handles its own frames, OpenCV threading would only oversubscribe.
+    """
+    cv2.setNumThreads(1)
+
+
+def stored_frames(frames):
+    """
+    The FrameStore holding a list of frames and the store index of each frame, for a FrameStore or a view of
+    one with frames and indices attributes (FrameSubset, batch.FrameRange). (None, None) if the frames are not
+    in a store.
+    """
+    if isinstance(getattr(frames, 'frames', None), FrameStore):
+        return frames.frames, list(frames.indices)
+    if isinstance(frames, FrameStore):
+        return frames, list(range(len(frames)))
+    return None, None
+
+
+def process_frame_block(block, start, stop, outputs, cache_dir=None, first_frame_index=0):
+    """
+    Run frame_pipeline over frames [start, stop) of a block of frames held in shared memory and
+    return the requested stage outputs for each frame. Runs in a worker process.
+    """
+    if block['kind'] == 'memmap':
+        # A frame store is already shared between processes through the OS page cache
+        shm = None
+        frames = np.memmap(block['path'], dtype=block['dtype'], mode='r', shape=block['shape'])
+    else:
+        shm = shared_memory.SharedMemory(name=block['name'])
+        frames = np.ndarray(block['shape'], dtype=block['dtype'], buffer=shm.buf)
+
+    try:
+        results = []
+        for i in range(start, stop):
+            if shm is None:
+                frame = frames[block['indices'][i - start]]
+            else:
+                frame = frames[i - block['offset']]
+            run = frame_pipeline.process(frame)
+            results.append(tuple(run[name] for name in outputs))
+
+            if cache_dir is not None:
+                frame_index = first_frame_index + i
+                if 'lines' in outputs:
+                    cv2.imwrite(os.path.join(cache_dir, f"hough_frame_{frame_index}.png"),
+                                draw_lines(frame.copy(), run['lines']))
+                if 'contours' in outputs:
+                    cv2.imwrite(os.path.join(cache_dir, f"contour_frame_{frame_index}.png"),
+                                draw_contours(frame.copy(), run['contours']))
+        return results
+    finally:
+        del frames
+        if shm is not None:
+            shm.close()
+
+
+class ParallelFrameProcessor:
+    """
+    Runs frame_pipeline stages over every frame of a video in a pool of worker processes.
+    Decoded frames are handed to the workers through shared memory segments instead of being
+    pickled, and results are returned in frame order. Frames in a FrameStore, or a FrameSubset of one, are
+    read by the workers straight from the store file. PS 2024
+    """
+    def __init__(self, workers=None, frames_per_task=2):
+        self.workers = workers or os.cpu_count()
+        self.frames_per_task = frames_per_task
+        self.max_in_flight = self.workers * 2  # keeps every worker busy while bounding shared memory use
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_worker)
+
+    def map(self, frames, outputs, progress_callback=None, cache_dir=None, first_frame_index=0):
+        """
+        Return a list with a tuple of the requested stage outputs for each frame, in frame order.
+        progress_callback(frames_done, total_frames) is called as tasks complete. With a cache_dir, the
+        workers also save each frame with its results drawn on it, numbered from first_frame_index.
+        """
+        total_frames = len(frames)
+        results = [None] * total_frames
+        if total_frames == 0:
+            return results
+
+        store, store_indices = stored_frames(frames)
+        segments = []
+        free_segments = []
+        pending = {}
+        next_start = 0
+        frames_done = 0
+        try:
+            while next_start < total_frames or pending:
+                while next_start < total_frames and len(pending) < self.max_in_flight:
+                    stop = min(next_start + self.frames_per_task, total_frames)
+                    if store is not None:
+                        # Workers map the store file themselves, no frames are copied
+                        segment = None
+                        block = {'kind': 'memmap', 'path': store.data_path, 'dtype': store.array.dtype.str,
+                                 'shape': store.array.shape, 'indices': store_indices[next_start:stop]}
+                    else:
+                        segment = free_segments.pop() if free_segments else self.create_segment(frames[0], segments)
+                        block = self.fill_segment(segment, frames, next_start, stop)
+                    future = self.executor.submit(process_frame_block, block, next_start, stop, outputs, cache_dir,
+                                                  first_frame_index)
+                    pending[future] = (segment, next_start)
+                    next_start = stop
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    segment, start = pending.pop(future)
+                    block_results = future.result()
+                    results[start:start + len(block_results)] = block_results
+                    if segment is not None:
+                        free_segments.append(segment)
+                    frames_done += len(block_results)
+                    if progress_callback is not None:
+                        progress_callback(frames_done, total_frames)
+        finally:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+        return results
+
+    def create_segment(self, sample_frame, segments):
+        """
+        Allocate a shared memory segment big enough for one task's frames.
+        """
+        segment = shared_memory.SharedMemory(create=True, size=sample_frame.nbytes * self.frames_per_task)
+        segments.append(segment)
+        return segment
+
+    def fill_segment(self, segment, frames, start, stop):
+        """
+        Copy frames [start, stop) into a shared memory segment and describe it for a worker.
+        """
+        sample_frame = frames[start]
+        shape = (stop - start,) + sample_frame.shape
+        block_array = np.ndarray(shape, dtype=sample_frame.dtype, buffer=segment.buf)
+        for i in range(start, stop):
+            block_array[i - start] = frames[i]
+        del block_array
+        return {'kind': 'shm', 'name': segment.name, 'dtype': sample_frame.dtype.str, 'shape': shape, 'offset': start}
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,41 @@
+class Pipeline:
+    """
+    Small graph of named image processing stages. Each stage names the stages it takes as input,
+    'image' being the frame itself. PS 2024
+    """
+    def __init__(self):
+        self.stages = {}  # stage name -> (function, input stage names)
+
+    def add_stage(self, name, function, inputs=('image',)):
+        """
+        Register a stage computing function(*outputs of inputs).
+        """
+        self.stages[name] = (function, tuple(inputs))
+
+    def process(self, image):
+        """
+        Start processing a frame. Stages are computed when they are first requested.
+        """
+        return PipelineRun(self, image)
+
+
+class PipelineRun:
+    """
+    The outputs of a pipeline for a single frame. Each stage is computed at most once, so analyses
+    sharing a stage (e.g. a preprocessed mask) only pay for it once per frame. PS 2024
+    """
+    def __init__(self, pipeline, image):
+        self.pipeline = pipeline
+        self.outputs = {'image': image}
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name):
+        """
+        Return the output of the named stage, computing it and its inputs if needed.
+        """
+        if name not in self.outputs:
+            function, inputs = self.pipeline.stages[name]
+            self.outputs[name] = function(*[self.get(stage) for stage in inputs])
+        return self.outputs[name]
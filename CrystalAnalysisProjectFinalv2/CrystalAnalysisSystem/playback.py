@@ -0,0 +1,59 @@
+import time
+from collections import deque
+
+PLAYBACK_SPEEDS = (0.25, 0.5, 1, 2, 5, 10, 20, 50)  # Multiples of the video's frame rate offered for playback
+
+
+class PlaybackClock:
+    """
+    Keeps timed playback on schedule: frame start_index is due when playback starts and the following
+    frames fps * speed per second of wall time after it. Each draw shows the frame that will be due once
+    it is on screen, going by the measured cost of drawing, so when drawing can't keep up frames are
+    skipped rather than the video falling behind. Also measures the achieved drawing rate. PS 2024
+    """
+    def __init__(self, fps, speed=1.0, start_index=0, clock=time.perf_counter):
+        self.target_fps = fps * speed  # Video frames per second of wall time
+        self.clock = clock
+        self.start_time = clock()
+        self.start_index = start_index
+        self.last_index = start_index  # Last frame drawn
+        self.render_cost = 0.0  # Smoothed seconds a draw takes
+        self.drawn = 0
+        self.skipped = 0
+        self.draw_times = deque()  # Times of the draws in the last second
+
+    def next_index(self):
+        """
+        Index of the frame to draw now, the one due when the draw will be finished.
+        """
+        elapsed = self.clock() - self.start_time + self.render_cost
+        return self.start_index + int(elapsed * self.target_fps + 1e-6)  # a frame due now, despite rounding
+
+    def frame_drawn(self, index, started):
+        """
+        Record that the frame at index was drawn, the draw having started at clock time started.
+        """
+        now = self.clock()
+        cost = now - started
+        self.render_cost = cost if self.drawn == 0 else 0.8 * self.render_cost + 0.2 * cost
+        self.skipped += max(0, index - self.last_index - 1)
+        self.last_index = index
+        self.drawn += 1
+        self.draw_times.append(now)
+        while self.draw_times[0] < now - 1:
+            self.draw_times.popleft()
+
+    def delay(self):
+        """
+        Seconds until the frame after the last one drawn should start drawing.
+        """
+        due = self.start_time + (self.last_index + 1 - self.start_index) / self.target_fps - self.render_cost
+        return max(0.0, due - self.clock())
+
+    def achieved_fps(self):
+        """
+        Frames drawn per second over the last second.
+        """
+        if len(self.draw_times) < 2:
+            return 0.0
+        return (len(self.draw_times) - 1) / (self.draw_times[-1] - self.draw_times[0])
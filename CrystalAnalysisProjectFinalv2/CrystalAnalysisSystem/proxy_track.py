@@ -0,0 +1,197 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from CrystalAnalysisSystem.frame_store import FrameStore
+
+
+def proxy_size(frame_size, max_size):
+    """
+    Size (width, height) of a frame scaled down to fit max_size (width, height), keeping its aspect ratio.
+    Frames smaller than max_size keep their size.
+    """
+    width, height = frame_size
+    ratio = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+class ProxyTrack:
+    """
+    Display-sized copies of the frames of a video, for browsing without touching the full-resolution frames.
+    A background thread makes a proxy of every frame, scaled to fit max_size and JPEG-compressed at quality
+    (PNG if quality is None). It reads frames in a FrameStore from the store, other videos it decodes once,
+    in order, with its own capture. Given a result cache, proxies are kept in it under its disk quota, so
+    reopening a video finds them made. Only the most recently used cache_size are held in memory, and
+    without a result cache the thread stops once it has made that many. Frames not made yet are made from
+    the full-resolution frames when they are asked for. PS 2024
+    """
+    def __init__(self, frames, video_path, frame_size, max_size=(640, 480), quality=85, result_cache=None,
+                 video_hash=None, cache_size=256):
+        self.frames = frames  # Full-resolution frames, for proxies asked for before the thread reaches them
+        self.video_path = video_path
+        self.quality = quality
+        self.frame_size = tuple(frame_size)  # Full-resolution frame size, proxies map back to it exactly
+        self.size = proxy_size(self.frame_size, max_size)
+        self.frame_count = len(frames)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # frame index -> encoded proxy, least recently used first
+        self.lock = threading.Lock()  # The background thread and the GUI thread both make proxies
+        self.result_cache = result_cache if video_hash is not None else None  # Proxies kept on disk, if any
+        self.video_hash = video_hash
+        self.params = {'size': list(self.size), 'quality': quality}  # Proxies of another size or quality differ
+        self.batch_size = 32  # Proxies the background thread writes to the result cache at once
+        self.built = 0  # Frames the background thread has been through
+        self.running = False
+        self.thread = threading.Thread(target=self.build, daemon=True)
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, index):
+        """
+        The proxy frame at the given index, a BGR array of self.size that the caller may draw on.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        return cv2.imdecode(self.read_proxy(index), cv2.IMREAD_COLOR)
+
+    def is_built(self, index):
+        """
+        Check whether the proxy of the frame at the given index has been made.
+        """
+        if index in self.cache:
+            return True
+        return self.result_cache is not None and index in self.stored_frames()
+
+    def stored_frames(self):
+        """
+        Indices of the frames whose proxies are in the result cache.
+        """
+        return self.result_cache.cached_frames(self.video_hash, 'proxy', self.params)
+
+    def read_proxy(self, index):
+        """
+        Return the encoded proxy of the frame at the given index, from memory, from the result cache, or made now.
+        """
+        with self.lock:
+            encoded = self.cache.get(index)
+            if encoded is not None:
+                self.cache.move_to_end(index)
+                return encoded
+
+        if self.result_cache is not None:
+            encoded = self.result_cache.get(self.video_hash, index, 'proxy', self.params)
+        if encoded is None:
+            encoded = self.make_proxy(self.frames[index])
+            if self.result_cache is not None:
+                self.result_cache.put(self.video_hash, index, 'proxy', self.params, encoded)
+        self.remember(index, encoded)
+        return encoded
+
+    def remember(self, index, encoded):
+        """
+        Hold an encoded proxy in memory, evicting the least recently used if there are more than cache_size.
+        """
+        with self.lock:
+            self.cache[index] = encoded
+            self.cache.move_to_end(index)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def make_proxy(self, frame):
+        """
+        Scale a full-resolution frame down to the proxy size and encode it.
+        """
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if self.quality is None:
+            ok, encoded = cv2.imencode('.png', frame)
+        else:
+            ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise ValueError("could not encode proxy frame")
+        return encoded
+
+    def scale_to_proxy(self):
+        """
+        Factors (x, y) mapping full-resolution frame pixels to proxy pixels.
+        """
+        return self.size[0] / self.frame_size[0], self.size[1] / self.frame_size[1]
+
+    def start(self):
+        """
+        Start making proxies in the background.
+        """
+        self.running = True
+        self.thread.start()
+        return self
+
+    def build(self):
+        """
+        Background thread: make the proxy of every frame not made yet, reading stored frames from the frame
+        store and decoding other videos in order.
+        """
+        if self.result_cache is None:
+            end = min(self.frame_count, self.cache_size)  # no more than memory holds
+            made = set()
+        else:
+            end = self.frame_count
+            made = self.stored_frames()  # made when the video was last opened
+        missing = [index for index in range(end) if index not in made and index not in self.cache]
+        if not missing:
+            self.built = end
+            self.running = False
+            return
+
+        store = self.frames if isinstance(self.frames, FrameStore) else None
+        capture = cv2.VideoCapture(self.video_path) if store is None else None
+        made = set(range(end)) - set(missing)
+        pending = []  # Proxies not written to the result cache yet
+        try:
+            for index in range(missing[-1] + 1):
+                if not self.running:
+                    return
+                if index in made or index in self.cache:
+                    # Keep the capture in step with the frames still to make, without retrieving this one
+                    if store is None and not capture.grab():
+                        return
+                else:
+                    if store is not None:
+                        frame = store[index]
+                    else:
+                        ret, frame = capture.read()
+                        if not ret:
+                            return  # header overestimated the frame count, the rest are made on request
+                    if self.result_cache is None:
+                        self.remember(index, self.make_proxy(frame))
+                    else:
+                        pending.append((index, self.make_proxy(frame)))
+                        if len(pending) >= self.batch_size:
+                            self.result_cache.put_many(self.video_hash, 'proxy', self.params, pending)
+                            pending = []
+                self.built = index + 1
+            self.built = end
+        finally:
+            if pending:
+                self.result_cache.put_many(self.video_hash, 'proxy', self.params, pending)
+            if capture is not None:
+                capture.release()
+            self.running = False
+
+    def wait(self, timeout=None):
+        """
+        Wait for the background thread to finish, returning whether it has.
+        """
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
@@ -0,0 +1,159 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class ResultCache:
+    """
+    Disk cache of analysis results (hough lines, contours, shape measurements). YOLO detections are kept
+    in DetectionStore.
+    Entries are keyed by (source hash, stage name, parameters, frame index) in one SQLite table, so repeat
+    runs with unchanged parameters are read back instead of recomputed, however long the video. The least
+    recently used entries are evicted to keep the disk space the database takes, in allocated blocks, under
+    a quota. PS 2024
+    """
+    def __init__(self, path="cache/results.sqlite", max_bytes=1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()  # Analysis runs in a background thread, crop measurements in the GUI thread
+        self.hits = 0
+        self.misses = 0
+
+        # Create the cache's directory if it doesn't exist
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # Pages freed by eviction are given back to the file system, must be set before the table is created
+        self.connection.execute("PRAGMA auto_vacuum = FULL")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    source_hash TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    frame INTEGER NOT NULL,
+                    result BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (source_hash, stage, params, frame)
+                ) WITHOUT ROWID""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    @property
+    def total_bytes(self):
+        """
+        Disk space taken by the cache, in allocated blocks where the file system reports them.
+        """
+        total = 0
+        for path in (self.path, self.path + "-journal"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            blocks = getattr(stat, 'st_blocks', None)
+            total += blocks * 512 if blocks is not None else stat.st_size
+        return total
+
+    def make_key(self, source_hash, stage, params):
+        """
+        Key columns of the entries for a stage's results. Parameters must be JSON serialisable.
+        """
+        return source_hash, stage, json.dumps(params, sort_keys=True)
+
+    def get(self, source_hash, frame_index, stage, params):
+        """
+        Return the cached result, or None if it has not been cached.
+        """
+        return self.get_many(source_hash, stage, params, [frame_index]).get(frame_index)
+
+    def get_many(self, source_hash, stage, params, indices):
+        """
+        Return a dict of frame index -> result for the given frames that are cached, marking them as used.
+        """
+        indices = list(indices)
+        if not indices:
+            return {}
+        wanted = set(indices)
+        key = self.make_key(source_hash, stage, params)
+        # One range query over the primary key index, filtered to the frames asked for
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT frame, result FROM results WHERE source_hash = ? AND stage = ? AND params = ? "
+                "AND frame BETWEEN ? AND ?", key + (min(indices), max(indices))).fetchall()
+            rows = [(frame, result) for frame, result in rows if frame in wanted]
+            if rows:
+                with self.connection:
+                    self.connection.executemany(
+                        "UPDATE results SET last_used = ? WHERE source_hash = ? AND stage = ? AND params = ? "
+                        "AND frame = ?", [(time.time(),) + key + (frame,) for frame, _ in rows])
+        cached = {frame: pickle.loads(result) for frame, result in rows}
+        self.hits += len(cached)
+        self.misses += len(wanted) - len(cached)
+        return cached
+
+    def cached_frames(self, source_hash, stage, params):
+        """
+        Return the set of frame indices with a cached result for a stage, without reading or marking them.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT frame FROM results WHERE source_hash = ? AND stage = ? AND params = ?",
+                self.make_key(source_hash, stage, params)).fetchall()
+        return {frame for frame, in rows}
+
+    def put(self, source_hash, frame_index, stage, params, result):
+        """
+        Store a result, evicting least recently used entries if the cache goes over its quota.
+        """
+        self.put_many(source_hash, stage, params, [(frame_index, result)])
+
+    def put_many(self, source_hash, stage, params, frame_results):
+        """
+        Store the result of each (frame index, result) pair in one transaction, replacing any already stored.
+        """
+        key = self.make_key(source_hash, stage, params)
+        now = time.time()
+        rows = [key + (int(i), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), now)
+                for i, result in frame_results]
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is under its quota. Called with the lock held.
+        """
+        excess = self.total_bytes - self.max_bytes
+        while excess > 0:
+            oldest = self.connection.execute(
+                "SELECT source_hash, stage, params, frame, length(result) FROM results ORDER BY last_used")
+            doomed = []
+            freed = 0
+            for row in oldest:
+                doomed.append(row[:4])
+                freed += row[4]
+                if freed >= excess:
+                    break
+            oldest.close()
+            if not doomed:
+                return
+            with self.connection:
+                self.connection.executemany(
+                    "DELETE FROM results WHERE source_hash = ? AND stage = ? AND params = ? AND frame = ?", doomed)
+            excess = self.total_bytes - self.max_bytes
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM results")
+
+    def close(self):
+        self.connection.close()
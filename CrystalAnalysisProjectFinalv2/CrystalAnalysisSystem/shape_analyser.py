@@ -1,17 +1,72 @@
+import threading
+
 import cv2
 import numpy as np
 from math import radians, atan2, degrees
 
+# Parameters of the measurement, part of the result cache key so changing any of them invalidates cached results
+SHAPE_PARAMS = {
+    'max_size': (800, 600),
+    'clahe_clip_limit': 2.0,
+    'clahe_tile_grid': (8, 8),
+    'blur_size': 3,
+    'threshold_block_size': 11,
+    'threshold_c': 2,
+    'close_kernel_size': 5,
+    'canny_thresholds': (50, 150),
+    'hough_threshold': 50,
+    'min_line_length': 30,
+    'max_line_gap': 10,
+}
+
+CLOSE_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (SHAPE_PARAMS['close_kernel_size'],
+                                                          SHAPE_PARAMS['close_kernel_size']))
+thread_state = threading.local()  # CLAHE objects keep working buffers, so each thread gets its own
+
+
+def get_clahe():
+    """
+    CLAHE for the current thread, created once instead of for every image.
+    """
+    if not hasattr(thread_state, 'clahe'):
+        thread_state.clahe = cv2.createCLAHE(clipLimit=SHAPE_PARAMS['clahe_clip_limit'],
+                                             tileGridSize=SHAPE_PARAMS['clahe_tile_grid'])
+    return thread_state.clahe
+
+
+def measure_shape(image):
+    """
+    Measure the width, height and angle of the crystal in an image. A module function so worker processes can run it.
+    """
+    return ShapeAnalyser(image, capture_stages=False).process_image()
+
+
+def triangle_area(a, b, c):
+    """
+    Twice the area of triangle abc, used to compare the distances of c from the line through a and b.
+    """
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0]))
+
+
+def squared_distance(a, b):
+    """
+    Squared distance between two points, exact for integer coordinates.
+    """
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2
+
 
 class ShapeAnalyser:
     """
-    Class for analyzing the shape of crystals in the image using OpenCV pre-processing and hough transform. PS 2024
+    Class for analyzing the shape of crystals in the image using OpenCV pre-processing and hough transform.
+    With capture_stages=False only the measurement is made: no intermediate images are kept, nothing is
+    drawn and preprocessing reuses two buffers, for analysing many crops at once. PS 2024
     """
-    def __init__(self, image):
+    def __init__(self, image, capture_stages=True):
         self.original_image = image
+        self.capture_stages = capture_stages  # Keep intermediate images for inspecting the stages
         self.stages = []
 
-    def resize_image(self, max_width=800, max_height=600):
+    def resize_image(self, max_width=SHAPE_PARAMS['max_size'][0], max_height=SHAPE_PARAMS['max_size'][1]):
         """
         Resize the image to fit within the specified dimensions while maintaining the aspect ratio.
         """
@@ -29,7 +84,8 @@ class ShapeAnalyser:
         else:
             resized_image = self.original_image
 
-        self.stages.append(resized_image)
+        if self.capture_stages:
+            self.stages.append(resized_image)
         return resized_image
 
     def rotate_point(self, point, angle, center):
@@ -44,6 +100,59 @@ class ShapeAnalyser:
         qy = oy + np.sin(angle_rad) * (px - ox) + np.cos(angle_rad) * (py - oy)
         return int(qx), int(qy)
 
+    def rotate_points(self, x_coords, y_coords, angle, center):
+        """
+        Rotate arrays of points around a given center in one step, truncating to integers like rotate_point.
+        """
+        angle_rad = radians(angle)
+        ox, oy = center
+
+        qx = ox + np.cos(angle_rad) * (x_coords - ox) - np.sin(angle_rad) * (y_coords - oy)
+        qy = oy + np.sin(angle_rad) * (x_coords - ox) + np.cos(angle_rad) * (y_coords - oy)
+        return qx.astype(int), qy.astype(int)
+
+    def find_furthest_points(self, points):
+        """
+        Find the two points furthest apart, using rotating calipers around their convex hull. Of equally
+        distant pairs, the first in point order is returned, as a search through every pair would.
+        """
+        hull = [tuple(vertex) for vertex in cv2.convexHull(points).reshape(-1, 2).tolist()]
+        count = len(hull)
+
+        # Antipodal pairs of hull vertices, the only candidates for the furthest pair
+        if count < 3:
+            pairs = [(0, count - 1)]
+        else:
+            pairs = []
+            k = 1
+            for i in range(count):
+                j = (i + 1) % count
+                # Advance the caliper to the vertex furthest from edge i-j, both vertices of a parallel edge count
+                area = triangle_area(hull[i], hull[j], hull[k])
+                next_area = triangle_area(hull[i], hull[j], hull[(k + 1) % count])
+                while next_area > area:
+                    k = (k + 1) % count
+                    area, next_area = next_area, triangle_area(hull[i], hull[j], hull[(k + 1) % count])
+                pairs.extend([(i, k), (j, k)])
+                if next_area == area:
+                    pairs.extend([(i, (k + 1) % count), (j, (k + 1) % count)])
+
+        distances = [squared_distance(hull[a], hull[b]) for a, b in pairs]
+        max_distance = max(distances)
+        if max_distance == 0:
+            return (0, 0), (0, 0)
+
+        # Map every furthest pair back to the first occurrence of its points and keep the earliest pair
+        first_index = {}
+        for a, b in set(pairs):
+            for vertex in (hull[a], hull[b]):
+                if vertex not in first_index:
+                    first_index[vertex] = int(np.flatnonzero((points == vertex).all(axis=1))[0])
+        furthest_pairs = [sorted((first_index[hull[a]], first_index[hull[b]]))
+                          for (a, b), distance in zip(pairs, distances) if distance == max_distance]
+        i, j = min(furthest_pairs)
+        return tuple(points[i].tolist()), tuple(points[j].tolist())
+
     def draw_rotated_box(self, image, rect):
         """
         Draw a rotated bounding box on the image.
@@ -57,98 +166,110 @@ class ShapeAnalyser:
         """
         Preprocess the image for bounding box calculation.
         """
+        if not self.capture_stages:
+            return self.measure_preprocess(resized_image)
+
         # Convert to grayscale
         gray = cv2.cvtColor(resized_image, cv2.COLOR_BGR2GRAY)
         self.stages.append(gray)
 
         # Enhance contrast using CLAHE
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
+        enhanced = get_clahe().apply(gray)
         self.stages.append(enhanced)
 
         # Apply Gaussian Blur
-        blurred = cv2.GaussianBlur(enhanced, (3, 3), 0)
+        blur_size = SHAPE_PARAMS['blur_size']
+        blurred = cv2.GaussianBlur(enhanced, (blur_size, blur_size), 0)
         self.stages.append(blurred)
 
         # Apply Adaptive Thresholding
-        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                       cv2.THRESH_BINARY, 11, 2)
+        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                       SHAPE_PARAMS['threshold_block_size'], SHAPE_PARAMS['threshold_c'])
         self.stages.append(thresh)
 
         # Apply Morphological Transformations (Closing)
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-        closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, CLOSE_KERNEL)
         self.stages.append(closed)
 
         # Perform Canny edge detection
-        edges = cv2.Canny(closed, 50, 150)
+        edges = cv2.Canny(closed, *SHAPE_PARAMS['canny_thresholds'])
         self.stages.append(edges)
 
         return edges
 
+    def measure_preprocess(self, resized_image):
+        """
+        The same preprocessing as preprocess_image, alternating between two buffers instead of keeping each stage.
+        """
+        blur_size = SHAPE_PARAMS['blur_size']
+        first = cv2.cvtColor(resized_image, cv2.COLOR_BGR2GRAY)
+        second = get_clahe().apply(first)
+        cv2.GaussianBlur(second, (blur_size, blur_size), 0, dst=first)
+        cv2.adaptiveThreshold(first, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                              SHAPE_PARAMS['threshold_block_size'], SHAPE_PARAMS['threshold_c'], dst=second)
+        cv2.morphologyEx(second, cv2.MORPH_CLOSE, CLOSE_KERNEL, dst=first)
+        return cv2.Canny(first, *SHAPE_PARAMS['canny_thresholds'], edges=second)
+
     def calculate_bounding_box(self, resized_image, edges):
         """
         Draw and rotate the bounding box on the processed image.
         """
         # Perform Hough Line Transform
-        lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=50, minLineLength=30, maxLineGap=10)
-        line_image = np.copy(resized_image) * 0
+        lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=SHAPE_PARAMS['hough_threshold'],
+                                minLineLength=SHAPE_PARAMS['min_line_length'], maxLineGap=SHAPE_PARAMS['max_line_gap'])
 
-        # Extract Line Coordinates and Draw Lines:
-        x_coords = []
-        y_coords = []
+        # Extract Line Coordinates
+        x_coords = np.empty(0, np.int32)
+        y_coords = np.empty(0, np.int32)
         if lines is not None:
-            for line in lines:
-                for x1, y1, x2, y2 in line:
-                    cv2.line(line_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    x_coords.extend([x1, x2])
-                    y_coords.extend([y1, y2])
+            endpoints = lines.reshape(-1, 4)
+            x_coords = endpoints[:, [0, 2]].ravel()
+            y_coords = endpoints[:, [1, 3]].ravel()
 
-        # Combine Original and Line Images
-        combined_image = cv2.addWeighted(resized_image, 0.8, line_image, 1, 0)
-        self.stages.append(combined_image)
+        if self.capture_stages:
+            # Draw Lines and Combine Original and Line Images
+            line_image = np.copy(resized_image) * 0
+            if lines is not None:
+                for line in lines:
+                    for x1, y1, x2, y2 in line:
+                        cv2.line(line_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            combined_image = cv2.addWeighted(resized_image, 0.8, line_image, 1, 0)
+            self.stages.append(combined_image)
 
         # Get the bounding box coordinates by finding extremes
-        if x_coords and y_coords:
-            x_min, x_max = min(x_coords), max(x_coords)
-            y_min, y_max = min(y_coords), max(y_coords)
-
-            # Determine the furthest points on the x-axis
-            furthest_points = [(x_coords[i], y_coords[i]) for i in range(len(x_coords))]
-            max_distance = 0
-            point1, point2 = (0, 0), (0, 0)
-            for i in range(len(furthest_points)):
-                for j in range(i + 1, len(furthest_points)):
-                    dist = np.linalg.norm(np.array(furthest_points[i]) - np.array(furthest_points[j]))
-                    if dist > max_distance:
-                        max_distance = dist
-                        point1, point2 = furthest_points[i], furthest_points[j]
+        if len(x_coords) and len(y_coords):
+            x_min, x_max = x_coords.min(), x_coords.max()
+            y_min, y_max = y_coords.min(), y_coords.max()
+
+            # Determine the furthest points
+            point1, point2 = self.find_furthest_points(np.column_stack((x_coords, y_coords)))
 
             # Calculate the angle of the line connecting the furthest points
             angle = degrees(atan2(point2[1] - point1[1], point2[0] - point1[0]))
 
             # Rotate all points based on the calculated angle
             center = ((x_min + x_max) / 2, (y_min + y_max) / 2)
-            rotated_coords = [self.rotate_point((x, y), -angle, center) for x, y in zip(x_coords, y_coords)]
+            rotated_x_coords, rotated_y_coords = self.rotate_points(x_coords, y_coords, -angle, center)
 
             # Get the bounding box coordinates of the rotated points
-            if rotated_coords:
-                rotated_x_coords, rotated_y_coords = zip(*rotated_coords)
-                rotated_x_min, rotated_x_max = min(rotated_x_coords), max(rotated_x_coords)
-                rotated_y_min, rotated_y_max = min(rotated_y_coords), max(rotated_y_coords)
+            if len(rotated_x_coords):
+                rotated_x_min, rotated_x_max = int(rotated_x_coords.min()), int(rotated_x_coords.max())
+                rotated_y_min, rotated_y_max = int(rotated_y_coords.min()), int(rotated_y_coords.max())
 
                 # Rotate the bounding box
                 rotated_width = rotated_x_max - rotated_x_min
                 rotated_height = rotated_y_max - rotated_y_min
-                rotated_box = ((center[0], center[1]), (float(rotated_width), float(rotated_height)), float(angle))
 
-                # Draw the rotated bounding box
-                final_image = resized_image.copy()
-                self.draw_rotated_box(final_image, rotated_box)
+                if self.capture_stages:
+                    # Draw the rotated bounding box
+                    rotated_box = ((center[0], center[1]), (float(rotated_width), float(rotated_height)),
+                                   float(angle))
+                    final_image = resized_image.copy()
+                    self.draw_rotated_box(final_image, rotated_box)
 
-                # Print dimensions
-                print(f"Width: {rotated_width}, Height: {rotated_height}")
-                print(f"Rotated Bounding Box Angle: {angle}")
+                    # Print dimensions
+                    print(f"Width: {rotated_width}, Height: {rotated_height}")
+                    print(f"Rotated Bounding Box Angle: {angle}")
 
                 return rotated_width, rotated_height, angle
 
@@ -159,6 +280,7 @@ class ShapeAnalyser:
         Method for running both pre-processing steps and drawing bounding boxes.
         :return: Processed Image and Hough Transform edges.
         """
+        self.stages = []
         resized_image = self.resize_image()
         edges = self.preprocess_image(resized_image)
         return self.calculate_bounding_box(resized_image, edges)
\ No newline at end of file
@@ -0,0 +1,148 @@
+import cv2
+import numpy as np
+
+# Parameters of keyframe detection with tracking in between
+TRACKER_PARAMS = {
+    'motion_width': 160,  # Frames are compared at this width for the motion score
+    'max_points': 40,  # Corners tracked per box
+    'min_points': 4,  # Boxes with fewer tracked corners are left where they are
+    'box_margin': 0.1,  # Corners are taken from the box grown by this fraction, to include its edges
+    'max_scale_change': 0.1,  # Largest change in box size between two frames
+}
+
+
+def to_gray(frame):
+    """
+    Grayscale copy of a BGR frame.
+    """
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
+def motion_score(reference_gray, gray):
+    """
+    Mean absolute difference (0-255) between two grayscale frames, compared at low resolution.
+    """
+    width = TRACKER_PARAMS['motion_width']
+    height = max(1, round(gray.shape[0] * width / gray.shape[1]))
+    reference = cv2.resize(reference_gray, (width, height), interpolation=cv2.INTER_AREA)
+    current = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+    return float(cv2.absdiff(reference, current).mean())
+
+
+class BoxTracker:
+    """
+    Moves detection boxes from one frame to the next with sparse Lucas-Kanade optical flow. Each box is
+    shifted by the median motion of the corners found inside it and scaled by how far they spread, so
+    boxes follow slowly moving and growing crystals between YOLO keyframes. PS 2024
+    """
+    def __init__(self):
+        self.gray = None  # Frame the boxes were last placed in
+        self.detections = []
+
+    def start(self, gray, detections):
+        """
+        Start tracking the detections of a keyframe.
+        """
+        self.gray = gray
+        self.detections = [list(detection) for detection in detections]
+
+    def track(self, gray):
+        """
+        Move the boxes into the next frame and return them as detection rows, keeping confidence and class.
+        """
+        height, width = gray.shape[:2]
+        tracked = []
+        for x1, y1, x2, y2, conf, class_id in self.detections:
+            old_points = self.find_points(x1, y1, x2, y2)
+            shift, scale = np.zeros(2), 1.0
+            if old_points is not None:
+                new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.gray, gray, old_points, None,
+                                                                 winSize=(15, 15), maxLevel=2)
+                found = status.reshape(-1) == 1
+                if found.sum() >= TRACKER_PARAMS['min_points']:
+                    old_found = old_points.reshape(-1, 2)[found]
+                    new_found = new_points.reshape(-1, 2)[found]
+                    shift = np.median(new_found - old_found, axis=0)
+                    old_spread = np.median(np.linalg.norm(old_found - old_found.mean(axis=0), axis=1))
+                    new_spread = np.median(np.linalg.norm(new_found - new_found.mean(axis=0), axis=1))
+                    if old_spread > 0:
+                        limit = TRACKER_PARAMS['max_scale_change']
+                        scale = float(np.clip(new_spread / old_spread, 1 - limit, 1 + limit))
+
+            center_x, center_y = (x1 + x2) / 2 + shift[0], (y1 + y2) / 2 + shift[1]
+            half_width, half_height = (x2 - x1) * scale / 2, (y2 - y1) * scale / 2
+            tracked.append([float(np.clip(center_x - half_width, 0, width)),
+                            float(np.clip(center_y - half_height, 0, height)),
+                            float(np.clip(center_x + half_width, 0, width)),
+                            float(np.clip(center_y + half_height, 0, height)), conf, class_id])
+
+        self.gray = gray
+        self.detections = tracked
+        return [list(detection) for detection in tracked]
+
+    def find_points(self, x1, y1, x2, y2):
+        """
+        Corners to track for a box, found in the box grown by box_margin on each side.
+        """
+        height, width = self.gray.shape[:2]
+        margin_x, margin_y = (x2 - x1) * TRACKER_PARAMS['box_margin'], (y2 - y1) * TRACKER_PARAMS['box_margin']
+        mask = np.zeros((height, width), np.uint8)
+        mask[max(0, int(y1 - margin_y)):min(height, int(y2 + margin_y) + 1),
+             max(0, int(x1 - margin_x)):min(width, int(x2 + margin_x) + 1)] = 255
+        return cv2.goodFeaturesToTrack(self.gray, TRACKER_PARAMS['max_points'], 0.01, 3, mask=mask)
+
+
+class KeyframeTracker:
+    """
+    Detects crystals with YOLO only on keyframes, every keyframe_interval frames or sooner when the
+    frame has changed by more than motion_threshold since the last keyframe, and tracks the boxes with
+    BoxTracker in between. Use its detect method in place of a detect(frames, indices) function, on
+    frames in order. Frame indices given tracked boxes are added to propagated. PS 2024
+    """
+    def __init__(self, detect, keyframe_interval=10, motion_threshold=10.0):
+        self.detect_frames = detect  # detect(frames, indices) of the full detector, for keyframes
+        self.keyframe_interval = keyframe_interval
+        self.motion_threshold = motion_threshold
+        self.tracker = BoxTracker()
+        self.last_keyframe = None  # Index and grayscale frame of the last keyframe
+        self.propagated = set()
+        self.keyframes = 0
+
+    def is_keyframe(self, index, gray):
+        """
+        Whether a frame needs full detection.
+        """
+        if self.last_keyframe is None:
+            return True
+        keyframe_index, keyframe_gray = self.last_keyframe
+        if not 0 < index - keyframe_index < self.keyframe_interval:
+            return True
+        return motion_score(keyframe_gray, gray) > self.motion_threshold
+
+    def detect(self, frames, indices):
+        """
+        Detections of each frame, from the detector on keyframes and the tracker on the others.
+        """
+        grays = [to_gray(frame) for frame in frames]
+        keyframes = []
+        for n, (i, gray) in enumerate(zip(indices, grays)):
+            if self.is_keyframe(i, gray):
+                keyframes.append(n)
+                self.last_keyframe = (i, gray)
+
+        # All keyframes of the batch go to the detector together
+        key_detections = {}
+        if keyframes:
+            detected = self.detect_frames([frames[n] for n in keyframes], [indices[n] for n in keyframes])
+            key_detections = dict(zip(keyframes, detected))
+            self.keyframes += len(keyframes)
+
+        detections = []
+        for n, (i, gray) in enumerate(zip(indices, grays)):
+            if n in key_detections:
+                self.tracker.start(gray, key_detections[n])
+                detections.append(key_detections[n])
+            else:
+                detections.append(self.tracker.track(gray))
+                self.propagated.add(i)
+        return detections
@@ -1,41 +1,231 @@
 import csv
+import hashlib
+import os
 import cv2
 import numpy as np
 
+from CrystalAnalysisSystem.pipeline import Pipeline
+
 """
 Helper functions. PS 2024
 """
 
 
-def apply_hough_transform(image):
+def hash_array(array):
     """
-    Apply hough transform to detect lines in the given image.
+    Content hash of an image, e.g. to key results of a cropped frame that has no source video.
+    """
+    digest = hashlib.blake2b(str((array.shape, array.dtype.str)).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()
+
+
+def hash_file(path, sample_size=1024 * 1024):
+    """
+    Fingerprint a file from its size and samples taken at the start, middle and end. Reading the
+    whole of a multi-GB video would defeat the point of caching anything derived from it.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (11, 11), 0)
-    edges = cv2.Canny(blurred, 100, 200)
-    kernel = np.ones((5, 5), np.uint8)
-    dilated = cv2.dilate(edges, kernel, iterations=1)
-    closed = cv2.morphologyEx(dilated, cv2.MORPH_CLOSE, kernel)
+    file_size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(file_size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in (0, max(0, file_size // 2 - sample_size // 2), max(0, file_size - sample_size)):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
 
-    lines = cv2.HoughLinesP(closed, 1, np.pi / 180, threshold=100, minLineLength=50, maxLineGap=10)
-    return lines
 
+# Parameters of the shared preprocessing and hough transform, part of the result cache key so
+# changing any of them invalidates cached results
+PIPELINE_PARAMS = {
+    'blur_size': 11,
+    'canny_thresholds': (100, 200),
+    'kernel_size': 5,
+    'hough_threshold': 100,
+    'min_line_length': 50,
+    'max_line_gap': 10,
+}
 
-def apply_contouring(image):
+MORPH_KERNEL = np.ones((PIPELINE_PARAMS['kernel_size'], PIPELINE_PARAMS['kernel_size']), np.uint8)
+
+
+def to_grayscale(image):
     """
-    Detect and draw contours of crystals in the given image.
+    Convert a BGR image to grayscale.
+    """
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def blur(gray):
+    """
+    Smooth out noise before edge detection.
+    """
+    blur_size = PIPELINE_PARAMS['blur_size']
+    return cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+
+
+def detect_edges(blurred):
+    """
+    Detect edges with canny.
+    """
+    return cv2.Canny(blurred, *PIPELINE_PARAMS['canny_thresholds'])
+
+
+def dilate(edges):
+    """
+    Thicken detected edges.
+    """
+    return cv2.dilate(edges, MORPH_KERNEL, iterations=1)
+
+
+def close(dilated):
+    """
+    Close gaps between edges with a morphological closing.
+    """
+    return cv2.morphologyEx(dilated, cv2.MORPH_CLOSE, MORPH_KERNEL)
+
+
+def find_lines(closed):
+    """
+    Detect line segments in the preprocessed mask.
+    """
+    return cv2.HoughLinesP(closed, 1, np.pi / 180, threshold=PIPELINE_PARAMS['hough_threshold'],
+                           minLineLength=PIPELINE_PARAMS['min_line_length'], maxLineGap=PIPELINE_PARAMS['max_line_gap'])
+
+
+def find_contours(closed):
+    """
+    Find external contours in the preprocessed mask.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (11, 11), 0)
-    edges = cv2.Canny(blurred, 100, 200)
-    kernel = np.ones((5, 5), np.uint8)
-    dilated = cv2.dilate(edges, kernel, iterations=1)
-    closed = cv2.morphologyEx(dilated, cv2.MORPH_CLOSE, kernel)
     contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     return contours
 
 
+def pack_lines(lines):
+    """
+    Compact geometry of hough lines: an (N, 4) int32 array of x1, y1, x2, y2 rows.
+    """
+    if lines is None:
+        return np.empty((0, 4), dtype=np.int32)
+    return np.ascontiguousarray(np.reshape(lines, (-1, 4)), dtype=np.int32)
+
+
+def pack_contours(contours):
+    """
+    Compact geometry of contours: all points in one (M, 2) int32 array plus the point count of each contour.
+    """
+    if not contours:
+        return np.empty((0, 2), dtype=np.int32), np.empty(0, dtype=np.int32)
+    points = np.concatenate([np.reshape(contour, (-1, 2)) for contour in contours]).astype(np.int32)
+    counts = np.array([len(contour) for contour in contours], dtype=np.int32)
+    return points, counts
+
+
+def unpack_contours(packed):
+    """
+    Split packed contour geometry back into the list of contours OpenCV draws.
+    """
+    points, counts = packed
+    return [contour.reshape(-1, 1, 2) for contour in np.split(points, np.cumsum(counts)[:-1])] if len(counts) else []
+
+
+# Shared preprocessing chain: grayscale -> blur -> canny -> dilate -> close, consumed by both
+# the hough transform and contouring so a frame analysed both ways is only preprocessed once.
+frame_pipeline = Pipeline()
+frame_pipeline.add_stage('gray', to_grayscale, inputs=('image',))
+frame_pipeline.add_stage('blurred', blur, inputs=('gray',))
+frame_pipeline.add_stage('edges', detect_edges, inputs=('blurred',))
+frame_pipeline.add_stage('dilated', dilate, inputs=('edges',))
+frame_pipeline.add_stage('closed', close, inputs=('dilated',))
+frame_pipeline.add_stage('lines', find_lines, inputs=('closed',))
+frame_pipeline.add_stage('contours', find_contours, inputs=('closed',))
+frame_pipeline.add_stage('line_geometry', pack_lines, inputs=('lines',))
+frame_pipeline.add_stage('contour_geometry', pack_contours, inputs=('contours',))
+
+
+def apply_hough_transform(image, run=None):
+    """
+    Apply hough transform to detect lines in the given image.
+    Pass the PipelineRun of the image to reuse preprocessing already done for it.
+    """
+    if run is None:
+        run = frame_pipeline.process(image)
+    return run['lines']
+
+
+def apply_contouring(image, run=None):
+    """
+    Detect and draw contours of crystals in the given image.
+    Pass the PipelineRun of the image to reuse preprocessing already done for it.
+    """
+    if run is None:
+        run = frame_pipeline.process(image)
+    return run['contours']
+
+
+def draw_lines(image, lines):
+    """
+    Draw hough lines onto the given image, either as returned by HoughLinesP or packed by pack_lines.
+    """
+    if lines is not None:
+        for x1, y1, x2, y2 in np.reshape(lines, (-1, 4)):
+            cv2.line(image, (int(x1), int(y1)), (int(x2), int(y2)), (255, 0, 0), 2)
+    return image
+
+
+def draw_contours(image, contours):
+    """
+    Draw contours onto the given image.
+    """
+    cv2.drawContours(image, contours, -1, (0, 255, 0), 2)
+    return image
+
+
+def draw_detections(image, detections, class_names):
+    """
+    Draw YOLO detection boxes labelled with their class names onto the given image.
+    """
+    for x1, y1, x2, y2, _, class_id in detections:
+        cv2.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
+        # adds label with class name and dimensions of crystal
+        # cv2.putText(image, f'{class_names[int(class_id)]} ({width}x{height})',
+        #             (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        cv2.putText(image, f'{class_names[int(class_id)]}', (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (0, 255, 0), 2)
+    return image
+
+
+def detection_records(detections, frame_index, class_names, propagated=None):
+    """
+    Convert YOLO detections of a frame into crystal_data rows for the growth rate calculator.
+    With keyframe detection, propagated records whether the boxes were tracked rather than detected.
+    """
+    records = []
+    for detection in detections:
+        x1, y1, x2, y2, _, class_id = detection  # unpack
+        record = {
+            'frame': frame_index,
+            'class': class_names[int(class_id)],
+            'width': x2 - x1,
+            'height': y2 - y1
+        }
+        if propagated is not None:
+            record['propagated'] = propagated
+        records.append(record)
+    return records
+
+
+def shape_record(frame_index, width, height, angle):
+    """
+    Convert a ShapeAnalyser measurement of a cropped frame into an analysis_data row.
+    """
+    return {
+        'frame': frame_index,
+        'width': width if width is not None else "N/A",
+        'height': height if height is not None else "N/A",
+        'angle': angle if angle is not None else "N/A",
+    }
+
+
 def filter_regions(contours):
     """
     Filter contours based on a specified area threshold.
@@ -52,14 +242,12 @@ def combine_results(image):
     """
     Combine the results of hough transform and contour detection to create a final image.
     """
-    lines = apply_hough_transform(image)
-    contours = apply_contouring(image)
+    run = frame_pipeline.process(image)
+    lines = apply_hough_transform(image, run)
+    contours = apply_contouring(image, run)
     contours = filter_regions(contours)
 
-    if lines is not None:
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            cv2.line(image, (x1, y1), (x2, y2), (255, 0, 0), 2)
+    draw_lines(image, lines)
 
     for contour in contours:
         epsilon = 0.01 * cv2.arcLength(contour, True)
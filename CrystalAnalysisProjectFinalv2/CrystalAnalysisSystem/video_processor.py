@@ -1,12 +1,25 @@
 import os
+import threading
+import time
 
 import cv2
+import numpy as np
 from tkinter import filedialog, messagebox
 
-from CrystalAnalysisSystem.utils import apply_hough_transform, apply_contouring
+from CrystalAnalysisSystem.utils import frame_pipeline, detection_records, hash_file, PIPELINE_PARAMS
+from CrystalAnalysisSystem.frame_source import VideoFrameSource, FrameSubset
+from CrystalAnalysisSystem.frame_store import FrameStore
+from CrystalAnalysisSystem.frame_prefetcher import FramePrefetcher
+from CrystalAnalysisSystem.proxy_track import ProxyTrack
+from CrystalAnalysisSystem.parallel import ParallelFrameProcessor
+from CrystalAnalysisSystem.result_cache import ResultCache
+from CrystalAnalysisSystem.detection_store import DetectionStore
 from CrystalAnalysisSystem.crop_display import CropDisplay
-from CrystalAnalysisSystem.crystal_detector import CrystalDetector
+from CrystalAnalysisSystem.crystal_detector import CrystalDetector, clip_roi
+from CrystalAnalysisSystem.detection_pipeline import DetectionPipeline
+from CrystalAnalysisSystem.tracker import KeyframeTracker
 from CrystalAnalysisSystem.growth_rate_calculator import GrowthRateCalculator
+from CrystalAnalysisSystem.job_executor import JobExecutor
 
 
 class VideoProcessor:
@@ -18,77 +31,283 @@ class VideoProcessor:
     def __init__(self, frame_display, status_var, progress_bar):
         self.video_path = ""
         self.frames = []
-        self.hough_frames = []
-        self.contour_frames = []
+        self.hough_frames = []  # per-frame line geometry, see utils.pack_lines
+        self.contour_frames = []  # per-frame contour geometry, see utils.pack_contours
+        self.detections = {}  # frame index -> (N x 6 detection array, tracked) from crystal detection
+        self.detection_class_names = {}
         self.status_var = status_var
         self.progress_bar = progress_bar
         self.frame_display = frame_display
         self.cache_dir = "cache"
         self.log_dir = "log"
-
-        self.detector = CrystalDetector(model_path='models/best.pt')  # Initialise detector
-        # self.detector = CrystalDetector(model_path='models/last.pt')  # Alternative Model to use
+        self.store_dir = "store"
+        self.use_frame_store = False  # Decode once into a memory-mapped store reused across sessions
+        self.prefetcher = None
+        self.prefetch_ahead = 16  # Frames decoded ahead of the current frame while navigating
+        self.prefetch_behind = 4  # Frames decoded behind the current frame while navigating
+        self.use_proxy = True  # Browse display-sized proxy frames, made in the background when a video is opened
+        self.proxy_size = (640, 480)  # Largest proxy frame size, width and height
+        self.proxy_quality = 85  # JPEG quality of proxy frames, None keeps them lossless as PNG
+        self.proxy = None
+        self.default_fps = 8  # Frame rate of videos that don't record one, as the growth rate calculator assumes
+        self.workers = 1  # Worker processes for whole-video hough/contouring, 1 runs on the UI thread
+        self.parallel_processor = None
+        self.video_hash = None
+        self.result_cache_quota = 1024 * 1024 * 1024  # Disk space for cached analysis results, in bytes
+        self.result_cache = None  # Opened in cache_dir on first use by get_result_cache
+        self.detection_store = None  # Opened in cache_dir on first use by get_detection_store
+        self.cache_lock = threading.Lock()
+
+        self.model_path = 'models/best.pt'
+        # self.model_path = 'models/last.pt'  # Alternative Model to use
+        self.detector_backend = 'torch'  # 'onnx' exports the model and runs it with ONNX Runtime
+        self.detector_int8 = False  # Run an INT8 quantized copy of the ONNX model
+        self.detector = None  # Loaded on first use by get_detector, importing ultralytics takes seconds
+        self.detector_lock = threading.Lock()
+        self.detection_render_fps = 15  # Cap on redraws during detection, frames in between are not shown
+        self.detection_imgsz = None  # YOLO input size (longest side) for detection, None for the model's own
+        self.keyframe_interval = 1  # Run YOLO every this many frames and track boxes in between, 1 detects every frame
+        self.keyframe_motion_threshold = 10.0  # Frame difference (0-255) since the last keyframe forcing a new one
         self.calculator = GrowthRateCalculator(self.log_dir)  # Initialise GrowthRateCalculator
+        self.jobs = JobExecutor(frame_display.master)  # Runs long operations off the Tk thread
+        self.job = None  # The running long operation, only one runs at a time
 
-        # Create cache directory if it doesn't exist
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
+    def get_detector(self):
+        """
+        Return the crystal detector, loading the model the first time it is needed.
+        """
+        with self.detector_lock:
+            if self.detector is None:
+                self.detector = CrystalDetector(model_path=self.model_path, backend=self.detector_backend,
+                                                int8=self.detector_int8)  # Initialise detector
+            return self.detector
+
+    def get_result_cache(self):
+        """
+        Return the analysis result cache, opening it in cache_dir the first time it is needed.
+        """
+        with self.cache_lock:
+            if self.result_cache is None:
+                self.result_cache = ResultCache(os.path.join(self.cache_dir, "results.sqlite"),
+                                                self.result_cache_quota)
+            return self.result_cache
+
+    def get_detection_store(self):
+        """
+        Return the detection store, opening it in cache_dir the first time it is needed.
+        """
+        with self.cache_lock:
+            if self.detection_store is None:
+                self.detection_store = DetectionStore(os.path.join(self.cache_dir, "detections.sqlite"))
+            return self.detection_store
+
+    def set_detector_backend(self, backend, int8=False):
+        """
+        Choose how the detection model is run. The detector is reloaded on its next use.
+        """
+        with self.detector_lock:
+            self.detector_backend = backend
+            self.detector_int8 = int8
+            self.detector = None
+
+    def warm_up(self):
+        """
+        Load the detection model in a background thread, so the first detection doesn't wait for it. Errors
+        are shown in the status bar, the model is loaded again on its first real use. The plotting libraries
+        are left to load on the Tk thread when first used, pyplot must not be set up from another thread.
+        """
+        def load():
+            try:
+                self.get_detector()
+            except Exception as error:
+                self.frame_display.after(0, self.status_var.set, f"Detection model could not be loaded: {error}")
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def is_busy(self):
+        """
+        Check whether a long operation is running, telling the user if so.
+        """
+        if self.job is not None and not self.job.done:
+            messagebox.showerror("Busy", f"{self.job.name} is still running")
+            return True
+        return False
+
+    def start_job(self, name, function, *args, on_done=None, on_partial=None):
+        """
+        Run function(job, *args) on a worker thread, showing its progress in the status bar. on_done(result)
+        and on_partial(result) are called on the Tk thread.
+        """
+        if self.is_busy():
+            return None
+        self.frame_display.pause()  # Jobs may draw on the canvas
+        self.status_var.set(f"{name}...")
+        self.job = self.jobs.submit(name, function, *args, on_progress=self.show_progress, on_partial=on_partial,
+                                    on_done=on_done, on_error=self.job_failed, on_cancel=self.job_cancelled)
+        return self.job
+
+    def show_progress(self, value, maximum, message=None):
+        """
+        Show the progress of the running job.
+        """
+        self.progress_bar["maximum"] = maximum
+        self.progress_bar["value"] = value
+        if message is not None:
+            self.status_var.set(message)
+
+    def job_failed(self, error):
+        self.progress_bar["value"] = 0
+        self.status_var.set(f"{self.job.name} failed")
+        messagebox.showerror("Error", f"{self.job.name} failed: {error}")
+
+    def job_cancelled(self):
+        self.progress_bar["value"] = 0
+        self.status_var.set(f"{self.job.name} cancelled")
+
+    def cancel_job(self):
+        """
+        Cancel the running long operation, if any.
+        """
+        if self.job is not None and not self.job.done:
+            self.job.cancel()
+            self.status_var.set(f"Cancelling {self.job.name.lower()}...")
 
     def upload_video(self):
         """
-        Open a file dialog to select a video file and convert it to frames.
+        Open a file dialog to select a video file and convert it to frames. The open video is kept while a
+        long operation is still using it.
         """
-        self.video_path = filedialog.askopenfilename(
+        if self.is_busy():
+            return
+        video_path = filedialog.askopenfilename(
             filetypes=[("Video files", "*.mp4 *.avi *.mov")]
         )
-        if not self.video_path:
+        if not video_path:
             messagebox.showerror("Error", "No video selected")
         else:
+            self.video_path = video_path
             self.convert_to_frames()
 
     def convert_to_frames(self):
         """
-        Convert the selected video into individual frames.
+        Open the selected video as a lazily decoded frame source. Only the video header is read here,
+        frames are decoded on demand when they are displayed or processed. With the frame store
+        enabled the video is decoded once into a memory-mapped file and mapped on later opens.
         """
         if not self.video_path:
             messagebox.showerror("Error", "No video uploaded")
             return
+        if self.is_busy():
+            return
 
-        self.status_var.set("Converting video to frames...")
-        cap = cv2.VideoCapture(self.video_path)
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        if self.proxy is not None:
+            self.proxy.stop()
+            self.proxy = None
+        if hasattr(self.frames, 'release'):
+            self.frames.release()
         self.frames = []
         self.hough_frames = []
         self.contour_frames = []
-        frame_index = 0
-
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.progress_bar["maximum"] = total_frames
+        self.detections = {}
+        self.video_hash = None
+        self.start_job("Opening video", self.open_frames, on_done=self.frames_opened)
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            self.frames.append(frame)
-            frame_index += 1
-            self.progress_bar["value"] = frame_index
-            self.progress_bar.update()
+    def open_frames(self, job):
+        """
+        Job: open the current video, through the frame store if enabled. Returns the frames with their
+        (width, height) and the video's hash, which read the file and decode a frame so are found here
+        rather than on the Tk thread.
+        """
+        if self.use_frame_store:
+            frames = self.open_frame_store(job)
+            self.get_result_cache()  # Proxies of stored videos are kept in it, opened here for the same reason
+        else:
+            frames = VideoFrameSource(self.video_path)
+        frame_size = None
+        if len(frames) > 0:
+            height, width = frames[0].shape[:2]
+            frame_size = (width, height)
+        video_hash = getattr(frames, 'video_hash', None)
+        if video_hash is None and os.path.isfile(self.video_path):
+            video_hash = hash_file(self.video_path)
+        return frames, frame_size, video_hash
+
+    def frames_opened(self, opened):
+        """
+        Show the first frame of a newly opened video and start making its proxy frames.
+        """
+        self.frames, frame_size, self.video_hash = opened
+        stored = isinstance(self.frames, FrameStore)
+        if not stored:
+            # Stored frames are left to the OS page cache, decoded frames are prefetched while navigating
+            self.prefetcher = FramePrefetcher(self.frames, self.prefetch_ahead, self.prefetch_behind)
+        if self.use_proxy and frame_size is not None:
+            # Browsing shows proxy frames, the full-resolution frames are only read for cropping and analysis,
+            # and through the prefetcher for proxies not made yet. Those of stored videos are kept on disk in
+            # the result cache, others only in memory.
+            self.proxy = ProxyTrack(self.frames if stored else self.prefetcher, self.video_path, frame_size,
+                                    self.proxy_size, self.proxy_quality, self.result_cache if stored else None,
+                                    self.video_hash).start()
 
-        cap.release()
         self.status_var.set("Conversion Completed")
         self.progress_bar["value"] = 0
 
-        messagebox.showinfo("Conversion Completed", f"Converted to {frame_index} frames")
-        self.frame_display.update_canvas(self.get_frame(0, self.frames))
+        messagebox.showinfo("Conversion Completed", f"Converted to {len(self.frames)} frames")
+        self.frame_display.update_canvas(self.get_frame(0, self.frames), self.get_frame_size())
+        self.frame_display.clear_detections()
+
+    def open_frame_store(self, job):
+        """
+        Map the stored frames of the current video, decoding it into the store first if needed.
+        """
+        store = FrameStore(self.video_path, self.store_dir)
+        if not store.is_built():
+            def update_progress(frame_index, total_frames):
+                job.check_cancelled()
+                job.progress(frame_index, total_frames)
+
+            job.progress(0, 1, "Building frame store...")
+            store.build(update_progress)
+        return store.open()
 
     def get_frame(self, index, frame_list):
         """
-        Get a frame from the specified frame list by index.
+        Get a frame from the specified frame list by index, for display. Frames of the video come from the
+        proxy track if there is one, so they may be smaller than the video, see get_frame_size.
         """
         if 0 <= index < len(frame_list):
+            if self.proxy is not None and frame_list is self.frames:
+                return self.proxy[index]
+            if self.prefetcher is not None and frame_list is self.frames:
+                return self.prefetcher.get_frame(index)  # also moves the prefetch window
             return frame_list[index]
         else:
             return None
 
+    def get_fps(self):
+        """
+        Frame rate of the current video, default_fps if it doesn't record one.
+        """
+        return getattr(self.frames, 'fps', 0) or self.default_fps
+
+    def get_frame_size(self):
+        """
+        Full-resolution (width, height) of the frames given by get_frame, or None if they are full-resolution.
+        """
+        return self.proxy.frame_size if self.proxy is not None else None
+
+    def set_prefetch_window(self, ahead, behind):
+        """
+        Set how many frames are decoded ahead of and behind the current frame while navigating.
+        """
+        self.prefetch_ahead = ahead
+        self.prefetch_behind = behind
+        if self.prefetcher is not None:
+            self.prefetcher.set_window(ahead, behind)
+
     def get_total_frames(self):
         """
         Get the total number of frames in the video.
@@ -97,47 +316,118 @@ class VideoProcessor:
 
     def apply_hough_to_frames(self):
         """
-        Apply hough transform to all frames in the video.
+        Apply hough transform to all frames in the video. Contours are found in the same pass from the
+        shared preprocessed mask, so the contour view needs no second pass over the video.
         """
-        self.status_var.set("Applying Hough Transform...")
-        self.hough_frames = []
-
-        for i, frame in enumerate(self.frames):
-            processed_frame = apply_hough_transform(frame.copy())
-            self.hough_frames.append(processed_frame)
-            cv2.imwrite(os.path.join(self.cache_dir, f"hough_frame_{i}.png"), processed_frame)
-            self.progress_bar["value"] = i + 1
-            self.progress_bar.update()
+        self.start_job("Applying Hough Transform", self.analyse_frames, True,
+                       not self.is_complete(self.contour_frames), on_done=self.hough_applied)
 
+    def hough_applied(self, geometry):
+        self.set_geometry(geometry)
         self.status_var.set("Hough Transform Applied")
-        self.progress_bar["value"] = 0
-        messagebox.showinfo("Hough Transform", "Hough Transform applied to all frames and saved to cache.")
+        messagebox.showinfo("Hough Transform", "Hough Transform applied to all frames.")
 
     def apply_contour_to_frames(self):
         """
-        Apply contouring to all frames in the video.
+        Apply contouring to all frames in the video, unless the hough transform pass already did.
         """
-        self.status_var.set("Applying Contouring...")
-        self.contour_frames = []
-
-        for i, frame in enumerate(self.frames):
-            processed_frame = apply_contouring(frame.copy())
-            self.contour_frames.append(processed_frame)
-            cv2.imwrite(os.path.join(self.cache_dir, f"contour_frame_{i}.png"), processed_frame)
-            self.progress_bar["value"] = i + 1
-            self.progress_bar.update()
+        if self.is_complete(self.contour_frames):
+            self.contouring_applied((None, None))
+        else:
+            self.start_job("Applying Contouring", self.analyse_frames, not self.is_complete(self.hough_frames), True,
+                           on_done=self.contouring_applied)
 
+    def contouring_applied(self, geometry):
+        self.set_geometry(geometry)
         self.status_var.set("Contouring Applied")
+        messagebox.showinfo("Contouring", "Contouring applied to all frames.")
+
+    def set_geometry(self, geometry):
+        """
+        Keep the (hough, contour) geometry returned by analyse_frames, None for parts not computed.
+        """
+        hough_frames, contour_frames = geometry
+        if hough_frames is not None:
+            self.hough_frames = hough_frames
+        if contour_frames is not None:
+            self.contour_frames = contour_frames
         self.progress_bar["value"] = 0
-        messagebox.showinfo("Contouring", "Contouring applied to all frames and saved to cache.")
+
+    def is_complete(self, results):
+        """
+        Check whether per-frame results cover every frame of the current video.
+        """
+        return len(self.frames) > 0 and len(results) == len(self.frames)
+
+    def analyse_frames(self, job, hough=True, contour=True):
+        """
+        Job: run the hough transform and/or contouring over all frames, preprocessing each frame once, and
+        return the (hough, contour) geometry of every frame, None for the one not asked for. Only geometry
+        is kept, FrameDisplay draws it over a frame when the frame is shown. Results are read from the
+        result cache where possible, only missing frames are processed.
+        """
+        outputs = [name for name, wanted in (('line_geometry', hough), ('contour_geometry', contour)) if wanted]
+        video_hash = self.get_video_hash()
+
+        frame_count = len(self.frames)
+        cached = [{} for _ in outputs]
+        if video_hash is not None:
+            cached = [self.get_result_cache().get_many(video_hash, name, PIPELINE_PARAMS, range(frame_count))
+                      for name in outputs]
+        results = [tuple(stage_results.get(i) for stage_results in cached) for i in range(frame_count)]
+        missing = [i for i, result in enumerate(results) if any(output is None for output in result)]
+
+        if missing:
+            processed = self.process_frames(job, missing, outputs)
+            for i, result in zip(missing, processed):
+                results[i] = result
+            if video_hash is not None:
+                for n, name in enumerate(outputs):
+                    self.get_result_cache().put_many(video_hash, name, PIPELINE_PARAMS,
+                                               [(i, result[n]) for i, result in zip(missing, processed)])
+
+        hough_frames = [result[outputs.index('line_geometry')] for result in results] if hough else None
+        contour_frames = [result[outputs.index('contour_geometry')] for result in results] if contour else None
+        return hough_frames, contour_frames
+
+    def process_frames(self, job, indices, outputs):
+        """
+        Compute frame_pipeline outputs for the given frames, in worker processes if enabled.
+        """
+        if self.workers > 1:
+            if self.parallel_processor is None or self.parallel_processor.workers != self.workers:
+                if self.parallel_processor is not None:
+                    self.parallel_processor.shutdown()
+                self.parallel_processor = ParallelFrameProcessor(self.workers)
+
+            def update_progress(frames_done, total_frames):
+                job.check_cancelled()
+                job.progress(frames_done, total_frames)
+
+            return self.parallel_processor.map(FrameSubset(self.frames, indices), outputs, update_progress)
+
+        results = []
+        for count, i in enumerate(indices):
+            job.check_cancelled()
+            run = frame_pipeline.process(self.frames[i])
+            results.append(tuple(run[name] for name in outputs))
+            job.progress(count + 1, len(indices))
+        return results
+
+    def get_video_hash(self):
+        """
+        Hash of the current video, identifying its results in the result cache. None if there is no video file.
+        """
+        if self.video_hash is None:
+            self.video_hash = getattr(self.frames, 'video_hash', None)
+            if self.video_hash is None and os.path.isfile(self.video_path):
+                self.video_hash = hash_file(self.video_path)
+        return self.video_hash
 
     def crop_frames(self, x1, y1, x2, y2, frames_before, frames_after, scale_x, scale_y):
         """
         Crop frames within a specified range and save them to the cache directory. For use with YOLO crystal detection.
         """
-        self.status_var.set("Cropping frames...")
-        cropped_frames = []
-
         start_index = max(0, self.frame_display.current_frame_index - frames_before)
         end_index = min(len(self.frames), self.frame_display.current_frame_index + frames_after + 1)
 
@@ -147,22 +437,50 @@ class VideoProcessor:
         x2 = int(x2 * scale_x)
         y2 = int(y2 * scale_y)
 
-        for i in range(start_index, end_index):
-            frame = self.frames[i]
-            cropped_frame = frame[y1:y2, x1:x2]
-            cropped_frames.append(cropped_frame)
-            cv2.imwrite(os.path.join(self.cache_dir, f"cropped_frame_{i}.png"), cropped_frame)
-
-        self.status_var.set("Cropping Completed")
-        messagebox.showinfo("Cropping Completed", f"Cropped frames from index {start_index} to {end_index - 1}")
-
+        def crop(job):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cropped_frames = []
+            for i in range(start_index, end_index):
+                job.check_cancelled()
+                frame = self.frames[i]
+                cropped_frame = frame[y1:y2, x1:x2]
+                cropped_frames.append(cropped_frame)
+                cv2.imwrite(os.path.join(self.cache_dir, f"cropped_frame_{i}.png"), cropped_frame)
+                job.progress(i - start_index + 1, end_index - start_index)
+            return cropped_frames
+
+        def done(cropped_frames):
+            self.status_var.set("Cropping Completed")
+            self.progress_bar["value"] = 0
+            messagebox.showinfo("Cropping Completed", f"Cropped frames from index {start_index} to {end_index - 1}")
+            self.show_crops(cropped_frames)
+
+        self.start_job("Cropping frames", crop, on_done=done)
+
+    def show_crops(self, cropped_frames):
+        """
+        Open the cropped frames in a CropDisplay window for analysis.
+        """
         # Pass all cropped frames to CropDisplay for analysis
         if cropped_frames:
             CropDisplay(self.frame_display.master, cropped_frames, self)
 
-    def detect_crystals_in_range(self, start_frame, end_frame):
+    def get_detections(self, frames, indices, video_hash, detector_params, roi=None, imgsz=None):
+        """
+        Detections for a batch of frames, from the detection store where possible. Only the frames missing
+        from the store are passed to the detector, in a single batch, restricted to roi if given.
+        """
+        def detect(missing_frames):
+            return self.get_detector().detect_batch(missing_frames, len(missing_frames), roi, imgsz)
+
+        if video_hash is None:
+            return detect(list(frames))
+        return self.get_detection_store().get_or_detect(video_hash, detector_params, frames, indices, detect)
+
+    def detect_crystals_in_range(self, start_frame, end_frame, roi=None, imgsz=None):
         """
-        Detect crystals in the specified range of frames.
+        Detect crystals in the specified range of frames. roi (x1, y1, x2, y2 in frame pixels) restricts
+        detection to that area, and imgsz sets the model input size, by default detection_imgsz.
         """
         # Check if there are frames to process.
         if not self.frames:
@@ -174,41 +492,88 @@ class VideoProcessor:
             messagebox.showerror("Error", "Invalid frame range")
             return
 
-        # updates status bar
-        self.status_var.set("Detecting crystals...")
-        crystal_data = []
+        if roi is not None:
+            try:
+                roi = clip_roi(roi, self.frames[start_frame].shape)
+            except ValueError as error:
+                messagebox.showerror("Error", str(error))
+                return
+
+        self.start_job("Detecting crystals", self.detect_frames, start_frame, end_frame, roi,
+                       imgsz or self.detection_imgsz, on_partial=self.show_detection_frame,
+                       on_done=self.detection_finished)
+
+    def detect_frames(self, job, start_frame, end_frame, roi, imgsz):
+        """
+        Job: detect crystals in frames start_frame to end_frame and return their detection records and the
+        (detections, tracked) of each frame. The newest frame and its detections are posted as a partial result
+        for display, at most detection_render_fps times a second; frames in between are not shown.
+        """
+        total = end_frame - start_frame + 1
+        job.progress(0, total, "Loading detection model...")  # replaced straight away if it is loaded
+        detector = self.get_detector()
+        self.detection_class_names = detector.class_names
 
-        # loop through each frame in range
-        for i in range(start_frame, end_frame + 1):
-            frame = self.frames[i]
-            detections = self.detector.detect(frame)
-            # process each detection in current form
-            for detection in detections:
-                x1, y1, x2, y2, _, class_id = detection  # unpack
-                width = x2 - x1
-                height = y2 - y1
-                crystal_data.append({
-                    'frame': i,
-                    'class': self.detector.class_names[int(class_id)],
-                    'width': width,
-                    'height': height
-                })
-
-                # Draw detection boxes on the frame
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                # adds label with class name and dimensions of crystal
-                # cv2.putText(frame, f'{self.detector.class_names[int(class_id)]} ({width}x{height})',
-                #             (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                cv2.putText(frame, f'{self.detector.class_names[int(class_id)]}',
-                            (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-            # Display the frame with detections
-            self.frame_display.update_canvas(frame)
-            self.frame_display.master.update_idletasks()
-            self.frame_display.master.update()
+        crystal_data = []
+        frame_detections = {}
+        video_hash = self.get_video_hash()
+        detector_params = detector.cache_params(roi, imgsz) if video_hash is not None else None
 
+        # updates status bar
+        if video_hash is not None:
+            stored = self.get_detection_store().count(video_hash, detector_params, start_frame, end_frame)
+            job.progress(0, total, f"Detecting crystals ({stored} of {total} frames stored)...")
+        else:
+            job.progress(0, total, "Detecting crystals...")
+
+        def detect(frames, indices):
+            return self.get_detections(frames, indices, video_hash, detector_params, roi, imgsz)
+
+        keyframe_tracker = None
+        if self.keyframe_interval > 1:
+            keyframe_tracker = KeyframeTracker(detect, self.keyframe_interval, self.keyframe_motion_threshold)
+            detect = keyframe_tracker.detect
+
+        # Frames are decoded and detected in the pipeline's threads while this job collects the results
+        pipeline = DetectionPipeline(self.frames, range(start_frame, end_frame + 1), detect, detector.batch_size)
+        render_interval = 1 / self.detection_render_fps
+        last_render = 0
+        pipeline.start()
+        try:
+            while not pipeline.finished:
+                job.check_cancelled()
+                for i, frame, detections in pipeline.get_results(timeout=render_interval):
+                    propagated = i in keyframe_tracker.propagated if keyframe_tracker is not None else None
+                    crystal_data.extend(detection_records(detections, i, detector.class_names, propagated))
+                    frame_detections[i] = (np.asarray(detections, dtype=np.float32).reshape(-1, 6), bool(propagated))
+                    job.progress(i - start_frame + 1, total)
+
+                    # Only the newest frame is shown, frames that arrived in between are skipped
+                    if i == end_frame or time.perf_counter() - last_render >= render_interval:
+                        job.partial((i, frame) + frame_detections[i])
+                        last_render = time.perf_counter()
+        finally:
+            pipeline.stop()
+        return crystal_data, frame_detections
+
+    def show_detection_frame(self, partial):
+        """
+        Show a frame posted by detect_frames, its detections drawn over it by the frame display. The frame
+        itself is never drawn on.
+        """
+        index, frame, detections, tracked = partial
+        self.frame_display.current_frame_index = index
+        if self.proxy is not None:
+            frame = self.proxy[index]
+        self.frame_display.update_canvas(frame, self.get_frame_size())
+        self.frame_display.draw_detections(detections, self.detection_class_names, tracked)
+
+    def detection_finished(self, result):
+        crystal_data, frame_detections = result
+        self.detections.update(frame_detections)
         # update status to show complete
         self.status_var.set("Detection completed")
+        self.progress_bar["value"] = 0
         # calculate growth rate for YOLO - use_hypotenuse = True.
         self.calculator.calculate_growth_rate(crystal_data, use_hypotenuse=True)
 
@@ -0,0 +1,69 @@
+"""
+Compares the furthest-pair search and point rotation of ShapeAnalyser.calculate_bounding_box against
+the previous pairwise search and per-point rotation, as the number of hough lines grows.
+Run from the project root: python -m benchmarks.bench_bounding_box --lines 10 100 1000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from CrystalAnalysisSystem.shape_analyser import ShapeAnalyser
+
+
+def pairwise_furthest_points(x_coords, y_coords):
+    """
+    The previous search through every pair of points.
+    """
+    furthest_points = [(x_coords[i], y_coords[i]) for i in range(len(x_coords))]
+    max_distance = 0
+    point1, point2 = (0, 0), (0, 0)
+    for i in range(len(furthest_points)):
+        for j in range(i + 1, len(furthest_points)):
+            dist = np.linalg.norm(np.array(furthest_points[i]) - np.array(furthest_points[j]))
+            if dist > max_distance:
+                max_distance = dist
+                point1, point2 = furthest_points[i], furthest_points[j]
+    return point1, point2
+
+
+def time_call(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, nargs='+', default=[10, 50, 100, 250, 500, 1000])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    analyser = ShapeAnalyser(np.zeros((600, 800, 3), np.uint8))
+    rng = np.random.default_rng(0)
+    center = (400.0, 300.0)
+    for line_count in args.lines:
+        endpoints = rng.integers(0, 800, (line_count, 4)).astype(np.int32)
+        x_coords = endpoints[:, [0, 2]].ravel()
+        y_coords = endpoints[:, [1, 3]].ravel()
+        points = np.column_stack((x_coords, y_coords))
+
+        old_time, old_points = time_call(lambda: pairwise_furthest_points(x_coords, y_coords), args.repeats)
+        new_time, new_points = time_call(lambda: analyser.find_furthest_points(points), args.repeats)
+        assert tuple(map(int, old_points[0])) == new_points[0] and tuple(map(int, old_points[1])) == new_points[1]
+
+        old_rotate_time, old_rotated = time_call(
+            lambda: [analyser.rotate_point((x, y), -30.0, center) for x, y in zip(x_coords, y_coords)], args.repeats)
+        new_rotate_time, new_rotated = time_call(
+            lambda: analyser.rotate_points(x_coords, y_coords, -30.0, center), args.repeats)
+        assert old_rotated == list(zip(new_rotated[0].tolist(), new_rotated[1].tolist()))
+
+        print(f"{line_count:5d} lines: furthest pair {old_time * 1000:9.2f} ms -> {new_time * 1000:6.2f} ms "
+              f"({old_time / new_time:7.1f}x), rotation {old_rotate_time * 1000:7.2f} ms -> "
+              f"{new_rotate_time * 1000:5.2f} ms ({old_rotate_time / new_rotate_time:5.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
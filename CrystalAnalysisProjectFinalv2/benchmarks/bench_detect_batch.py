@@ -0,0 +1,45 @@
+"""
+Compares YOLO detection one frame per call (CrystalDetector.detect) against batched calls
+(CrystalDetector.detect_batch) at several batch sizes, on frames of a video.
+Run from the project root: python -m benchmarks.bench_detect_batch video.avi --frames 64
+"""
+
+import argparse
+import time
+
+from CrystalAnalysisSystem.batch import DEFAULT_MODEL_PATH
+from CrystalAnalysisSystem.crystal_detector import CrystalDetector
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('video')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--frames', type=int, default=64)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[2, 4, 8, 16])
+    args = parser.parse_args()
+
+    source = VideoFrameSource(args.video)
+    frames = [source[i] for i in range(min(args.frames, len(source)))]
+    source.release()
+
+    detector = CrystalDetector(args.model)
+    detector.detect(frames[0])  # load the model before timing
+
+    start = time.perf_counter()
+    single = [detector.detect(frame) for frame in frames]
+    single_time = time.perf_counter() - start
+    print(f"one frame per call: {len(frames) / single_time:.1f} frames/s")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        batched = detector.detect_batch(frames, batch_size)
+        batch_time = time.perf_counter() - start
+        same = sum(len(a) == len(b) for a, b in zip(single, batched))
+        print(f"batch size {batch_size:3d}: {len(frames) / batch_time:.1f} frames/s, "
+              f"speedup {single_time / batch_time:.2f}x, same detection count on {same}/{len(frames)} frames")
+
+
+if __name__ == '__main__':
+    main()
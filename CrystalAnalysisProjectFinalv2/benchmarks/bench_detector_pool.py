@@ -0,0 +1,65 @@
+"""
+Sweeps the number of model instances in a DetectorPool, each pinned to an equal share of the CPU cores,
+against a single CrystalDetector with default threading, to choose --instances for this machine.
+Frames are decoded from the video in every case.
+Run from the project root:
+    python -m benchmarks.bench_detector_pool video.avi --frames 256 --instances 1 2 4 8
+"""
+
+import argparse
+import time
+
+from CrystalAnalysisSystem.batch import DEFAULT_MODEL_PATH
+from CrystalAnalysisSystem.crystal_detector import CrystalDetector
+from CrystalAnalysisSystem.detector_pool import DetectorPool, available_cores
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+
+
+def main():
+    cores = available_cores()
+    default_instances = sorted({k for k in (1, 2, 4, 8, 16, 32) if k <= len(cores)} | {len(cores)})
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch')
+    parser.add_argument('--frames', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=32)
+    parser.add_argument('--instances', type=int, nargs='+', default=default_instances)
+    args = parser.parse_args()
+
+    source = VideoFrameSource(args.video, cache_size=1)
+    indices = range(min(args.frames, len(source)))
+
+    detector = CrystalDetector(args.model, args.batch_size, backend=args.backend)
+    detector.detect(source[0])  # load the model before timing
+    start = time.perf_counter()
+    for batch_start in range(0, len(indices), args.batch_size):
+        detector.detect_batch([source[i] for i in indices[batch_start:batch_start + args.batch_size]])
+    single_time = time.perf_counter() - start
+    source.release()
+    print(f"{len(cores)} cores, {len(indices)} frames")
+    print(f"single detector, default threads: {len(indices) / single_time:.1f} frames/s")
+
+    best = None
+    for instances in args.instances:
+        pool = DetectorPool(args.model, instances, backend=args.backend, batch_size=args.batch_size,
+                            chunk_size=args.chunk_size, cores=cores)
+        try:
+            # Start every worker and load its model before timing
+            pool.detect(args.video, range(min(len(indices), instances * args.chunk_size)))
+            start = time.perf_counter()
+            pool.detect(args.video, indices)
+            pool_time = time.perf_counter() - start
+        finally:
+            pool.shutdown()
+        threads = [len(core_slice) for core_slice in pool.core_slices]
+        print(f"{instances:3d} instances x {min(threads)}-{max(threads)} threads: "
+              f"{len(indices) / pool_time:.1f} frames/s, speedup {single_time / pool_time:.2f}x")
+        if best is None or pool_time < best[1]:
+            best = (instances, pool_time)
+    print(f"fastest: --instances {best[0]}")
+
+
+if __name__ == '__main__':
+    main()
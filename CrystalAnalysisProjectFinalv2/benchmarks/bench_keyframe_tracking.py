@@ -0,0 +1,123 @@
+"""
+Reports the accuracy-versus-speed trade-off of keyframe detection with tracking (KeyframeTracker) against
+running the detector on every frame of a reference range. Accuracy is the IoU of each full-detection
+box with its best match in the same frame, and the recall of boxes matched at IoU >= 0.5.
+Run from the project root:
+    python -m benchmarks.bench_keyframe_tracking video.avi --start 0 --end 300 --intervals 2 5 10 30
+    python -m benchmarks.bench_keyframe_tracking --synthetic
+--synthetic uses a generated growing crystal and a threshold detector, for running without a model. The stand-in
+detector is far cheaper than YOLO, so only the accuracy columns are meaningful there.
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.batch import DEFAULT_MODEL_PATH
+from CrystalAnalysisSystem.tracker import KeyframeTracker
+
+
+def make_synthetic_frames(count):
+    """
+    A bright crystal drifting and growing across a noisy background.
+    """
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 60, (360, 480, 3)).astype(np.uint8)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        center = (150 + i * 0.8, 180 + i * 0.3)
+        size = (60 + i * 0.5, 40 + i * 0.3)
+        cv2.fillPoly(frame, [cv2.boxPoints((center, size, 0)).astype(np.int32)], (200, 190, 180))
+        cv2.line(frame, (int(center[0] - size[0] / 4), int(center[1])), (int(center[0] + size[0] / 4), int(center[1])),
+                 (120, 120, 120), 2)
+        frames.append(frame)
+    return frames
+
+
+def threshold_detector(frames, indices):
+    """
+    Stand-in for YOLO on synthetic frames: the bounding box of the bright pixels.
+    """
+    detections = []
+    for frame in frames:
+        _, mask = cv2.threshold(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 100, 255, cv2.THRESH_BINARY)
+        x, y, width, height = cv2.boundingRect(mask)
+        detections.append([[float(x), float(y), float(x + width), float(y + height), 0.9, 0.0]])
+    return detections
+
+
+def iou(a, b):
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def run(detect, frames, batch_size):
+    """
+    Detections of every frame, fed in batches as DetectionPipeline does, and the time taken.
+    """
+    start = time.perf_counter()
+    detections = []
+    for batch_start in range(0, len(frames), batch_size):
+        indices = list(range(batch_start, min(batch_start + batch_size, len(frames))))
+        detections.extend(detect([frames[i] for i in indices], indices))
+    return detections, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', nargs='?')
+    parser.add_argument('--synthetic', action='store_true')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch')
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--end', type=int, default=299)
+    parser.add_argument('--intervals', type=int, nargs='+', default=[2, 5, 10, 30])
+    parser.add_argument('--motion-threshold', type=float, default=10.0)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        frames = make_synthetic_frames(args.end - args.start + 1)
+        detect = threshold_detector
+    elif args.video:
+        from CrystalAnalysisSystem.crystal_detector import CrystalDetector
+        from CrystalAnalysisSystem.frame_source import VideoFrameSource
+        source = VideoFrameSource(args.video)
+        frames = [source[i] for i in range(args.start, min(args.end, len(source) - 1) + 1)]
+        source.release()
+        detector = CrystalDetector(args.model, backend=args.backend)
+        detector.detect(frames[0])  # load the model before timing
+
+        def detect(batch, indices):
+            return detector.detect_batch(batch, args.batch_size)
+    else:
+        parser.error("give a video or --synthetic")
+
+    reference, reference_time = run(detect, frames, args.batch_size)
+    total = sum(len(frame_detections) for frame_detections in reference)
+    print(f"full detection: {len(frames)} frames, {total} boxes, {len(frames) / reference_time:.1f} frames/s")
+    print(f"{'interval':>8} {'keyframes':>9} {'frames/s':>9} {'speedup':>8} {'mean IoU':>9} {'min IoU':>8} "
+          f"{'recall':>7}")
+    for interval in args.intervals:
+        keyframe_tracker = KeyframeTracker(detect, interval, args.motion_threshold)
+        detections, detection_time = run(keyframe_tracker.detect, frames, args.batch_size)
+
+        overlaps = []
+        for reference_rows, rows in zip(reference, detections):
+            for reference_row in reference_rows:
+                same_class = [row for row in rows if row[5] == reference_row[5]]
+                overlaps.append(max((iou(reference_row, row) for row in same_class), default=0.0))
+        overlaps = np.array(overlaps) if overlaps else np.zeros(1)
+        print(f"{interval:8d} {keyframe_tracker.keyframes:9d} {len(frames) / detection_time:9.1f} "
+              f"{reference_time / detection_time:7.2f}x {overlaps.mean():9.3f} {overlaps.min():8.3f} "
+              f"{(overlaps >= 0.5).mean():7.1%}")
+
+
+if __name__ == '__main__':
+    main()
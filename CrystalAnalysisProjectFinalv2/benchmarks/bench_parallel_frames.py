@@ -0,0 +1,61 @@
+"""
+Compares whole-video hough + contouring on the UI thread against ParallelFrameProcessor.
+Run from the project root: python -m benchmarks.bench_parallel_frames --frames 256
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.parallel import ParallelFrameProcessor
+from CrystalAnalysisSystem.utils import frame_pipeline
+
+
+def make_frames(count, width, height):
+    """
+    Synthetic frames with a few filled rectangles for the hough transform and contouring to find.
+    """
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        frame = np.zeros((height, width, 3), np.uint8)
+        for _ in range(20):
+            cv2.rectangle(frame, tuple(rng.integers(0, width, 2).tolist()), tuple(rng.integers(0, height, 2).tolist()),
+                          tuple(rng.integers(50, 255, 3).tolist()), -1)
+        frames.append(frame)
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=128)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8, os.cpu_count()])
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.width, args.height)
+
+    start = time.perf_counter()
+    for frame in frames:
+        run = frame_pipeline.process(frame)
+        run['lines'], run['contours']
+    serial_time = time.perf_counter() - start
+    print(f"serial: {args.frames / serial_time:.1f} frames/s")
+
+    for workers in sorted(set(args.workers)):
+        processor = ParallelFrameProcessor(workers)
+        processor.map(frames[:workers], ['lines'])  # start the worker processes before timing
+        start = time.perf_counter()
+        processor.map(frames, ['lines', 'contours'])
+        parallel_time = time.perf_counter() - start
+        processor.shutdown()
+        print(f"{workers} workers: {args.frames / parallel_time:.1f} frames/s, "
+              f"speedup {serial_time / parallel_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares YOLO detection on full frames against detection restricted to a region of interest, at the
+ROI's own size and at the given input sizes, reporting speed against the fraction of the frame the ROI
+covers and how many full-frame boxes inside the ROI are found again (IoU >= 0.5).
+Run from the project root:
+    python -m benchmarks.bench_roi_detection video.avi --roi 200 150 520 400 --imgsz 320 640
+"""
+
+import argparse
+import time
+
+from CrystalAnalysisSystem.batch import DEFAULT_MODEL_PATH
+from CrystalAnalysisSystem.crystal_detector import CrystalDetector, clip_roi
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+
+
+def iou(a, b):
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X1', 'Y1', 'X2', 'Y2'), required=True)
+    parser.add_argument('--imgsz', type=int, nargs='*', default=[])
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch')
+    parser.add_argument('--frames', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    source = VideoFrameSource(args.video)
+    frames = [source[i] for i in range(min(args.frames, len(source)))]
+    source.release()
+    roi = clip_roi(args.roi, frames[0].shape)
+    area = (roi[2] - roi[0]) * (roi[3] - roi[1]) / (frames[0].shape[0] * frames[0].shape[1])
+
+    detector = CrystalDetector(args.model, backend=args.backend)
+    detector.detect(frames[0])  # load the model before timing
+
+    start = time.perf_counter()
+    full = detector.detect_batch(frames, args.batch_size)
+    full_time = time.perf_counter() - start
+    # Only boxes wholly inside the ROI can be found by ROI detection
+    inside = [[row for row in rows if row[0] >= roi[0] and row[1] >= roi[1] and row[2] <= roi[2] and row[3] <= roi[3]]
+              for rows in full]
+    print(f"full frame: {len(frames) / full_time:.1f} frames/s, ROI covers {area:.1%} of the frame")
+
+    for imgsz in [None] + args.imgsz:
+        detector.detect(frames[0], roi, imgsz)  # warm up this input size
+        start = time.perf_counter()
+        detections = detector.detect_batch(frames, args.batch_size, roi, imgsz)
+        roi_time = time.perf_counter() - start
+        found = sum(any(iou(row, other) >= 0.5 for other in rows) for reference, rows in zip(inside, detections)
+                    for row in reference)
+        total = sum(len(reference) for reference in inside)
+        print(f"ROI at imgsz {imgsz or 'auto':>4}: {len(frames) / roi_time:.1f} frames/s, "
+              f"speedup {full_time / roi_time:.2f}x, found {found}/{total} boxes inside the ROI")
+
+
+if __name__ == '__main__':
+    main()
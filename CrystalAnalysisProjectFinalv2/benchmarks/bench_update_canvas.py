@@ -0,0 +1,79 @@
+"""
+Compares the per-frame cost of preparing a frame for the FrameDisplay canvas: the old path converting the
+full frame to RGB and resizing it with PIL LANCZOS against display_image, which resizes with cv2 INTER_AREA
+first. With a display, it also times update_canvas itself, which pastes into one reused PhotoImage.
+Run from the project root:
+    python -m benchmarks.bench_update_canvas --size 1920 1080 --canvas 640 480
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from CrystalAnalysisSystem.frame_display import fit_size, display_image
+
+
+def old_display_image(frame, width, height):
+    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def time_path(prepare, frames, width, height):
+    start = time.perf_counter()
+    for frame in frames:
+        prepare(frame, width, height)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def time_canvas(frames, canvas_size):
+    import tkinter as tk
+    from CrystalAnalysisSystem.frame_display import FrameDisplay
+
+    root = tk.Tk()
+    display = FrameDisplay(root, None, tk.StringVar(root))
+    display.canvas.config(width=canvas_size[0], height=canvas_size[1])
+    root.update()
+    display.update_canvas(frames[0])
+    tracemalloc.start()
+    start = time.perf_counter()
+    for frame in frames:
+        display.update_canvas(frame)
+        root.update_idletasks()
+    fps = len(frames) / (time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    items = len(display.canvas.find_all())
+    root.destroy()
+    return fps, peak, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, nargs=2, default=[1920, 1080], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--canvas', type=int, nargs=2, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--frames', type=int, default=60)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (args.size[1], args.size[0], 3), dtype=np.uint8) for _ in range(args.frames)]
+    width, height = fit_size(args.size[0], args.size[1], *args.canvas)
+
+    old_fps = time_path(old_display_image, frames, width, height)
+    new_fps = time_path(display_image, frames, width, height)
+    print(f"{args.size[0]}x{args.size[1]} to {width}x{height}: PIL LANCZOS {old_fps:.1f} frames/s, "
+          f"cv2 INTER_AREA {new_fps:.1f} frames/s, speedup {new_fps / old_fps:.2f}x")
+
+    try:
+        fps, peak, items = time_canvas(frames, args.canvas)
+    except Exception as error:  # no display
+        print(f"update_canvas not timed: {error}")
+        return
+    print(f"update_canvas: {fps:.1f} frames/s, {items} canvas item(s), peak Python allocations {peak / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Checks that the ONNX Runtime backend of CrystalDetector finds the same crystals as the PyTorch model on
+sample frames of a video, and compares their speed. Boxes are matched by class and IoU.
+Run from the project root: python -m benchmarks.check_onnx_parity video.avi --frames 32 --int8
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from CrystalAnalysisSystem.batch import DEFAULT_MODEL_PATH
+from CrystalAnalysisSystem.crystal_detector import CrystalDetector
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+
+
+def iou(box, boxes):
+    """
+    Intersection over union of one x1, y1, x2, y2 box with each of an N x 4 array of boxes.
+    """
+    width = (np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0])).clip(0)
+    height = (np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1])).clip(0)
+    intersection = width * height
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / ((box[2] - box[0]) * (box[3] - box[1]) + areas - intersection)
+
+
+def compare(reference, detections, min_iou):
+    """
+    Match each reference detection to the best overlapping detection of the same class.
+    Returns the number matched, the worst IoU and largest confidence difference of the matches.
+    """
+    matched, worst_iou, max_conf_diff = 0, 1.0, 0.0
+    detections = np.array(detections, dtype=np.float64).reshape(-1, 6)
+    for row in np.array(reference, dtype=np.float64).reshape(-1, 6):
+        candidates = detections[detections[:, 5] == row[5]]
+        if not len(candidates):
+            continue
+        overlaps = iou(row[:4], candidates[:, :4])
+        best = overlaps.argmax()
+        if overlaps[best] >= min_iou:
+            matched += 1
+            worst_iou = min(worst_iou, overlaps[best])
+            max_conf_diff = max(max_conf_diff, abs(row[4] - candidates[best, 4]))
+    return matched, worst_iou, max_conf_diff
+
+
+def run(detector, frames, batch_size):
+    start = time.perf_counter()
+    detections = detector.detect_batch(frames, batch_size)
+    return detections, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('video')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="YOLO .pt model, exported to ONNX if needed")
+    parser.add_argument('--frames', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--int8', action='store_true', help="also check the INT8 quantized model")
+    parser.add_argument('--min-iou', type=float, default=0.9)
+    args = parser.parse_args()
+
+    source = VideoFrameSource(args.video)
+    step = max(1, len(source) // args.frames)
+    frames = [source[i] for i in range(0, len(source), step)][:args.frames]
+    source.release()
+
+    detectors = [('torch', CrystalDetector(args.model)), ('onnx', CrystalDetector(args.model, backend='onnx'))]
+    if args.int8:
+        detectors.append(('onnx int8', CrystalDetector(args.model, backend='onnx', int8=True)))
+    for _, detector in detectors:
+        detector.detect(frames[0])  # load the model before timing
+
+    reference, reference_time = run(detectors[0][1], frames, args.batch_size)
+    total = sum(len(frame_detections) for frame_detections in reference)
+    print(f"torch: {len(frames) / reference_time:.1f} frames/s, {total} detections")
+    for name, detector in detectors[1:]:
+        detections, detection_time = run(detector, frames, args.batch_size)
+        matched, worst_iou, max_conf_diff = 0, 1.0, 0.0
+        for reference_rows, rows in zip(reference, detections):
+            frame_matched, frame_iou, frame_conf_diff = compare(reference_rows, rows, args.min_iou)
+            matched += frame_matched
+            worst_iou = min(worst_iou, frame_iou)
+            max_conf_diff = max(max_conf_diff, frame_conf_diff)
+        extra = sum(len(frame_detections) for frame_detections in detections) - matched
+        print(f"{name}: {len(frames) / detection_time:.1f} frames/s, speedup {reference_time / detection_time:.2f}x, "
+              f"matched {matched}/{total} (worst IoU {worst_iou:.3f}, max conf diff {max_conf_diff:.3f}), "
+              f"{extra} unmatched")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from unittest.mock import MagicMock
 import tkinter as tk
 import numpy as np
@@ -72,6 +74,62 @@ class TestCropDisplay(unittest.TestCase):
         self.crop_display.show_previous_stage()
         self.assertEqual(self.crop_display.current_stage_index, 0)
 
+    def test_stage_navigation_reuses_analysis(self):
+        self.crop_display.update_for_new_frame()
+        measurement, stages = self.crop_display.analysis_cache[0]
+        for _ in range(3):
+            self.crop_display.show_next_stage()
+            self.crop_display.show_previous_stage()
+        self.assertIs(self.crop_display.analysis_cache[0][1], stages)
+        self.assertEqual(len(self.crop_display.stages), len(stages))
+
+    def test_analysis_cache_is_bounded(self):
+        self.crop_display.analysis_cache_size = 2
+        for _ in range(4):
+            self.crop_display.next_frame()
+        self.assertEqual(list(self.crop_display.analysis_cache), [3, 4])
+
+    def test_start_analysis_uses_cached_measurements(self):
+        self.video_processor.get_result_cache.return_value.get.return_value = (10, 20, 0.5)
+        self.crop_display.calculator = MagicMock()
+        self.crop_display.start_analysis()
+        self.assertIsNone(self.crop_display.executor)
+        self.assertEqual(self.crop_display.analysis_data,
+                         [{'frame': i, 'width': 10, 'height': 20, 'angle': 0.5} for i in range(5)])
+        self.crop_display.calculator.calculate_growth_rate.assert_called_once()
+
+    def test_failed_worker_leaves_frame_out(self):
+        self.video_processor.get_result_cache.return_value.get.return_value = None
+        self.crop_display.calculator = MagicMock()
+        futures = [Future() for _ in range(5)]
+        for i, future in enumerate(futures):
+            if i == 2:
+                future.set_exception(BrokenProcessPool("worker died"))
+            else:
+                future.set_result((10, 20, 0.5))
+        executor = MagicMock()
+        executor.submit.side_effect = futures
+        self.crop_display.executor = executor
+
+        self.crop_display.start_analysis()
+        self.assertEqual(self.crop_display.pending, {})
+        self.assertEqual(list(self.crop_display.failed), [2])
+        self.assertIsNone(self.crop_display.executor)  # the broken pool is replaced on the next run
+        executor.shutdown.assert_called_once()
+        self.assertEqual(str(self.crop_display.analyze_button['state']), tk.NORMAL)
+        self.assertEqual(str(self.crop_display.cancel_button['state']), tk.DISABLED)
+        self.assertEqual([record['frame'] for record in self.crop_display.analysis_data], [0, 1, 3, 4])
+        self.crop_display.calculator.calculate_growth_rate.assert_called_once()
+
+    def test_cancel_analysis(self):
+        self.video_processor.get_result_cache.return_value.get.return_value = None
+        self.crop_display.start_analysis()
+        self.assertEqual(str(self.crop_display.analyze_button['state']), tk.DISABLED)
+        self.crop_display.cancel_analysis()
+        self.assertEqual(self.crop_display.pending, {})
+        self.assertIsNone(self.crop_display.executor)
+        self.assertEqual(str(self.crop_display.analyze_button['state']), tk.NORMAL)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
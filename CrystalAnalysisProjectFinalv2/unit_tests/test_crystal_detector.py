@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+
+from CrystalAnalysisSystem.crystal_detector import CrystalDetector
+
+
+class TestCrystalDetector(unittest.TestCase):
+
+    def setUp(self):
+        # Mock the YOLO model, each frame gets one detection with its first pixel value as the class
+        with patch('CrystalAnalysisSystem.crystal_detector.load_model') as mock_load_model:
+            self.model = mock_load_model.return_value
+            self.detector = CrystalDetector('model.pt', batch_size=2)
+        self.model.side_effect = lambda frames, **options: [self.make_result(frame) for frame in frames]
+
+    def make_result(self, frame):
+        result = MagicMock()
+        result.boxes.data.tolist.return_value = [[0.0, 0.0, 1.0, 1.0, 0.9, float(frame[0, 0, 0])]]
+        return result
+
+    def test_detect_batch_splits_frames_into_batches(self):
+        frames = np.arange(5, dtype=np.uint8).reshape(5, 1, 1, 1).repeat(3, axis=3)
+        detections = self.detector.detect_batch(frames)
+        self.assertEqual([len(call.args[0]) for call in self.model.call_args_list], [2, 2, 1])
+        self.assertEqual([frame_detections[0][5] for frame_detections in detections], [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    def test_detect_batch_batch_size_argument(self):
+        frames = [np.full((1, 1, 3), i, dtype=np.uint8) for i in range(5)]
+        self.assertEqual(len(self.detector.detect_batch(frames, batch_size=5)), 5)
+        self.assertEqual(self.model.call_count, 1)
+
+    def test_roi_detections_in_frame_coordinates(self):
+        frames = [np.full((100, 120, 3), i, dtype=np.uint8) for i in range(3)]
+        detections = self.detector.detect_batch(frames, roi=(20, 30, 60, 200), imgsz=320)
+        self.assertEqual([frame.shape for frame in self.model.call_args.args[0]], [(70, 40, 3)])
+        self.assertEqual(self.model.call_args.kwargs, {'conf': 0.25, 'imgsz': 320})
+        self.assertEqual(detections[2], [[20.0, 30.0, 21.0, 31.0, 0.9, 2.0]])
+
+        # Without imgsz the roi runs at its own size rounded up to the model stride, not enlarged
+        self.detector.detect(frames[0], roi=(20, 30, 60, 200))
+        self.assertEqual(self.model.call_args.kwargs, {'conf': 0.25, 'imgsz': 96})
+
+    def test_roi_outside_frame(self):
+        with self.assertRaises(ValueError):
+            self.detector.detect(np.zeros((100, 120, 3), dtype=np.uint8), roi=(130, 0, 150, 50))
+
+    def test_cache_params_include_conf_roi_and_imgsz(self):
+        self.detector.model_hash = 'hash'
+        self.assertEqual(self.detector.cache_params(), {'model': 'hash', 'conf': 0.25})
+        self.assertEqual(self.detector.cache_params((1, 2, 3, 4), 320), {'model': 'hash', 'conf': 0.25,
+                                                                         'roi': [1, 2, 3, 4], 'imgsz': 320})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import threading
+import time
+import unittest
+import numpy as np
+
+from CrystalAnalysisSystem.detection_pipeline import DetectionPipeline
+
+
+class TestDetectionPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = [np.full((4, 4, 3), i, dtype=np.uint8) for i in range(20)]
+        self.batches = []
+
+    def detect(self, frames, indices):
+        self.batches.append(list(indices))
+        return [[[0.0, 0.0, 1.0, 1.0, 0.9, float(frame[0, 0, 0])]] for frame in frames]
+
+    def test_results_in_frame_order(self):
+        pipeline = DetectionPipeline(self.frames, range(3, 15), self.detect, batch_size=4)
+        results = list(pipeline)
+        self.assertEqual([i for i, _, _ in results], list(range(3, 15)))
+        self.assertEqual([detections[0][5] for _, _, detections in results], [float(i) for i in range(3, 15)])
+        self.assertEqual(self.batches, [[3, 4, 5, 6], [7, 8, 9, 10], [11, 12, 13, 14]])
+        self.assertTrue(pipeline.finished)
+
+    def test_errors_reach_the_consumer(self):
+        def failing_detect(frames, indices):
+            raise RuntimeError("model failed")
+
+        with self.assertRaises(RuntimeError):
+            list(DetectionPipeline(self.frames, range(10), failing_detect, batch_size=4))
+
+    def test_stop_with_full_queues(self):
+        pipeline = DetectionPipeline(self.frames, range(20), self.detect, batch_size=2)
+        pipeline.start()
+        time.sleep(0.2)  # let the stages fill the queues and block
+        pipeline.stop()
+        self.assertFalse(any(thread.is_alive() for thread in pipeline.threads))
+        self.assertLess(len(self.batches), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from CrystalAnalysisSystem.detection_store import DetectionStore
+
+
+class TestDetectionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.store_dir, "detections.sqlite")
+        self.store = DetectionStore(self.path)
+        self.params = {'model': 'model hash', 'conf': 0.25}
+        self.detected = []
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.store_dir)
+
+    def detect(self, frames):
+        self.detected.extend(frames)
+        return [[[float(frame), 0.0, 1.0, 1.0, 0.9, 0.0]] for frame in frames]
+
+    def test_put_and_get(self):
+        self.store.put('video', self.params, [(3, [[1.0, 2.0, 3.0, 4.0, 0.9, 0.0]]), (5, [])])
+        self.assertEqual(self.store.get('video', self.params, [3, 4, 5]),
+                         {3: [[1.0, 2.0, 3.0, 4.0, 0.9, 0.0]], 5: []})
+        self.assertEqual(self.store.count('video', self.params, 0, 4), 1)
+
+    def test_key_includes_video_model_conf_and_params(self):
+        self.store.put('video', self.params, [(0, [])])
+        self.assertEqual(self.store.get('other video', self.params, [0]), {})
+        self.assertEqual(self.store.get('video', {'model': 'other model', 'conf': 0.25}, [0]), {})
+        self.assertEqual(self.store.get('video', {'model': 'model hash', 'conf': 0.5}, [0]), {})
+        self.assertEqual(self.store.get('video', dict(self.params, roi=[0, 0, 10, 10]), [0]), {})
+        self.assertEqual(self.store.get('video', dict(self.params), [0]), {0: []})
+
+    def test_overlapping_range_only_detects_missing_frames(self):
+        first = self.store.get_or_detect('video', self.params, list(range(0, 6)), range(0, 6), self.detect)
+        second = self.store.get_or_detect('video', self.params, list(range(4, 10)), range(4, 10), self.detect)
+        self.assertEqual(self.detected, [0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(first[4], second[0])
+        self.assertEqual([detections[0][0] for detections in second], [4.0, 5.0, 6.0, 7.0, 8.0, 9.0])
+
+    def test_persists_across_sessions(self):
+        self.store.put('video', self.params, [(7, [[1.0, 2.0, 3.0, 4.0, 0.9, 1.0]])])
+        self.store.close()
+        self.store = DetectionStore(self.path)
+        self.assertEqual(self.store.get('video', self.params, [7]), {7: [[1.0, 2.0, 3.0, 4.0, 0.9, 1.0]]})
+
+    def test_clear(self):
+        self.store.put('video', self.params, [(0, []), (1, [])])
+        self.store.clear()
+        self.assertEqual(self.store.count('video', self.params, 0, 1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from CrystalAnalysisSystem import detector_pool
+from CrystalAnalysisSystem.detector_pool import DetectorPool, split_cores
+from unit_tests.test_frame_source import write_test_video
+
+
+class TestDetectorPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.video_path = os.path.join(cls.temp_dir, 'test_video.avi')
+        write_test_video(cls.video_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def test_split_cores(self):
+        self.assertEqual(split_cores(list(range(8)), 3), [[0, 1, 2], [3, 4, 5], [6, 7]])
+        self.assertEqual(split_cores([0, 1], 3), [[0], [1], [0]])
+
+    def test_detect_chunk_decodes_frames_in_worker(self):
+        detector = MagicMock()
+        detector.detect_batch.side_effect = lambda frames, batch_size, roi, imgsz: [
+            [[0.0, 0.0, 1.0, 1.0, 0.9, float(frame[0, 0, 0])]] for frame in frames]
+        with patch.object(detector_pool, 'detector', detector):
+            detections = detector_pool.detect_chunk(self.video_path, [2, 5])
+        detector_pool.video[1].release()
+        detector_pool.video = None
+        # Frame i of the test video has brightness i * 20, give or take compression
+        self.assertEqual(len(detections), 2)
+        self.assertAlmostEqual(detections[0][0][5], 40, delta=3)
+        self.assertAlmostEqual(detections[1][0][5], 100, delta=3)
+
+    def test_imap_returns_frame_order(self):
+        pool = DetectorPool('model.pt', instances=3, chunk_size=2, cores=[0])
+        pool.executor.shutdown()
+        pool.executor = ThreadPoolExecutor(3)
+
+        def detect_chunk(video_path, indices, roi, imgsz):
+            time.sleep(0.05 if indices[0] == 0 else 0)  # the first chunk finishes last
+            return [[[float(i), 0.0, 1.0, 1.0, 0.9, 0.0]] for i in indices]
+
+        try:
+            with patch.object(detector_pool, 'detect_chunk', detect_chunk):
+                results = list(pool.imap(self.video_path, range(9)))
+        finally:
+            pool.shutdown()
+        self.assertEqual([i for i, _ in results], list(range(9)))
+        self.assertEqual([detections[0][0] for _, detections in results], [float(i) for i in range(9)])
+
+
+if __name__ == '__main__':
+    unittest.main()
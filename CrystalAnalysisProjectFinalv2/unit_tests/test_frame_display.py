@@ -4,7 +4,7 @@ import tkinter as tk
 import numpy as np
 
 # imports modules from working package
-from CrystalAnalysisSystem.frame_display import FrameDisplay
+from CrystalAnalysisSystem.frame_display import FrameDisplay, fit_size, display_image
 
 # This works!
 
@@ -52,8 +52,54 @@ class TestFrameDisplay(unittest.TestCase):
         self.assertEqual(self.frame_display.current_frame_index, 6)
 
     def test_update_canvas(self):
-        # test update canvas method maybe???
-        pass
+        self.frame_display.canvas.config(width=640, height=480)
+        self.root.update()
+        frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        self.frame_display.update_canvas(frame)
+        photo = self.frame_display.photo
+        for _ in range(5):
+            self.frame_display.update_canvas(frame)
+
+        # One canvas item and PhotoImage are reused for every frame
+        self.assertEqual(len(self.frame_display.canvas.find_all()), 1)
+        self.assertIs(self.frame_display.photo, photo)
+        width, height = self.frame_display.display_size
+        self.assertAlmostEqual(self.frame_display.scale_x, 1920 / width)
+        self.assertAlmostEqual(self.frame_display.scale_y, 1080 / height)
+
+        # A proxy frame maps to the full-resolution frame it was made from
+        self.frame_display.update_canvas(np.zeros((360, 640, 3), dtype=np.uint8), (1920, 1080))
+        self.assertAlmostEqual(self.frame_display.scale_x, 1920 / width)
+        self.assertAlmostEqual(self.frame_display.scale_y, 1080 / height)
+
+    def test_play_and_pause(self):
+        self.mock_video_processor.get_fps = MagicMock(return_value=25)
+        self.frame_display.play()
+        self.assertIsNotNone(self.frame_display.playback)
+        self.assertEqual(self.frame_display.play_button.cget('text'), "Pause")
+
+        # Stepping through frames by hand stops playback
+        self.frame_display.start_next_frame(None)
+        self.frame_display.stop_next_frame(None)
+        self.assertIsNone(self.frame_display.playback)
+        self.assertIsNone(self.frame_display.play_after)
+        self.assertEqual(self.frame_display.play_button.cget('text'), "Play")
+
+    def test_draw_detections_as_layers(self):
+        self.frame_display.scale_x = self.frame_display.scale_y = 2
+        detections = [[20.0, 40.0, 100.0, 80.0, 0.9, 0.0], [200.0, 200.0, 260.0, 240.0, 0.8, 0.0]]
+        self.frame_display.draw_detections(detections, {0: 'crystal'})
+        boxes = self.frame_display.canvas.find_withtag('boxes')
+        self.assertEqual(len(boxes), 2)
+        self.assertEqual(len(self.frame_display.canvas.find_withtag('labels')), 2)
+        self.assertEqual(self.frame_display.canvas.coords(boxes[0]), [10.0, 20.0, 50.0, 40.0])
+
+        # Hidden layers stay hidden for the next frame's detections
+        self.frame_display.set_layer('labels', False)
+        self.frame_display.draw_detections(detections[:1], {0: 'crystal'}, tracked=True)
+        label = self.frame_display.canvas.find_withtag('labels')[0]
+        self.assertEqual(self.frame_display.canvas.itemcget(label, 'state'), 'hidden')
+        self.assertEqual(len(self.frame_display.canvas.find_withtag('detection')), 2)
 
     def test_on_crop_start(self):
         event = MagicMock()
@@ -78,5 +124,19 @@ class TestFrameDisplay(unittest.TestCase):
             self.frame_display.on_crop_drag(event)
             mock_create_rectangle.assert_called_once_with(self.frame_display.crop_start_x, self.frame_display.crop_start_y, event.x, event.y, outline='red')
 
+class TestDisplayImage(unittest.TestCase):
+
+    def test_fit_size(self):
+        self.assertEqual(fit_size(1920, 1080, 640, 480), (640, 360))
+        self.assertEqual(fit_size(640, 480, 1000, 480), (640, 480))
+
+    def test_display_image_resizes_and_converts_to_rgb(self):
+        frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        frame[..., 0] = 255  # blue in BGR
+        image = display_image(frame, 640, 360)
+        self.assertEqual(image.size, (640, 360))
+        self.assertEqual(image.getpixel((10, 10)), (0, 0, 255))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+from CrystalAnalysisSystem.frame_prefetcher import FramePrefetcher
+
+
+def write_test_video(video_path, frame_count=10):
+    """
+    Write a short video where every frame has a distinct brightness.
+    """
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 8, (64, 48))
+    for i in range(frame_count):
+        writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    writer.release()
+
+
+class TestVideoFrameSource(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.video_path = os.path.join(cls.temp_dir, 'test_video.avi')
+        write_test_video(cls.video_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def setUp(self):
+        self.source = VideoFrameSource(self.video_path, cache_size=3)
+
+    def tearDown(self):
+        self.source.release()
+
+    def test_length_from_header(self):
+        self.assertEqual(len(self.source), 10)
+        self.assertEqual(len(self.source.cache), 0)  # nothing decoded on open
+
+    def test_seeking_matches_sequential_decode(self):
+        # MPEG-4 has inter frames, so a seek must decode forward from a keyframe to land on the right frame
+        video_path = os.path.join(self.temp_dir, 'inter_frames.mp4')
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), 25, (64, 48))
+        if not writer.isOpened():
+            self.skipTest("no MPEG-4 encoder available")
+        pattern = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+        for i in range(60):
+            writer.write(np.roll(pattern, i, axis=1))
+        writer.release()
+
+        capture = cv2.VideoCapture(video_path)
+        sequential = []
+        ret, frame = capture.read()
+        while ret:
+            sequential.append(frame)
+            ret, frame = capture.read()
+        capture.release()
+
+        source = VideoFrameSource(video_path, cache_size=1)
+        try:
+            for i in [45, 7, 59, 30, 1, 31]:
+                np.testing.assert_array_equal(source[i], sequential[i], err_msg=f"frame {i}")
+        finally:
+            source.release()
+
+    def test_random_access(self):
+        for i in [7, 2, 9, 0]:
+            frame = self.source[i]
+            self.assertEqual(frame.shape, (48, 64, 3))
+            self.assertAlmostEqual(int(frame.mean()), i * 20, delta=3)
+
+    def test_negative_index_and_bounds(self):
+        self.assertAlmostEqual(int(self.source[-1].mean()), 180, delta=3)
+        with self.assertRaises(IndexError):
+            self.source[10]
+
+    def test_cache_is_bounded(self):
+        for frame in self.source:
+            self.assertIsNotNone(frame)
+        self.assertEqual(len(self.source.cache), 3)
+        self.assertEqual(list(self.source.cache), [7, 8, 9])
+
+
+class TestFramePrefetcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.video_path = os.path.join(cls.temp_dir, 'test_video.avi')
+        write_test_video(cls.video_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def setUp(self):
+        self.source = VideoFrameSource(self.video_path, cache_size=2)
+        self.prefetcher = FramePrefetcher(self.source, ahead=3, behind=1)
+
+    def tearDown(self):
+        self.prefetcher.stop()
+        self.source.release()
+
+    def wait_for_cache(self, indices):
+        deadline = time.time() + 5
+        while not all(self.source.is_cached(i) for i in indices) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_cache_grows_to_fit_window(self):
+        self.assertEqual(self.source.cache_size, 5)
+
+    def test_prefetches_in_navigation_direction(self):
+        self.prefetcher.get_frame(4)
+        self.wait_for_cache([5, 6, 7, 3])
+        self.assertEqual(self.prefetcher.misses, 1)
+
+        self.prefetcher.get_frame(5)
+        self.assertEqual(self.prefetcher.hits, 1)
+
+        # Stepping backwards moves the larger window behind the current frame
+        self.prefetcher.get_frame(4)
+        self.wait_for_cache([3, 2, 1])
+        self.assertTrue(all(self.source.is_cached(i) for i in [3, 2, 1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.frame_store import FrameStore
+
+
+class TestFrameStore(unittest.TestCase):
+
+    def setUp(self):
+        # Write a short video where every frame has a distinct brightness
+        self.temp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.temp_dir, 'store')
+        self.video_path = os.path.join(self.temp_dir, 'test_video.avi')
+        writer = cv2.VideoWriter(self.video_path, cv2.VideoWriter_fourcc(*'MJPG'), 8, (64, 48))
+        for i in range(6):
+            writer.write(np.full((48, 64, 3), i * 40, dtype=np.uint8))
+        writer.release()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_build_and_reopen(self):
+        store = FrameStore(self.video_path, self.store_dir)
+        self.assertFalse(store.is_built())
+        store.build()
+        store.open()
+        self.assertEqual(len(store), 6)
+        self.assertEqual(store.fps, 8)
+        self.assertAlmostEqual(int(store[3].mean()), 120, delta=3)
+
+        # A second store for the same video maps the existing file without decoding
+        reopened = FrameStore(self.video_path, self.store_dir)
+        self.assertTrue(reopened.is_built())
+        reopened.open()
+        np.testing.assert_array_equal(reopened[5], store[5])
+
+    def test_cancelled_build_leaves_no_partial_file(self):
+        class Cancelled(Exception):
+            pass
+
+        def cancel(frame_index, total_frames):
+            if frame_index == 3:
+                raise Cancelled()
+
+        store = FrameStore(self.video_path, self.store_dir)
+        with self.assertRaises(Cancelled):
+            store.build(cancel)
+        self.assertEqual(os.listdir(self.store_dir), [])
+        self.assertFalse(store.is_built())
+
+        # A later build starts from scratch
+        store.build()
+        self.assertEqual(len(store.open()), 6)
+
+    def test_crop_is_zero_copy_and_store_is_read_only(self):
+        store = FrameStore(self.video_path, self.store_dir)
+        store.build()
+        store.open()
+        frame = store[2]
+        crop = frame[10:20, 5:15]
+        self.assertTrue(np.shares_memory(crop, store.array))
+
+        # Drawing on a frame must not reach the file on disk
+        frame[:] = 0
+        reopened = FrameStore(self.video_path, self.store_dir).open()
+        self.assertGreater(reopened[2].mean(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
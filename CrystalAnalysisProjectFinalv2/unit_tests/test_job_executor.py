@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, call, patch
+
+from CrystalAnalysisSystem.job_executor import JobExecutor
+
+
+class TestJobExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.widget = MagicMock()  # stands in for the Tk widget, polling is done with drain
+        self.executor = JobExecutor(self.widget, progress_interval=10)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_done_callback_gets_result(self):
+        on_done = MagicMock()
+        job = self.executor.submit("Adding", lambda job, a, b: a + b, 2, 3, on_done=on_done)
+        self.assertTrue(self.executor.drain(5))
+        on_done.assert_called_once_with(5)
+        self.assertTrue(job.done)
+        self.widget.after.assert_called()  # polling was scheduled on the Tk thread
+
+    def test_progress_is_throttled_and_coalesced(self):
+        def count(job):
+            for i in range(1000):
+                job.progress(i + 1, 1000)
+
+        on_progress = MagicMock()
+        self.executor.submit("Counting", count, on_progress=on_progress)
+        self.assertTrue(self.executor.drain(5))
+        # The first report is posted, later ones inside the interval dropped, except the final one
+        self.assertLessEqual(on_progress.call_count, 2)
+        on_progress.assert_called_with(1000, 1000, None)
+
+    def test_only_newest_partial_result_delivered(self):
+        release = threading.Event()
+
+        def produce(job):
+            for i in range(10):
+                job.partial(i)
+            release.wait(5)
+
+        on_partial = MagicMock()
+        self.executor.submit("Producing", produce, on_partial=on_partial)
+        time.sleep(0.1)
+        self.executor.deliver()
+        on_partial.assert_called_once_with(9)
+        release.set()
+        self.assertTrue(self.executor.drain(5))
+
+    @patch('CrystalAnalysisSystem.job_executor.messagebox.showerror')
+    def test_failing_callback_does_not_lose_other_events(self, mock_showerror):
+        release = threading.Event()
+        on_done = MagicMock()
+        first = self.executor.submit("Showing", lambda job: 1, on_done=MagicMock(side_effect=ValueError("no canvas")))
+        second = self.executor.submit("Counting", lambda job: 2, on_done=on_done)
+        running = self.executor.submit("Waiting", lambda job: release.wait(5),
+                                       on_partial=MagicMock(side_effect=ValueError("bad partial")))
+        running.partial(0)
+        time.sleep(0.1)
+
+        self.widget.after.reset_mock()
+        self.executor.poll()
+        mock_showerror.assert_has_calls([call("Error", "Waiting failed: bad partial"),
+                                         call("Error", "Showing failed: no canvas")], any_order=True)
+        on_done.assert_called_once_with(2)
+        self.assertTrue(first.done and second.done)
+        self.assertEqual(self.executor.jobs, [running])
+        self.widget.after.assert_called_once()  # polling goes on while a job runs
+
+        release.set()
+        self.assertTrue(self.executor.drain(5))
+
+    def test_errors_reach_on_error(self):
+        def fail(job):
+            raise RuntimeError("bad frame")
+
+        on_error, on_done = MagicMock(), MagicMock()
+        self.executor.submit("Failing", fail, on_error=on_error, on_done=on_done)
+        self.assertTrue(self.executor.drain(5))
+        self.assertIsInstance(on_error.call_args.args[0], RuntimeError)
+        on_done.assert_not_called()
+
+    def test_cancel(self):
+        def loop(job):
+            while True:
+                job.check_cancelled()
+                time.sleep(0.01)
+
+        on_cancel, on_done = MagicMock(), MagicMock()
+        job = self.executor.submit("Looping", loop, on_cancel=on_cancel, on_done=on_done)
+        time.sleep(0.05)
+        self.assertFalse(self.executor.drain(0.05))
+        job.cancel()
+        self.assertTrue(self.executor.drain(5))
+        on_cancel.assert_called_once_with()
+        on_done.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
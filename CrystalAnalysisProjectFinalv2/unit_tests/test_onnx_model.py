@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+
+from CrystalAnalysisSystem.onnx_model import inference_size, letterbox, postprocess
+
+
+class TestOnnxModel(unittest.TestCase):
+
+    def test_letterbox_pads_to_input_size(self):
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        padded = letterbox(image, (640, 640))
+        self.assertEqual(padded.shape, (640, 640, 3))
+        self.assertTrue((padded[:80] == 114).all())
+        self.assertTrue((padded[80:560] == 0).all())
+
+    def test_inference_size_pads_to_stride(self):
+        self.assertEqual(inference_size((480, 640, 3), 640), (480, 640))
+        self.assertEqual(inference_size((100, 300, 3), 320), (128, 320))
+        self.assertEqual(inference_size((70, 40, 3), 640), (640, 384))
+
+    def test_postprocess_filters_and_suppresses(self):
+        prediction = np.array([
+            [320, 320, 100, 50, 0.9, 0.1],
+            [322, 321, 100, 50, 0.8, 0.1],  # overlaps the first box with the same class
+            [322, 321, 100, 50, 0.1, 0.7],  # overlaps the first box with another class
+            [100, 300, 20, 20, 0.2, 0.1],  # below the confidence threshold
+        ], dtype=np.float32).T
+        detections = postprocess(prediction, (640, 640), (480, 640, 3))
+        np.testing.assert_allclose(detections, [[270, 215, 370, 265, 0.9, 0], [272, 216, 372, 266, 0.7, 1]],
+                                   rtol=1e-6)
+
+    def test_postprocess_without_detections(self):
+        prediction = np.zeros((5, 10), dtype=np.float32)
+        self.assertEqual(postprocess(prediction, (640, 640), (480, 640, 3)).shape, (0, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from CrystalAnalysisSystem.pipeline import Pipeline
+from CrystalAnalysisSystem.utils import (frame_pipeline, apply_hough_transform, apply_contouring, pack_lines,
+                                         pack_contours, unpack_contours, draw_lines, draw_contours)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_shared_stage_runs_once_per_frame(self):
+        pipeline = Pipeline()
+        shared = MagicMock(side_effect=lambda image: image + 1)
+        pipeline.add_stage('shared', shared)
+        pipeline.add_stage('double', lambda x: x * 2, inputs=('shared',))
+        pipeline.add_stage('square', lambda x: x ** 2, inputs=('shared',))
+
+        run = pipeline.process(np.array([1, 2]))
+        np.testing.assert_array_equal(run['double'], [4, 6])
+        np.testing.assert_array_equal(run['square'], [4, 9])
+        self.assertEqual(shared.call_count, 1)
+
+        # A new frame starts with an empty memo
+        pipeline.process(np.array([3]))['double']
+        self.assertEqual(shared.call_count, 2)
+
+    def test_hough_and_contouring_share_closed_mask(self):
+        image = np.zeros((120, 160, 3), dtype=np.uint8)
+        image[30:90, 40:120] = 255
+        run = frame_pipeline.process(image)
+        apply_hough_transform(image, run)
+        closed = run.outputs['closed']
+        apply_contouring(image, run)
+        self.assertIs(run.outputs['closed'], closed)
+        self.assertEqual(len(run['contours']), 1)
+
+
+class TestGeometry(unittest.TestCase):
+
+    def setUp(self):
+        self.image = np.zeros((240, 320, 3), dtype=np.uint8)
+        self.image[40:200, 60:140] = 255
+        self.image[100:180, 200:300] = 180
+
+    def test_packed_lines_draw_like_hough_output(self):
+        lines = apply_hough_transform(self.image)
+        packed = pack_lines(lines)
+        self.assertEqual(packed.shape, (len(lines), 4))
+        np.testing.assert_array_equal(draw_lines(self.image.copy(), packed), draw_lines(self.image.copy(), lines))
+        self.assertEqual(pack_lines(None).shape, (0, 4))
+
+    def test_contours_round_trip(self):
+        contours = apply_contouring(self.image)
+        points, counts = pack_contours(contours)
+        self.assertEqual(len(counts), len(contours))
+        unpacked = unpack_contours((points, counts))
+        for original, restored in zip(contours, unpacked):
+            np.testing.assert_array_equal(original, restored)
+        np.testing.assert_array_equal(draw_contours(self.image.copy(), unpacked),
+                                      draw_contours(self.image.copy(), contours))
+        self.assertEqual(unpack_contours(pack_contours(())), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from CrystalAnalysisSystem.playback import PlaybackClock
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPlaybackClock(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def tick(self, playback, cost):
+        """
+        Draw the frame due now if it is a new one, taking cost seconds, then wait until the next one is due,
+        as FrameDisplay.play_tick does.
+        """
+        index = playback.next_index()
+        if index > playback.last_index:
+            started = self.clock.now
+            self.clock.now += cost
+            playback.frame_drawn(index, started)
+        self.clock.now += playback.delay()
+        return playback.last_index
+
+    def test_fast_draws_show_every_frame(self):
+        playback = PlaybackClock(25, 1, start_index=10, clock=self.clock)
+        self.assertAlmostEqual(playback.delay(), 0.04)
+        indices = [self.tick(playback, 0.005) for _ in range(51)]
+        self.assertEqual(indices[-1], 60)
+        self.assertEqual(playback.skipped, 0)
+        self.assertAlmostEqual(playback.draw_times[-1], 50 / 25)  # frame 60 finished drawing when it was due
+        self.assertAlmostEqual(playback.achieved_fps(), 25, delta=0.5)
+
+    def test_slow_draws_skip_frames_to_stay_on_schedule(self):
+        # 10x speed of a 25 fps video wants 250 frames a second, drawing only manages 50
+        playback = PlaybackClock(25, 10, clock=self.clock)
+        for _ in range(100):
+            index = self.tick(playback, 0.02)
+        self.assertAlmostEqual(index, self.clock.now * 250, delta=10)
+        self.assertAlmostEqual(playback.achieved_fps(), 50, delta=1)
+        self.assertGreater(playback.skipped, 300)
+        self.assertEqual(playback.delay(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
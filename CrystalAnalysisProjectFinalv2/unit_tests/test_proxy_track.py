@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.frame_source import VideoFrameSource
+from CrystalAnalysisSystem.frame_store import FrameStore
+from CrystalAnalysisSystem.proxy_track import ProxyTrack, proxy_size
+from CrystalAnalysisSystem.result_cache import ResultCache
+
+
+class TestProxyTrack(unittest.TestCase):
+
+    def setUp(self):
+        # Write a short video where every frame has a distinct brightness
+        self.temp_dir = tempfile.mkdtemp()
+        self.video_path = os.path.join(self.temp_dir, 'test_video.avi')
+        writer = cv2.VideoWriter(self.video_path, cv2.VideoWriter_fourcc(*'MJPG'), 8, (1280, 720))
+        for i in range(6):
+            writer.write(np.full((720, 1280, 3), i * 40, dtype=np.uint8))
+        writer.release()
+        self.frames = VideoFrameSource(self.video_path)
+        self.result_cache = ResultCache(os.path.join(self.temp_dir, 'results.sqlite'))
+
+    def tearDown(self):
+        self.frames.release()
+        self.result_cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_proxy_size(self):
+        self.assertEqual(proxy_size((1920, 1080), (640, 480)), (640, 360))
+        self.assertEqual(proxy_size((320, 240), (640, 480)), (320, 240))
+
+    def test_background_build(self):
+        proxy = ProxyTrack(self.frames, self.video_path, (1280, 720), (640, 480), result_cache=self.result_cache,
+                           video_hash='video').start()
+        self.assertTrue(proxy.wait(10))
+        self.assertEqual(proxy.built, 6)
+        self.assertEqual(proxy.stored_frames(), set(range(6)))
+        self.assertEqual(proxy.frame_size, (1280, 720))
+        self.assertEqual(proxy.scale_to_proxy(), (0.5, 0.5))
+
+        frame = proxy[3]
+        self.assertEqual(frame.shape, (360, 640, 3))
+        self.assertAlmostEqual(frame.mean(), 120, delta=3)
+
+    def test_frames_made_on_request_before_build(self):
+        proxy = ProxyTrack(self.frames, self.video_path, (1280, 720), (640, 480), quality=None)
+        self.assertFalse(proxy.is_built(4))
+        frame = proxy[4]
+        self.assertTrue(proxy.is_built(4))
+        self.assertAlmostEqual(frame.mean(), 160, delta=3)
+
+        # Drawing on a returned frame leaves the stored proxy alone
+        frame[:] = 0
+        self.assertGreater(proxy[4].mean(), 0)
+
+    def test_proxies_reused_when_reopened(self):
+        ProxyTrack(self.frames, self.video_path, (1280, 720), (640, 480), result_cache=self.result_cache,
+                   video_hash='video').start().wait(10)
+
+        reopened = ProxyTrack(self.frames, self.video_path, (1280, 720), (640, 480), result_cache=self.result_cache,
+                              video_hash='video')
+        reopened.frames = None  # every proxy is read back from the result cache
+        self.assertTrue(all(reopened.is_built(i) for i in range(6)))
+        self.assertAlmostEqual(reopened[5].mean(), 200, delta=3)
+        with patch('CrystalAnalysisSystem.proxy_track.cv2.VideoCapture') as MockVideoCapture:
+            self.assertTrue(reopened.start().wait(10))
+        MockVideoCapture.assert_not_called()
+        self.assertEqual(reopened.built, 6)
+
+    def test_memory_use_is_bounded(self):
+        proxy = ProxyTrack(self.frames, self.video_path, (1280, 720), (640, 480), cache_size=2)
+        for i in range(6):
+            proxy[i]
+        self.assertEqual(list(proxy.cache), [4, 5])
+        self.assertAlmostEqual(proxy[0].mean(), 0, delta=3)
+
+        # Without a result cache nothing is written to disk and the thread makes no more than memory holds
+        self.assertTrue(proxy.start().wait(10))
+        self.assertEqual(proxy.built, 2)
+        self.assertEqual(len(proxy.cache), 2)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['results.sqlite', 'test_video.avi'])
+        self.assertEqual(self.result_cache.cached_frames('video', 'proxy', proxy.params), set())
+
+    def test_stored_frames_are_not_decoded_again(self):
+        store = FrameStore(self.video_path, os.path.join(self.temp_dir, 'store'))
+        store.build()
+        store.open()
+        proxy = ProxyTrack(store, self.video_path, (1280, 720), (640, 480), result_cache=self.result_cache,
+                           video_hash=store.video_hash)
+        with patch('CrystalAnalysisSystem.proxy_track.cv2.VideoCapture') as MockVideoCapture:
+            self.assertTrue(proxy.start().wait(10))
+        MockVideoCapture.assert_not_called()
+        self.assertEqual(proxy.built, 6)
+        self.assertAlmostEqual(proxy[2].mean(), 80, delta=3)
+        store.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
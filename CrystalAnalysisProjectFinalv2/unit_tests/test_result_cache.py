@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from CrystalAnalysisSystem.result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'results.sqlite')
+        self.cache = ResultCache(self.path)
+        self.params = {'threshold': 100, 'kernel': (5, 5)}
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_round_trip(self):
+        lines = np.arange(8, dtype=np.int32).reshape(2, 4)
+        self.assertIsNone(self.cache.get('video', 3, 'line_geometry', self.params))
+        self.cache.put('video', 3, 'line_geometry', self.params, lines)
+        np.testing.assert_array_equal(self.cache.get('video', 3, 'line_geometry', self.params), lines)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_includes_every_component(self):
+        self.cache.put('video', 3, 'shape', self.params, (10, 20, 0.5))
+        self.assertIsNone(self.cache.get('other video', 3, 'shape', self.params))
+        self.assertIsNone(self.cache.get('video', 4, 'shape', self.params))
+        self.assertIsNone(self.cache.get('video', 3, 'yolo', self.params))
+        self.assertIsNone(self.cache.get('video', 3, 'shape', {'threshold': 50, 'kernel': (5, 5)}))
+        self.assertEqual(self.cache.get('video', 3, 'shape', dict(reversed(list(self.params.items())))),
+                         (10, 20, 0.5))
+
+    def test_entries_persist_across_instances(self):
+        self.cache.put('video', 0, 'yolo', self.params, [[1.0, 2.0, 3.0, 4.0, 0.9, 0.0]])
+        reopened = ResultCache(self.path)
+        self.assertEqual(reopened.get('video', 0, 'yolo', self.params), [[1.0, 2.0, 3.0, 4.0, 0.9, 0.0]])
+        self.assertEqual(reopened.total_bytes, self.cache.total_bytes)
+        reopened.close()
+
+    def test_whole_video_in_one_file(self):
+        self.cache.put_many('video', 'line_geometry', self.params,
+                            [(i, np.full((2, 4), i, dtype=np.int32)) for i in range(500)])
+        cached = self.cache.get_many('video', 'line_geometry', self.params, [499, 3, 1000])
+        self.assertEqual(sorted(cached), [3, 499])
+        np.testing.assert_array_equal(cached[3], np.full((2, 4), 3))
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+        self.assertEqual(os.listdir(self.cache_dir), ['results.sqlite'])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        result = np.random.default_rng(0).integers(0, 256, 100000, dtype=np.uint8)
+        empty_bytes = self.cache.total_bytes
+        self.cache.max_bytes = empty_bytes + 250000
+        self.cache.put('video', 0, 'stage', self.params, result)
+        self.cache.put('video', 1, 'stage', self.params, result)
+        self.cache.get('video', 0, 'stage', self.params)  # frame 0 is now the most recently used
+
+        self.cache.put('video', 2, 'stage', self.params, result)
+        self.assertIsNotNone(self.cache.get('video', 0, 'stage', self.params))
+        self.assertIsNone(self.cache.get('video', 1, 'stage', self.params))
+        self.assertIsNotNone(self.cache.get('video', 2, 'stage', self.params))
+        # The quota holds for the blocks the file takes on disk, freed pages are returned
+        self.assertLessEqual(self.cache.total_bytes, self.cache.max_bytes)
+        self.assertGreater(self.cache.total_bytes, empty_bytes + 200000)
+
+    def test_clear(self):
+        self.cache.put('video', 0, 'stage', self.params, np.zeros(100000, dtype=np.uint8))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('video', 0, 'stage', self.params))
+        self.assertLess(self.cache.total_bytes, 100000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import cv2
 import numpy as np
 
 from CrystalAnalysisSystem.shape_analyser import ShapeAnalyser
@@ -19,5 +20,44 @@ class TestShapeAnalyser(unittest.TestCase):
         self.assertIsNotNone(height)
         self.assertIsNotNone(angle)
 
+    def test_measure_only_matches_stage_capture(self):
+        image = np.full((300, 400, 3), 30, dtype=np.uint8)
+        cv2.rectangle(image, (100, 100), (300, 200), (200, 200, 200), -1)
+
+        inspected = ShapeAnalyser(image)
+        measured = ShapeAnalyser(image, capture_stages=False)
+        measurement = measured.process_image()
+        self.assertIsNotNone(measurement[0])
+        self.assertEqual(measurement, inspected.process_image())
+        self.assertEqual(len(inspected.stages), 9)
+        self.assertEqual(measured.stages, [])
+
+    def test_stages_do_not_accumulate(self):
+        self.shape_analyser.process_image()
+        stage_count = len(self.shape_analyser.stages)
+        self.shape_analyser.process_image()
+        self.assertEqual(len(self.shape_analyser.stages), stage_count)
+
+    def test_find_furthest_points_matches_pairwise_search(self):
+        rng = np.random.default_rng(0)
+        for span in (3, 10, 800):  # small spans give many equally distant pairs
+            for _ in range(50):
+                points = rng.integers(0, span, (int(rng.integers(2, 60)), 2)).astype(np.int32)
+                expected, max_distance = ((0, 0), (0, 0)), 0
+                for i in range(len(points)):
+                    for j in range(i + 1, len(points)):
+                        dist = np.linalg.norm(points[i] - points[j])
+                        if dist > max_distance:
+                            max_distance = dist
+                            expected = (tuple(points[i].tolist()), tuple(points[j].tolist()))
+                self.assertEqual(self.shape_analyser.find_furthest_points(points), expected)
+
+    def test_rotate_points_matches_rotate_point(self):
+        x_coords = np.array([0, 15, 320, 799], dtype=np.int32)
+        y_coords = np.array([5, 0, 240, 599], dtype=np.int32)
+        rotated_x, rotated_y = self.shape_analyser.rotate_points(x_coords, y_coords, -37.5, (400.0, 300.0))
+        expected = [self.shape_analyser.rotate_point((x, y), -37.5, (400.0, 300.0)) for x, y in zip(x_coords, y_coords)]
+        self.assertEqual(list(zip(rotated_x.tolist(), rotated_y.tolist())), expected)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import unittest
+import cv2
+import numpy as np
+
+from CrystalAnalysisSystem.tracker import BoxTracker, KeyframeTracker, motion_score, to_gray
+
+
+def make_frame(x, y, width, height):
+    """
+    A textured bright rectangle on a noisy background, for the tracker to follow.
+    """
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 60, (240, 320, 3)).astype(np.uint8)
+    cv2.rectangle(frame, (int(x), int(y)), (int(x + width), int(y + height)), (200, 190, 180), -1)
+    cv2.line(frame, (int(x + width / 4), int(y + height / 2)), (int(x + 3 * width / 4), int(y + height / 2)),
+             (120, 120, 120), 2)
+    return frame
+
+
+def iou(a, b):
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    return intersection / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection)
+
+
+class TestTracker(unittest.TestCase):
+
+    def setUp(self):
+        # A crystal drifting right and growing over 12 frames
+        self.boxes = [(60 + 2 * i, 80 + i, 60 + i, 40 + i) for i in range(12)]
+        self.frames = [make_frame(*box) for box in self.boxes]
+        self.detected = []
+
+    def detect(self, frames, indices):
+        self.detected.extend(indices)
+        detections = []
+        for frame in frames:
+            _, mask = cv2.threshold(to_gray(frame), 100, 255, cv2.THRESH_BINARY)
+            x, y, width, height = cv2.boundingRect(mask)
+            detections.append([[float(x), float(y), float(x + width), float(y + height), 0.8, 0.0]])
+        return detections
+
+    def test_box_tracker_follows_motion(self):
+        tracker = BoxTracker()
+        reference = self.detect(self.frames, range(len(self.frames)))
+        tracker.start(to_gray(self.frames[0]), reference[0])
+        for frame, expected in zip(self.frames[1:], reference[1:]):
+            tracked = tracker.track(to_gray(frame))
+            self.assertEqual(tracked[0][4:], [0.8, 0.0])
+            self.assertGreater(iou(tracked[0], expected[0]), 0.8)
+
+    def test_keyframes_every_interval(self):
+        keyframe_tracker = KeyframeTracker(self.detect, keyframe_interval=5, motion_threshold=255)
+        detections = keyframe_tracker.detect(self.frames[:6], list(range(6)))
+        detections += keyframe_tracker.detect(self.frames[6:], list(range(6, 12)))
+        self.assertEqual(self.detected, [0, 5, 10])
+        self.assertEqual(keyframe_tracker.keyframes, 3)
+        self.assertEqual(keyframe_tracker.propagated, set(range(12)) - {0, 5, 10})
+        self.assertEqual(len(detections), 12)
+        self.assertTrue(all(len(frame_detections) == 1 for frame_detections in detections))
+
+    def test_motion_triggers_keyframe(self):
+        frames = self.frames[:3] + [np.zeros_like(self.frames[0])] + self.frames[4:6]
+        keyframe_tracker = KeyframeTracker(self.detect, keyframe_interval=10, motion_threshold=10.0)
+        keyframe_tracker.detect(frames, list(range(6)))
+        self.assertEqual(self.detected, [0, 3, 4])
+        self.assertGreater(motion_score(to_gray(frames[0]), to_gray(frames[3])), 10.0)
+        self.assertLess(motion_score(to_gray(frames[0]), to_gray(frames[1])), 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
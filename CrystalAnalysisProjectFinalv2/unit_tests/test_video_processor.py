@@ -1,11 +1,29 @@
+import os
+import tempfile
+import threading
+import time
 import unittest
 import numpy as np
 import cv2
 from unittest.mock import MagicMock, patch
 
+from CrystalAnalysisSystem.detection_store import DetectionStore
+from CrystalAnalysisSystem.frame_store import FrameStore
+from CrystalAnalysisSystem.parallel import ParallelFrameProcessor
+from CrystalAnalysisSystem.utils import frame_pipeline, hash_file
 from CrystalAnalysisSystem.video_processor import VideoProcessor
 
 
+def write_test_video(path):
+    """
+    Write a short video where every frame has a distinct brightness.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 8, (1280, 720))
+    for i in range(6):
+        writer.write(np.full((720, 1280, 3), i * 40, dtype=np.uint8))
+    writer.release()
+
+
 class TestVideoProcessor(unittest.TestCase):
 
     def setUp(self):
@@ -14,6 +32,30 @@ class TestVideoProcessor(unittest.TestCase):
             self.mock_detector = MockDetector.return_value
             self.video_processor = VideoProcessor(MagicMock(), MagicMock(), MagicMock())
             self.sample_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.video_processor.cache_dir = self.cache_dir.name
+
+    def tearDown(self):
+        for store in (self.video_processor.result_cache, self.video_processor.detection_store):
+            if store is not None:
+                store.close()
+        self.cache_dir.cleanup()
+
+    def test_caches_opened_on_first_use(self):
+        cwd = os.getcwd()
+        os.chdir(self.cache_dir.name)
+        try:
+            video_processor = VideoProcessor(MagicMock(), MagicMock(), MagicMock())
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(os.listdir(self.cache_dir.name), [])  # nothing is written to the working directory
+
+        cache_dir = os.path.join(self.cache_dir.name, 'cache')
+        video_processor.cache_dir = cache_dir
+        self.assertIs(video_processor.get_result_cache(), video_processor.get_result_cache())
+        video_processor.get_detection_store().close()
+        video_processor.result_cache.close()
+        self.assertEqual(sorted(os.listdir(cache_dir)), ['detections.sqlite', 'results.sqlite'])
 
     @patch('CrystalAnalysisSystem.video_processor.filedialog.askopenfilename', return_value='test_video.mp4')
     def test_upload_video(self, mock_filedialog):
@@ -25,6 +67,17 @@ class TestVideoProcessor(unittest.TestCase):
         self.video_processor.upload_video()
         self.assertEqual(self.video_processor.video_path, 'test_video.mp4')
 
+    @patch('CrystalAnalysisSystem.video_processor.messagebox.showerror')
+    @patch('CrystalAnalysisSystem.video_processor.filedialog.askopenfilename', return_value='other_video.mp4')
+    def test_upload_video_while_busy_keeps_open_video(self, mock_filedialog, mock_showerror):
+        self.video_processor.video_path = 'test_video.mp4'
+        self.video_processor.job = MagicMock(done=False)
+        self.video_processor.job.name = "Detecting crystals"
+        self.video_processor.upload_video()
+        mock_filedialog.assert_not_called()
+        mock_showerror.assert_called_once_with("Busy", "Detecting crystals is still running")
+        self.assertEqual(self.video_processor.video_path, 'test_video.mp4')
+
     def test_convert_to_frames(self):
         # Mocking cv2.VideoCapture and its read method
         with patch('cv2.VideoCapture') as MockVideoCapture:
@@ -44,13 +97,200 @@ class TestVideoProcessor(unittest.TestCase):
     def test_apply_hough_transform(self):
         self.video_processor.frames = [self.sample_frame]
         self.video_processor.apply_hough_to_frames()
+        self.assertTrue(self.video_processor.jobs.drain(10))
         self.assertEqual(len(self.video_processor.hough_frames), 1)
 
     def test_apply_contouring(self):
         self.video_processor.frames = [self.sample_frame]
         self.video_processor.apply_contour_to_frames()
+        self.assertTrue(self.video_processor.jobs.drain(10))
         self.assertEqual(len(self.video_processor.contour_frames), 1)
 
+    def test_parallel_processing_reads_stored_frames_without_copying(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            video_path = os.path.join(temp_dir, 'test_video.avi')
+            writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 8, (64, 48))
+            for i in range(6):
+                frame = np.zeros((48, 64, 3), dtype=np.uint8)
+                cv2.rectangle(frame, (5 + i, 5), (40 + i, 30), (255, 255, 255), 2)
+                writer.write(frame)
+            writer.release()
+            store = FrameStore(video_path, os.path.join(temp_dir, 'store'))
+            store.build()
+            self.video_processor.frames = store.open()
+            self.video_processor.workers = 2
+
+            # Frames missing from the result cache are passed on as a FrameSubset of the store
+            outputs = ['line_geometry', 'contour_geometry']
+            with patch.object(ParallelFrameProcessor, 'fill_segment', side_effect=AssertionError("frames copied")):
+                results = self.video_processor.process_frames(MagicMock(), [4, 1, 3], outputs)
+            self.video_processor.parallel_processor.shutdown()
+
+            for i, result in zip([4, 1, 3], results):
+                run = frame_pipeline.process(store[i])
+                np.testing.assert_array_equal(result[0], run['line_geometry'])
+                np.testing.assert_array_equal(result[1][0], run['contour_geometry'][0])
+
+    @patch('CrystalAnalysisSystem.video_processor.messagebox.showinfo')
+    def test_open_video_with_proxy_frames(self, mock_showinfo):
+        video_path = os.path.join(self.cache_dir.name, 'test_video.avi')
+        write_test_video(video_path)
+        self.video_processor.video_path = video_path
+        self.video_processor.store_dir = os.path.join(self.cache_dir.name, 'store')
+
+        # Proxies of decoded videos are only kept in memory
+        self.video_processor.convert_to_frames()
+        self.assertTrue(self.video_processor.jobs.drain(10))
+        proxy = self.video_processor.proxy
+        self.assertEqual(proxy.frame_size, (1280, 720))
+        self.assertEqual(self.video_processor.video_hash, hash_file(video_path))
+        self.assertIsNone(proxy.result_cache)
+        frame, frame_size = self.video_processor.frame_display.update_canvas.call_args.args
+        self.assertEqual((frame.shape, frame_size), ((360, 640, 3), (1280, 720)))
+
+        # Those of stored videos are kept in the result cache
+        self.video_processor.use_frame_store = True
+        self.video_processor.convert_to_frames()
+        self.assertTrue(self.video_processor.jobs.drain(10))
+        proxy = self.video_processor.proxy
+        self.assertIs(proxy.result_cache, self.video_processor.result_cache)
+        self.assertTrue(proxy.wait(10))
+        self.assertEqual(proxy.stored_frames(), set(range(6)))
+        self.assertIsNone(self.video_processor.prefetcher)
+        self.video_processor.frames.release()
+
+    @patch('CrystalAnalysisSystem.video_processor.messagebox.showinfo')
+    def test_proxies_not_made_yet_read_through_prefetcher(self, mock_showinfo):
+        self.video_processor.video_path = os.path.join(self.cache_dir.name, 'test_video.avi')
+        write_test_video(self.video_processor.video_path)
+        self.video_processor.convert_to_frames()
+        self.assertTrue(self.video_processor.jobs.drain(10))
+        proxy, prefetcher = self.video_processor.proxy, self.video_processor.prefetcher
+        self.assertIs(proxy.frames, prefetcher)
+
+        # Forget the proxies made so far, the next frames shown are made from prefetched frames
+        proxy.stop()
+        proxy.cache.clear()
+        prefetcher.reset_stats()
+        self.assertAlmostEqual(self.video_processor.get_frame(2, self.video_processor.frames).mean(), 80, delta=3)
+        deadline = time.time() + 5
+        while not self.video_processor.frames.is_cached(3) and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertAlmostEqual(self.video_processor.get_frame(3, self.video_processor.frames).mean(), 120, delta=3)
+        # Both were read through the prefetcher, which had decoded frame 3 ahead of it being shown
+        self.assertEqual(prefetcher.hits + prefetcher.misses, 2)
+        self.assertGreaterEqual(prefetcher.hits, 1)
+        self.assertEqual(prefetcher.current_index, 3)
+        prefetcher.stop()
+        self.video_processor.frames.release()
+
+    def test_detector_loaded_on_first_use(self):
+        self.assertIsNone(self.video_processor.detector)
+        with patch('CrystalAnalysisSystem.video_processor.CrystalDetector') as MockDetector:
+            detector = self.video_processor.get_detector()
+            self.assertIs(self.video_processor.get_detector(), detector)
+            MockDetector.assert_called_once_with(model_path='models/best.pt', backend='torch', int8=False)
+
+    def test_warm_up_error_shown_in_status_bar(self):
+        with patch('CrystalAnalysisSystem.video_processor.CrystalDetector', side_effect=OSError("no model")):
+            self.video_processor.warm_up()
+            deadline = time.time() + 5
+            while not self.video_processor.frame_display.after.called and time.time() < deadline:
+                time.sleep(0.01)
+        self.video_processor.frame_display.after.assert_called_once_with(
+            0, self.video_processor.status_var.set, "Detection model could not be loaded: no model")
+        self.assertIsNone(self.video_processor.detector)
+
+    def test_set_detector_backend_reloads_detector(self):
+        self.video_processor.detector = self.mock_detector
+        self.video_processor.set_detector_backend('onnx', int8=True)
+        self.assertIsNone(self.video_processor.detector)
+        with patch('CrystalAnalysisSystem.video_processor.CrystalDetector') as MockDetector:
+            self.video_processor.get_detector()
+            MockDetector.assert_called_once_with(model_path='models/best.pt', backend='onnx', int8=True)
+
+    def test_get_detections_only_detects_unstored_frames(self):
+        frames = [self.sample_frame] * 3
+        params = {'model': 'hash', 'conf': 0.25}
+        self.video_processor.detector = self.mock_detector
+        self.video_processor.detection_store = DetectionStore(':memory:')
+        self.video_processor.detection_store.put('video', params, [(0, [[1.0, 2.0, 3.0, 4.0, 0.9, 0.0]])])
+        self.mock_detector.detect_batch.return_value = [[], [[5.0, 6.0, 7.0, 8.0, 0.8, 0.0]]]
+
+        detections = self.video_processor.get_detections(frames, range(0, 3), 'video', params)
+        self.assertEqual(detections, [[[1.0, 2.0, 3.0, 4.0, 0.9, 0.0]], [], [[5.0, 6.0, 7.0, 8.0, 0.8, 0.0]]])
+        self.assertEqual(len(self.mock_detector.detect_batch.call_args.args[0]), 2)
+        self.assertEqual(self.video_processor.detection_store.count('video', params, 0, 2), 3)
+
+    def test_detect_crystals_in_range(self):
+        self.video_processor.frames = [self.sample_frame.copy() for _ in range(10)]
+        self.video_processor.detector = self.mock_detector
+        self.video_processor.calculator = MagicMock()
+        self.mock_detector.batch_size = 4
+        self.mock_detector.class_names = {0: 'crystal'}
+        self.mock_detector.detect_batch.side_effect = lambda frames, batch_size, roi, imgsz: [
+            [[10.0, 10.0, 50.0, 40.0, 0.9, 0.0]] for _ in frames]
+
+        self.video_processor.detect_crystals_in_range(2, 8)
+        self.assertTrue(self.video_processor.jobs.drain(10))
+        crystal_data = self.video_processor.calculator.calculate_growth_rate.call_args.args[0]
+        self.assertEqual([record['frame'] for record in crystal_data], list(range(2, 9)))
+        self.assertTrue(self.video_processor.frame_display.update_canvas.called)
+        # Detections are kept per frame and drawn over the display, never into the source frames
+        self.assertEqual(sorted(self.video_processor.detections), list(range(2, 9)))
+        detections, tracked = self.video_processor.detections[5]
+        np.testing.assert_allclose(detections, [[10.0, 10.0, 50.0, 40.0, 0.9, 0.0]], rtol=1e-6)
+        self.assertFalse(tracked)
+        self.assertTrue(self.video_processor.frame_display.draw_detections.called)
+        self.assertFalse(any(frame.any() for frame in self.video_processor.frames))
+
+    def test_detect_crystals_in_roi(self):
+        self.video_processor.frames = [self.sample_frame] * 4
+        self.video_processor.detector = self.mock_detector
+        self.video_processor.calculator = MagicMock()
+        self.mock_detector.batch_size = 4
+        self.mock_detector.class_names = {0: 'crystal'}
+        self.mock_detector.detect_batch.return_value = [[] for _ in range(4)]
+
+        self.video_processor.detect_crystals_in_range(0, 3, roi=(600, 400, 700, 500), imgsz=320)
+        self.assertTrue(self.video_processor.jobs.drain(10))
+        self.assertEqual(self.mock_detector.detect_batch.call_args.args[2:], ((600, 400, 640, 480), 320))
+
+    @patch('CrystalAnalysisSystem.video_processor.messagebox.showerror')
+    def test_detect_crystals_in_roi_outside_frame(self, mock_showerror):
+        self.video_processor.frames = [self.sample_frame] * 4
+        self.video_processor.detector = self.mock_detector
+        self.video_processor.detect_crystals_in_range(0, 3, roi=(700, 0, 800, 100))
+        mock_showerror.assert_called_once()
+        self.mock_detector.detect_batch.assert_not_called()
+
+    @patch('CrystalAnalysisSystem.video_processor.messagebox.showerror')
+    def test_cancel_detection(self, mock_showerror):
+        self.video_processor.frames = [self.sample_frame] * 200
+        self.video_processor.detector = self.mock_detector
+        self.video_processor.calculator = MagicMock()
+        self.mock_detector.batch_size = 1
+        self.mock_detector.class_names = {0: 'crystal'}
+        started = threading.Event()
+
+        def detect_batch(frames, batch_size, roi, imgsz):
+            started.set()
+            time.sleep(0.01)
+            return [[] for _ in frames]
+
+        self.mock_detector.detect_batch.side_effect = detect_batch
+        self.video_processor.detect_crystals_in_range(0, 199)
+        started.wait(5)
+        # Only one long operation runs at a time
+        self.video_processor.apply_hough_to_frames()
+        mock_showerror.assert_called_once()
+
+        self.video_processor.cancel_job()
+        self.assertTrue(self.video_processor.jobs.drain(10))
+        self.assertLess(self.mock_detector.detect_batch.call_count, 200)
+        self.video_processor.calculator.calculate_growth_rate.assert_not_called()
+        self.assertEqual(self.video_processor.hough_frames, [])
+
 
 if __name__ == '__main__':
     unittest.main()